@@ -2,6 +2,7 @@ import os
 
 import tkinter as tk
 from tkinter import filedialog
+from tkinter import ttk
 from tkinter.scrolledtext import ScrolledText
 import tkinter.font as tkFont
 from functools import partial
@@ -9,6 +10,9 @@ from functools import partial
 from mc_helper import batch_gen_CPS_sheet, batch_extract_OSTs, get_OSTs_single, get_OSTs
 from vtt_handler import batch_merge_subs
 from checks import batch_quality_check
+from cache import CACHE_NAME
+from reports import CallbackReportSink
+from jobs import JobRunner
 
 def browse_single_file():
     browsed_file = filedialog.askopenfilename()
@@ -94,6 +98,58 @@ class App:
             return self.canvas.create_polygon(points, **kwargs, smooth=True)
 
 
+        def start_job(name, function, results, on_output=None, on_done=None):
+            # Runs function(runner) in the background (see JobRunner),
+            # with its progress in the job bar,
+            # so the window keeps responding until it finishes.
+            # on_done(result, cancelled) runs in the GUI thread at the end.
+            def progress(done, total):
+                self.job_progress.configure(maximum=max(total, 1), value=done)
+                self.job_status.configure(text=f'{name}: {done}/{total} files')
+
+            def done(result, cancelled):
+                if cancelled:
+                    finish_job(f'{name}: cancelled')
+                else:
+                    finish_job(f'{name}: finished')
+
+                if on_done is not None:
+                    on_done(result, cancelled)
+
+            def error(error):
+                finish_job(f'{name}: failed')
+                results.configure(state='normal')
+                results.insert(tk.END, f'\n{name} failed: {error!r}\n')
+                results.configure(state='disabled')
+
+            started = self.job_runner.start(
+                function,
+                on_progress=progress,
+                on_output=on_output,
+                on_done=done,
+                on_error=error
+            )
+
+            if not started:
+                results.configure(state='normal')
+                results.delete('1.0', tk.END)
+                results.insert('1.0', 'Please wait for the current job to finish or cancel it.')
+                results.configure(state='disabled')
+                return
+
+            self.job_progress.configure(value=0)
+            self.job_status.configure(text=f'{name}...')
+            self.job_cancel_button.configure(state='normal')
+
+        def finish_job(status):
+            self.job_status.configure(text=status)
+            self.job_cancel_button.configure(state='disabled')
+
+        def cancel_job():
+            self.job_runner.cancel()
+            self.job_status.configure(text='Cancelling...')
+
+
         def save_OSTs_ext_check():
             if not self.var_save_OSTs.get():
                 self.OST_ext_save_to_entry.configure(state='disabled')
@@ -158,31 +214,50 @@ class App:
             #                and not self.var_save_OSTs.get()))):
 
             elif self.var_save_OSTs.get() or self.var_del_OSTs.get():
-                total_errors = batch_extract_OSTs(
-                    self.ext_OST_lang_path,
-                    self.ext_OST_save_dir,
-                    save_OSTs=self.var_save_OSTs.get(),
-                    delete_OSTs=self.var_del_OSTs.get()
-                )
+                lang_path = self.ext_OST_lang_path
+                save_dir = self.ext_OST_save_dir
+                save_OSTs = self.var_save_OSTs.get()
+                delete_OSTs = self.var_del_OSTs.get()
+
+                def job(runner):
+                    return batch_extract_OSTs(
+                        lang_path,
+                        save_dir,
+                        save_OSTs=save_OSTs,
+                        delete_OSTs=delete_OSTs,
+                        progress=runner.progress,
+                        cancel=runner.cancel_event
+                    )
+
+                start_job('Extract OSTs', job, self.OST_results,
+                          on_done=show_extracted_OSTs)
+
+        def show_extracted_OSTs(total_errors, cancelled):
+            if cancelled:
+                self.OST_results.configure(state='normal')
+                self.OST_results.delete('1.0', tk.END)
+                self.OST_results.insert('1.0', 'OST extraction cancelled')
+                self.OST_results.configure(state='disabled')
+                return
 
-                if total_errors:
-                    warnings, errors = total_errors
+            if total_errors:
+                warnings, errors = total_errors
 
-                    if warnings:
-                        warnings_string = ''
-                        for warning_key in warnings.keys():
-                            warnings_string += 'Warnings\n\n\n'
-                            warnings_string += warning_key + '\n\t'
-                            warnings_string += warnings[warning_key] + '\n'
+                if warnings:
+                    warnings_string = ''
+                    for warning_key in warnings.keys():
+                        warnings_string += 'Warnings\n\n\n'
+                        warnings_string += warning_key + '\n\t'
+                        warnings_string += warnings[warning_key] + '\n'
 
-                        self.OST_results.configure(state='normal')
-                        self.OST_results.delete('1.0', tk.END)
-                    
+                    self.OST_results.configure(state='normal')
+                    self.OST_results.delete('1.0', tk.END)
+                
 
-                self.OST_results.configure(state='normal')
-                self.OST_results.delete('1.0', tk.END)
-                self.OST_results.insert('1.0', 'OSTs extracted successfully')
-                self.OST_results.configure(state='disabled')
+            self.OST_results.configure(state='normal')
+            self.OST_results.delete('1.0', tk.END)
+            self.OST_results.insert('1.0', 'OSTs extracted successfully')
+            self.OST_results.configure(state='disabled')
 
         def browse_dir_sub_merge():
             browsed_dir = filedialog.askdirectory()
@@ -221,10 +296,7 @@ class App:
             if not self.save_merge_OST_dir:
                 self.OST_errors += 'Cannot merge files. Please provide a directory to save the resulting VTT.\n'
 
-            original_dir = os.getcwd()
-
-            os.chdir(self.merge_sub_dir)
-            sub_dir_list = os.listdir()
+            sub_dir_list = os.listdir(self.merge_sub_dir)
             sub_files_list = []
 
             for item in sub_dir_list:
@@ -232,8 +304,7 @@ class App:
                 if ext == '.vtt':
                     sub_files_list.append(item)
 
-            os.chdir(self.merge_OST_dir)
-            OST_dir_list = os.listdir()
+            OST_dir_list = os.listdir(self.merge_OST_dir)
             OST_files_list = []
 
             for item in OST_dir_list:
@@ -241,8 +312,6 @@ class App:
                 if ext == '.vtt':
                     OST_files_list.append(item)
 
-            os.chdir(original_dir)
-
             if len(sub_files_list) > len(OST_files_list):
                 self.OST_errors += 'Cannot merge files. The number of subtitle files is greater than the number of OST files.\n'
             elif len(OST_files_list) > len(sub_files_list):
@@ -256,10 +325,41 @@ class App:
                 self.OST_errors = ''
 
             else:
+                sub_dir = self.merge_sub_dir
+                OST_dir = self.merge_OST_dir
+
                 if self.var_overwrite_merged_files.get():
-                    batch_merge_subs(self.merge_sub_dir, self.merge_OST_dir, self.merge_sub_dir)
+                    save_dir = self.merge_sub_dir
                 else:
-                    batch_merge_subs(self.merge_sub_dir, self.merge_OST_dir, self.save_merge_OST_dir)
+                    save_dir = self.save_merge_OST_dir
+
+                def job(runner):
+                    return batch_merge_subs(sub_dir, OST_dir, save_dir,
+                                            progress=runner.progress,
+                                            cancel=runner.cancel_event)
+
+                start_job('Merge OSTs', job, self.OST_results,
+                          on_done=show_merged_OSTs)
+
+        def show_merged_OSTs(errors, cancelled):
+            # errors: message of every file that could not be merged,
+            # keyed by file name (see batch_merge_subs()).
+            if errors:
+                errors_string = 'Errors\n\n\n'
+                for file_name, error in errors.items():
+                    errors_string += file_name + '\n\t' + error + '\n'
+            elif cancelled:
+                errors_string = 'OST merging cancelled'
+            else:
+                errors_string = 'OSTs merged successfully'
+
+            if errors and cancelled:
+                errors_string += '\nOST merging cancelled'
+
+            self.OST_results.configure(state='normal')
+            self.OST_results.delete('1.0', tk.END)
+            self.OST_results.insert('1.0', errors_string)
+            self.OST_results.configure(state='disabled')
             
 
             
@@ -303,13 +403,24 @@ class App:
                 self.OST_errors = ''
 
             else:
+                OST_audit_files_list = self.OST_audit_files.split('\n')
+                save_dir = self.OST_gen_save_dir
+
                 if self.var_single_audit_file.get():
-                    OST_audit_files_list = self.OST_audit_files.split('\n')
-                    for file_name in OST_audit_files_list:
-                        get_OSTs_single(file_name, self.OST_gen_save_dir)
+                    def job(runner):
+                        for i, file_name in enumerate(OST_audit_files_list):
+                            if runner.cancel_event.is_set():
+                                break
+
+                            get_OSTs_single(file_name, save_dir)
+                            runner.progress(i + 1, len(OST_audit_files_list))
                 else:
-                    OST_audit_files_list = self.OST_audit_files.split('\n')
-                    get_OSTs(OST_audit_files_list, self.OST_gen_save_dir)
+                    def job(runner):
+                        get_OSTs(OST_audit_files_list, save_dir,
+                                 progress=runner.progress,
+                                 cancel=runner.cancel_event)
+
+                start_job('Generate OSTs', job, self.OST_results)
                     
                     
         def browse_QC_sub_dir():
@@ -413,10 +524,16 @@ class App:
                 
                 self.check_TCFOL_var.get()
 
-                report = batch_quality_check(
-                    self.QC_sub_dir,
-                    self.QC_video_dir,
-                    self.QC_SC_dir,
+                # The results are shown one file at a time,
+                # as soon as every file is checked.
+                self.QC_results.configure(state='normal')
+                self.QC_results.delete('1.0', tk.END)
+                self.QC_results.configure(state='disabled')
+
+                # NOTE: The settings are read here, in the GUI thread.
+                #       The job only runs the check.
+                dirs = (self.QC_sub_dir, self.QC_video_dir, self.QC_SC_dir)
+                settings = dict(
                     shot_changes=self.shot_changes_var.get(),
                     CPS=True,
                     CPS_limit=float(self.CPS_var.get()),
@@ -432,16 +549,37 @@ class App:
                     old=False,
                     check_TCFOL=bool(self.check_TCFOL_var.get()),
                     report=bool(self.save_report_var.get()),
-                    report_name=self.report_name
+                    report_name=self.report_name,
+                    # NOTE: An incremental check keeps its results in the
+                    #       cache, so it turns the cache on as well.
+                    cache_name=(CACHE_NAME
+                                if self.use_cache_var.get() or self.incremental_var.get()
+                                else ''),
+                    incremental=bool(self.incremental_var.get())
                 )
 
-                # print(report)
-                # print(self.save_report_var.get())
+                def job(runner):
+                    batch_quality_check(
+                        *dirs,
+                        **settings,
+                        sink=CallbackReportSink(runner.output),
+                        progress=runner.progress,
+                        cancel=runner.cancel_event
+                    )
 
-                self.QC_results.configure(state='normal')
-                self.QC_results.delete('1.0', tk.END)
-                self.QC_results.insert('1.0', '\n'.join(report))
-                self.QC_results.configure(state='disabled')
+                start_job('Quality check', job, self.QC_results,
+                          on_output=show_QC_results)
+
+        def show_QC_results(lines):
+            self.QC_results.configure(state='normal')
+
+            # Same text as '\n'.join() of all the lines of the report.
+            if self.QC_results.compare('end-1c', '!=', '1.0'):
+                self.QC_results.insert(tk.END, '\n')
+
+            self.QC_results.insert(tk.END, '\n'.join(lines))
+            self.QC_results.configure(state='disabled')
+            self.QC_results.see(tk.END)
 
 
 
@@ -513,29 +651,40 @@ class App:
                 self.issues_results.configure(state='normal')
                 self.issues_results.delete('1.0', tk.END)
                 self.issues_results.configure(state='disabled')
-                en_path = self.en_files.split('\n')[0].split('/')
-                en_path = '\\'.join(en_path[:-1])
-                tar_path = self.tar_files.split('\n')[0].split('/')
-                tar_path = '\\'.join(tar_path[:-1])
 
                 en_files_list.sort()
                 tar_files_list.sort()                
                 
-                result = batch_gen_CPS_sheet(en_files_list, tar_files_list, self.save_to, old=False)
-                
-                if type(result) == str:
-                    self.issues_results.configure(state='normal')
-                    self.issues_results.delete('1.0', tk.END)
-                    self.issues_results.insert('1.0', result)
-                    self.issues_results.configure(state='disabled')
-                    self.issues_errors = ''
-                    return
-
-                else:
-                    self.issues_results.configure(state='normal')
-                    self.issues_results.delete('1.0', tk.END)
-                    self.issues_results.insert('1.0', f'Issue spreadsheet generated successfully.\n{self.save_to}')
-                    self.issues_results.configure(state='disabled')
+                save_to = self.save_to
+
+                def job(runner):
+                    return batch_gen_CPS_sheet(
+                        en_files_list, tar_files_list, save_to, old=False,
+                        progress=runner.progress, cancel=runner.cancel_event)
+
+                def done(result, cancelled):
+                    if type(result) == str:
+                        self.issues_results.configure(state='normal')
+                        self.issues_results.delete('1.0', tk.END)
+                        self.issues_results.insert('1.0', result)
+                        self.issues_results.configure(state='disabled')
+                        self.issues_errors = ''
+                        return
+
+                    elif cancelled:
+                        self.issues_results.configure(state='normal')
+                        self.issues_results.delete('1.0', tk.END)
+                        self.issues_results.insert('1.0', f'Issue spreadsheet cancelled. Only some files were added.\n{save_to}')
+                        self.issues_results.configure(state='disabled')
+
+                    else:
+                        self.issues_results.configure(state='normal')
+                        self.issues_results.delete('1.0', tk.END)
+                        self.issues_results.insert('1.0', f'Issue spreadsheet generated successfully.\n{save_to}')
+                        self.issues_results.configure(state='disabled')
+
+                start_job('Issue spreadsheet', job, self.issues_results,
+                          on_done=done)
         
         self.first = True
         self.active_option = 0
@@ -669,6 +818,13 @@ class App:
         self.save_report_entry = tk.Entry(self.canvas, width=60, borderwidth=2)
         self.save_report_browse = tk.Button(self.canvas, text='Browse', height=1, width=15, command=browse_report_save)
 
+        # NOTE: Off by default. When checked, the video hashes, frame rates
+        #       and shot changes are kept in a file in the home folder.
+        self.use_cache_var = tk.IntVar()
+        self.use_cache_check = tk.Checkbutton(self.canvas, text='Cache video data between checks', variable=self.use_cache_var, bg='white')
+        self.incremental_var = tk.IntVar()
+        self.incremental_check = tk.Checkbutton(self.canvas, text='Only check changed cues', variable=self.incremental_var, bg='white')
+
         
 
 
@@ -709,6 +865,13 @@ class App:
 
         self.issues_results_label = tk.Label(self.canvas, text='Results', bg='white', padx=30, font=self.results_font)
         self.issues_results = ScrolledText(self.canvas, bg='white', fg='black')
+
+        # Job bar, with the progress of the job running in the background.
+        self.job_runner = JobRunner(self.root)
+        self.job_frame = tk.Frame(self.root, bg='#606060')
+        self.job_status = tk.Label(self.job_frame, text='', width=40, anchor='w', bg='#606060', fg='white')
+        self.job_progress = ttk.Progressbar(self.job_frame, orient='horizontal', mode='determinate')
+        self.job_cancel_button = tk.Button(self.job_frame, text='Cancel', height=1, width=15, state='disabled', command=cancel_job)
         # results.grid(column=0, columnspan=3, row=18, pady=25, padx=25, sticky='nsew')
         # results.insert('1.0', 'Test\nTest\nTest\nTest\nTest\nTest\nTest\nTest\nTest\nTest\nTest\nTest\nTest\nTest\nTest\nTest\nTest\nTest\nTest\nTest\nTest\nTest\nTest\nTest\nTest\nTest\nTest\nTest\n')
         # results.configure(state='disabled')
@@ -897,6 +1060,8 @@ class App:
                 self.save_report_check.grid_forget()
                 self.save_report_entry.grid_forget()
                 self.save_report_browse.grid_forget()
+                self.use_cache_check.grid_forget()
+                self.incremental_check.grid_forget()
 
                 self.canvas.delete(self.QC_line_1)
                 self.canvas.delete(self.QC_line_2)
@@ -1117,6 +1282,8 @@ class App:
                 self.save_report_check.grid(column=3, row=9, sticky='w', padx=(45, 0), pady=(25, 0))
                 self.save_report_entry.grid(column=3, row=10, sticky='w', padx=(45, 0))
                 self.save_report_browse.grid(column=4, row=10, sticky='w', padx=(25, 0))
+                self.use_cache_check.grid(column=3, row=11, sticky='w', padx=(45, 0))
+                self.incremental_check.grid(column=3, row=12, sticky='w', padx=(45, 0))
 
 
                 self.run_QC_button.grid(column=4, row=15)
@@ -1268,6 +1435,8 @@ class App:
                 self.save_report_check.grid_forget()
                 self.save_report_entry.grid_forget()
                 self.save_report_browse.grid_forget()
+                self.use_cache_check.grid_forget()
+                self.incremental_check.grid_forget()
 
                 self.canvas.delete(self.QC_line_1)
                 self.canvas.delete(self.QC_line_2)
@@ -1316,6 +1485,12 @@ class App:
         self.issues_button.bind('<Leave>', issues_leave)
         self.issues_button.bind('<Button-1>', issues_click)
 
+        self.job_frame.grid(column=0, columnspan=8, row=9, sticky='we')
+        self.job_frame.grid_columnconfigure(1, weight=1)
+        self.job_status.grid(column=0, row=0, padx=(15, 0), pady=5)
+        self.job_progress.grid(column=1, row=0, padx=15, pady=5, sticky='we')
+        self.job_cancel_button.grid(column=2, row=0, padx=(0, 15), pady=5)
+
         populate_OST()
 
 
@@ -1324,4 +1499,5 @@ class App:
 
 
 
-App().run()
\ No newline at end of file
+if __name__ == '__main__':
+    App().run()
@@ -0,0 +1,1393 @@
+import copy, heapq, html, os, random, re, struct, sys, tempfile, timeit, tracemalloc
+
+from checks import check_subs, check_gaps_one
+from classes import (Timecode, CueTable, OSTKind, StartTag, EndTag,
+                     TimestampTag)
+import decoders
+from decoders import parse_VTT, iter_VTT, consume_HTML_char_ref
+from reader import hash_file, batch_hash_files
+from cache import ParseCache
+from vtt_handler import sort_VTT, CUE_START_KEY
+from mc_helper import (extract_OSTs, OST_CANDIDATE_PATTERN,
+                       OST_BRACKETS_PATTERN)
+
+
+# Attributes compared when checking that two ways of building
+# a Timecode produce the same instance.
+TIMECODE_ATTRIBUTES = [
+    'time', 'frame_rate', 'time_in_frames', 'drop_frame', 'frame_division',
+    'creation_format', 'hours', 'minutes', 'seconds', 'fraction', 'frames',
+    'total_seconds', 'millis', 'total_counted_frames_s',
+    'total_rendered_frames_s', 'total_counted_frames_r',
+    'total_rendered_frames_r', 'total_frames'
+]
+
+# Cue texts for the synthetic files.
+SAMPLE_LINES = [
+    'Hello there.',
+    'I know what you did last summer.',
+    '<i>Whispering in the dark.</i>',
+    '- Yes.\n- No.',
+    'A very long line of subtitle text\nthat takes up two whole lines.',
+    'Why would you say that?',
+    '<i>Previously on...</i>',
+]
+
+# On-screen text, placed at the top of the screen.
+SAMPLE_OSTS = ['[SIGN]', '[NEWSPAPER HEADLINE]', '[TEXT MESSAGE]']
+
+# On-screen text with the mistakes that the OST checks look for.
+SAMPLE_MIXED_OSTS = SAMPLE_OSTS + [
+    '[Sign]', '[SIGN].', '[NEWSPAPER HEADLINE', 'TEXT MESSAGE]',
+    'TEXT MESSAGE', '[TEXT MESSAGE\nFROM MOM]',
+]
+
+# Untagged lines where the OST rules are easy to get wrong:
+# lone brackets, brackets on their own line and empty lines.
+OST_EDGE_TEXTS = [
+    [], [''], ['', ''], ['['], [']'], ['[]'], ['[', ']'], ['[]', ''],
+    ['', '[A]'], ['[A]', ''], ['[', 'A]'], ['A', ']'], ['[', 'A'],
+    ['[A'], ['A]'], ['A].'], ['[A].'], ['[A],.'], ['[a]'], ['AB'],
+    ['AB', 'CD'], ['[AB]'], ['[AB', 'CD]'], ['[AB]', 'CD'], ['AB]', '.'],
+    ['[ ]'], ['  '], ['[[AB]]'], ['É]'], ['[é]'],
+]
+
+# Entity-heavy cue texts, as in French and Spanish files.
+SAMPLE_ENTITY_LINES = [
+    '&iquest;Qu&eacute; pasa?&nbsp;&iexcl;Nada!',
+    'C&apos;est d&eacute;j&agrave; l&agrave;&nbsp;!',
+    'Tom &amp; Jerry &lt;3 &#233;t&#xE9;',
+    '&laquo;&nbsp;Bonjour&nbsp;&raquo;, dit-il&hellip;',
+    'Se&ntilde;or, &iquest;ma&ntilde;ana?&notin &ampx',
+]
+
+def print_VTT_time(millis):
+    """Media timecode (HH:MM:SS.mmm) for the benchmark inputs.
+    """
+
+    hours, millis = divmod(millis, 3600000)
+    minutes, millis = divmod(millis, 60000)
+    seconds, millis = divmod(millis, 1000)
+
+    return f'{hours:02}:{minutes:02}:{seconds:02}.{millis:03}'
+
+
+def make_synthetic_VTT(file_name, cues=3000, seed=0, OST_share=0.1,
+                       OST_texts=SAMPLE_OSTS):
+    """Writes a WebVTT file with random cues
+    and returns the file name.
+
+    About a tenth of the cues (OST_share) are OSTs with a line setting,
+    and the times between cues go from overlaps to long gaps
+    so that the checks have something to report.
+
+    Parameters
+    ----------
+    file_name : str
+    cues : int, optional
+        By default 3000
+    seed : int, optional
+        By default 0
+    OST_share : float, optional
+        Probability of every cue being an OST, by default 0.1
+    OST_texts : list, optional
+        Texts of the OSTs, by default SAMPLE_OSTS
+
+    Returns
+    -------
+    str
+    """
+
+    generator = random.Random(seed)
+    blocks = ['WEBVTT\n']
+    start = 1000
+
+    for i in range(cues):
+        end = start + generator.randint(400, 7000)
+
+        if generator.random() < OST_share:
+            settings = ' line:20%'
+            text = generator.choice(OST_texts)
+        else:
+            settings = ''
+            text = generator.choice(SAMPLE_LINES)
+
+        blocks.append(
+            f'{print_VTT_time(start)} --> {print_VTT_time(end)}{settings}\n'
+            f'{text}\n'
+        )
+
+        start = end + generator.choice([-500, 0, 42, 83, 125, 250, 2000])
+        start = max(start, 0)
+
+    with open(file_name, 'w', encoding='utf-8-sig') as file:
+        file.write('\n'.join(blocks))
+
+    return file_name
+
+
+def make_entity_VTT(file_name, cues=5000, seed=0):
+    """Writes a WebVTT file whose cues are full of
+    character references and returns the file name.
+
+    Parameters
+    ----------
+    file_name : str
+    cues : int, optional
+        By default 5000
+    seed : int, optional
+        By default 0
+
+    Returns
+    -------
+    str
+    """
+
+    generator = random.Random(seed)
+    blocks = ['WEBVTT\n']
+    start = 1000
+
+    for i in range(cues):
+        end = start + 2000
+        text = '\n'.join(generator.sample(SAMPLE_ENTITY_LINES, 2))
+        blocks.append(
+            f'{print_VTT_time(start)} --> {print_VTT_time(end)}\n{text}\n')
+        start = end + 500
+
+    with open(file_name, 'w', encoding='utf-8-sig') as file:
+        file.write('\n'.join(blocks))
+
+    return file_name
+
+
+def reference_consume_HTML_char_ref(text_string, position, aac=''):
+    """consume_HTML_char_ref() as it was before HTML_ENTITY_PREFIXES,
+    testing every prefix of the rest of the text
+    against the list of all the entity names.
+    """
+
+    char_ref = ''
+    entities = list(html.entities.html5.keys())
+    matched_entities = []
+    dec = False
+    hexa = False
+
+    i = position + 1
+
+    if text_string[position] == '#':
+        current = ''
+        if text_string[position+1] in ['x', 'X']:
+            i += 1
+            hexa = True
+        else:
+            dec = True
+
+    while i <= len(text_string):
+        if not hexa and not dec:
+            current = text_string[position:i]
+            if current in entities:
+                matched_entities.append(current)
+
+        else:
+            if ((dec and text_string[i] in '0123456789')
+                or (hexa and text_string[i].upper() in '0123456789ABCDEF')
+                or text_string[i] == ';'):
+                current += text_string[i]
+                if text_string[i] == ';':
+                    break
+            else:
+                i -= 1
+                break
+
+        i += 1
+
+    if matched_entities:
+        char_ref = html.entities.html5[matched_entities[-1]]
+        position += len(matched_entities[-1]) - 1
+    elif dec and current:
+        char_ref = html.unescape('&#' + current)
+        position = i
+    elif hexa and current:
+        char_ref = html.unescape('&#x' + current)
+        position = i
+    elif dec or hexa or not matched_entities:
+        position -= 1
+
+    return char_ref, position
+
+
+def timecode_state(timecode):
+    """The attributes of a Timecode as a list, for comparisons.
+    """
+
+    return [getattr(timecode, name) for name in TIMECODE_ATTRIBUTES]
+
+
+def bench_timecode(count=20000, frame_rate=24, repeat=3):
+    """Compares Timecode() with the Timecode.from_vtt()
+    and Timecode.from_millis() fast paths.
+
+    Parameters
+    ----------
+    count : int, optional
+        Number of timecodes built in each run, by default 20000
+    frame_rate : int, optional
+        By default 24
+    repeat : int, optional
+        Number of runs. The best one is reported, by default 3
+
+    Returns
+    -------
+    dict
+        Best time in seconds for each constructor.
+    """
+
+    generator = random.Random(0)
+    millis_list = [generator.randint(0, 3 * 3600000) for i in range(count)]
+    strings = [print_VTT_time(millis) for millis in millis_list]
+    short_strings = [string[3:] for string in strings if string[:2] == '00']
+
+    # Same attributes first, speed later.
+    for string in strings + short_strings:
+        if (timecode_state(Timecode(string, frame_rate=frame_rate))
+            != timecode_state(
+                Timecode.from_vtt(string, frame_rate=frame_rate))):
+            # Frobnicate
+            raise AssertionError(f'from_vtt() differs for {string}')
+
+    for millis in millis_list:
+        if (timecode_state(Timecode(millis / 1000, frame_rate=frame_rate))
+            != timecode_state(
+                Timecode.from_millis(millis, frame_rate=frame_rate))):
+            # Frobnicate
+            raise AssertionError(f'from_millis() differs for {millis}')
+
+    timings = {
+        'Timecode(str)': min(timeit.repeat(
+            lambda: [Timecode(s, frame_rate=frame_rate) for s in strings],
+            number=1, repeat=repeat)),
+        'Timecode.from_vtt(str)': min(timeit.repeat(
+            lambda: [Timecode.from_vtt(s, frame_rate=frame_rate)
+                     for s in strings],
+            number=1, repeat=repeat)),
+        'Timecode(float)': min(timeit.repeat(
+            lambda: [Timecode(m / 1000, frame_rate=frame_rate)
+                     for m in millis_list],
+            number=1, repeat=repeat)),
+        'Timecode.from_millis(int)': min(timeit.repeat(
+            lambda: [Timecode.from_millis(m, frame_rate=frame_rate)
+                     for m in millis_list],
+            number=1, repeat=repeat)),
+    }
+
+    print(f'Timecode construction ({count} timecodes)')
+    for name, seconds in timings.items():
+        print(f'\t{name:<30}{seconds * 1000:10.1f} ms'
+              f'{count / seconds:14.0f} timecodes/s')
+    print('\n')
+
+    return timings
+
+
+def object_shells(cues):
+    """The cues and their timecodes,
+    which are the objects with __slots__.
+    """
+
+    for cue in cues:
+        yield cue
+        yield cue.start_time
+        yield cue.end_time
+
+
+def bench_memory(cues=10000):
+    """Measures with tracemalloc the memory taken by a parsed
+    synthetic WebVTT file (and the peak when it is streamed
+    with iter_VTT()), and compares the size of the cue
+    and timecode objects with __slots__ with the size they
+    would have with a __dict__ holding the same attributes.
+
+    Parameters
+    ----------
+    cues : int, optional
+        Number of cues in the synthetic file, by default 10000
+
+    Returns
+    -------
+    dict
+        Sizes in bytes.
+    """
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = make_synthetic_VTT(
+            os.path.join(directory, 'memory.vtt'), cues=cues)
+
+        tracemalloc.start()
+        contents = parse_VTT(file_name)
+        parsed, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        # One cue at a time, without keeping them.
+        tracemalloc.start()
+        for block in iter_VTT(file_name):
+            pass
+        streamed_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    slotted = sum(sys.getsizeof(item)
+                  for item in object_shells(contents['cues']))
+
+    # The same attributes in plain objects.
+    class Plain(object):
+        pass
+
+    tracemalloc.start()
+    plain_objects = []
+    for item in object_shells(contents['cues']):
+        plain = Plain()
+        for cls in type(item).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                setattr(plain, name, getattr(item, name))
+        plain_objects.append(plain)
+    with_dict = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    # The list is not part of the objects.
+    with_dict -= sys.getsizeof(plain_objects)
+
+    sizes = {
+        'parsed file': parsed,
+        'parse peak': peak,
+        'iter_VTT() peak': streamed_peak,
+        'objects with __slots__': slotted,
+        'objects with __dict__': with_dict,
+    }
+
+    print(f'Memory ({cues} cues)')
+    for name, size in sizes.items():
+        print(f'\t{name:<30}{size / 1024 ** 2:10.2f} MB')
+    print(f'\t{"saved by __slots__":<30}'
+          f'{(with_dict - slotted) / 1024 ** 2:10.2f} MB')
+    print('\n')
+
+    return sizes
+
+
+def reference_rules(subs, CPS_limit=25, CPL_limit=42, max_lines=2,
+                    min_duration=0.833, max_duration=7):
+    """The per-subtitle rules as quality_check() evaluated them
+    before check_subs(), one subtitle and one rule at a time.
+    """
+
+    general = {}
+
+    for sub in subs:
+        error_counter = 1
+
+        if sub.CPS_ns > CPS_limit:
+            general[f'{sub.number}_{error_counter}'] = (
+                f'Reading speed limit exceeded ({sub.CPS_ns} CPS)')
+            error_counter += 1
+
+        for j, length in enumerate(sub.line_lengths):
+            if length > CPL_limit:
+                general[f'{sub.number}_{error_counter}'] = (
+                    f'Line length limit exceeded '
+                    f'(line {j+1}: {sub.line_lengths[j]} characters)'
+                )
+                error_counter += 1
+
+        if len(sub.untagged_text) > max_lines:
+            general[f'{sub.number}_{error_counter}'] = (
+                f'Maximum number of lines exceeded '
+                f'({len(sub.untagged_text)} lines)'
+            )
+            error_counter += 1
+
+        if sub.get_duration() < min_duration:
+            general[f'{sub.number}_{error_counter}'] = (
+                f'Subtitle lasts less than the minimum duration '
+                f'({sub.get_duration()} seconds)'
+            )
+            error_counter += 1
+
+        if sub.get_duration() > max_duration:
+            general[f'{sub.number}_{error_counter}'] = (
+                f'Subtitle exceeds the maximum duration '
+                f'({sub.get_duration()} seconds)'
+            )
+            error_counter += 1
+
+        if (len(sub.untagged_text) > 1
+            and sub.total_length < CPL_limit and not sub.dialogue):
+            general[f'{sub.number}_{error_counter}'] = (
+                'Text can fit in one line'
+            )
+            error_counter += 1
+
+    return general
+
+
+def bench_quality_check(cues=10000, frame_rate=24, repeat=3):
+    """Compares the per-subtitle rules of check_subs()
+    (one get_duration() per subtitle) with the way
+    quality_check() evaluated them before.
+
+    Gaps, shot changes, ellipses and OSTs are left out
+    because they are not part of the reference.
+
+    Parameters
+    ----------
+    cues : int, optional
+        Number of cues in the synthetic file, by default 10000
+    frame_rate : int, optional
+        By default 24
+    repeat : int, optional
+        Number of runs. The best one is reported, by default 3
+
+    Returns
+    -------
+    dict
+        Best time in seconds for each way.
+    """
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = make_synthetic_VTT(
+            os.path.join(directory, 'quality.vtt'), cues=cues)
+        subs = parse_VTT(file_name, frame_rate=frame_rate)['cues']
+
+    settings = {'CPS_limit': 17, 'CPL_limit': 30}
+
+    def rules():
+        return check_subs(
+            subs, frame_rate=frame_rate, gaps=False, old=False,
+            ellipses=False, check_OST=False, **settings)[0]
+
+    if rules() != reference_rules(subs, **settings):
+        raise AssertionError('check_subs() gives a different report.')
+
+    timings = {
+        'one subtitle at a time': min(timeit.repeat(
+            lambda: reference_rules(subs, **settings),
+            number=1, repeat=repeat)),
+        'check_subs()': min(timeit.repeat(
+            rules, number=1, repeat=repeat)),
+    }
+
+    print(f'Quality check rules ({cues} cues, {len(rules())} issues)')
+    for name, seconds in timings.items():
+        print(f'\t{name:<30}{seconds * 1000:10.1f} ms')
+    print('\n')
+
+    return timings
+
+
+def bench_gaps(sizes=(500, 1000, 2000, 4000, 8000, 16000),
+               full_scan_limit=2000, frame_rate=24):
+    """Times the gap check of a whole file with check_gaps_one()
+    comparing every pair of subtitles, and with a CueTable
+    looking only at the window after each end time,
+    for growing numbers of cues.
+
+    Parameters
+    ----------
+    sizes : tuple, optional
+        Numbers of cues, by default (500, 1000, 2000, 4000, 8000, 16000)
+    full_scan_limit : int, optional
+        Largest file checked by comparing every pair, by default 2000
+    frame_rate : int, optional
+        By default 24
+
+    Returns
+    -------
+    dict
+        Times in seconds (full scan, window) for each size.
+    """
+
+    timings = {}
+
+    print('Gap check (whole file)')
+    print(f'\t{"cues":>8}{"every pair":>16}{"window":>16}')
+
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            file_name = make_synthetic_VTT(
+                os.path.join(directory, f'gaps_{size}.vtt'), cues=size)
+            subs = parse_VTT(file_name, frame_rate=frame_rate)['cues']
+
+            start = timeit.default_timer()
+            table = CueTable(subs, frame_rate=frame_rate)
+            window = [check_gaps_one(i, subs, table=table)
+                      for i in range(len(subs))]
+            window_time = timeit.default_timer() - start
+
+            if size <= full_scan_limit:
+                start = timeit.default_timer()
+                full_scan = [check_gaps_one(i, subs)
+                             for i in range(len(subs))]
+                full_time = timeit.default_timer() - start
+
+                if full_scan != window:
+                    raise AssertionError(
+                        f'The gap check differs for {size} cues.')
+
+                full_text = f'{full_time * 1000:13.1f} ms'
+            else:
+                full_time = None
+                full_text = f'{"-":>16}'
+
+            timings[size] = (full_time, window_time)
+            print(f'\t{size:>8}{full_text}{window_time * 1000:13.1f} ms')
+
+    print('\n')
+
+    return timings
+
+
+def bench_entities(cues=5000, reference_cues=250, repeat=3):
+    """Parses a WebVTT file with tens of thousands
+    of character references with consume_HTML_char_ref(),
+    and a smaller one with the version that went through the list
+    of entity names for every prefix (too slow for the big one).
+    Both are compared per reference.
+
+    Parameters
+    ----------
+    cues : int, optional
+        Number of cues in the big file, by default 5000
+    reference_cues : int, optional
+        Number of cues in the file parsed with the old version,
+        by default 250
+    repeat : int, optional
+        Number of runs. The best one is reported, by default 3
+
+    Returns
+    -------
+    dict
+        Best time in seconds per reference for each version.
+    """
+
+    current = decoders.consume_HTML_char_ref
+    runs = [('list of names', reference_consume_HTML_char_ref, reference_cues),
+            ('prefix set', current, cues)]
+    timings = {}
+    texts = []
+
+    print('Character references')
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name, function, size in runs:
+            file_name = make_entity_VTT(
+                os.path.join(directory, f'entities_{size}.vtt'), cues=size)
+
+            with open(file_name, encoding='utf-8-sig') as file:
+                references = file.read().count('&')
+
+            decoders.consume_HTML_char_ref = function
+
+            try:
+                seconds = min(timeit.repeat(
+                    lambda: parse_VTT(file_name), number=1, repeat=repeat))
+
+                # The first cues of both files are the same.
+                cues_parsed = parse_VTT(file_name)['cues'][:reference_cues]
+                texts.append([cue.text for cue in cues_parsed])
+            finally:
+                decoders.consume_HTML_char_ref = current
+
+            timings[name] = seconds / references
+            print(f'\t{name:<16}{size:>6} cues{references:>8} references'
+                  f'{seconds * 1000:10.1f} ms'
+                  f'{seconds / references * 1e6:10.1f} us/reference')
+
+    if texts[0] != texts[1]:
+        raise AssertionError('The character references decode differently.')
+
+    print('\n')
+
+    return timings
+
+
+def reference_hash_file(name):
+    """hash_file() as it was before reading the blocks in one call,
+    unpacking the first and last 64 KiB 8 bytes at a time.
+    """
+
+    longlongformat = '<q'  # little-endian long long
+    bytesize = struct.calcsize(longlongformat)
+
+    filesize = os.path.getsize(name)
+    hash = filesize
+
+    if filesize < 65536 * 2:
+        return "SizeError"
+
+    with open(name, "rb") as f:
+        for x in range(int(65536/bytesize)):
+            buffer = f.read(bytesize)
+            (l_value,)= struct.unpack(longlongformat, buffer)
+            hash += l_value
+            hash = hash & 0xFFFFFFFFFFFFFFFF
+
+        f.seek(max(0,filesize-65536),0)
+        for x in range(int(65536/bytesize)):
+            buffer = f.read(bytesize)
+            (l_value,)= struct.unpack(longlongformat, buffer)
+            hash += l_value
+            hash = hash & 0xFFFFFFFFFFFFFFFF
+
+    return "%016x" % hash
+
+
+def bench_hash(videos=40, size=1 << 20, workers=4, repeat=3, seed=0):
+    """Hashes a directory of files of random bytes
+    with the old hash_file(), the current one,
+    and the current one in a pool of threads.
+
+    Parameters
+    ----------
+    videos : int, optional
+        Number of files, by default 40
+    size : int, optional
+        Size of every file in bytes, by default 1 MiB
+    workers : int, optional
+        Number of threads of batch_hash_files(), by default 4
+    repeat : int, optional
+        Number of runs. The best one is reported, by default 3
+    seed : int, optional
+        Seed of the random bytes, by default 0
+
+    Returns
+    -------
+    dict
+        Best time in seconds per video for each version.
+    """
+
+    rng = random.Random(seed)
+    timings = {}
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_names = [os.path.join(directory, f'video_{i}.mp4')
+                      for i in range(videos)]
+
+        for file_name in file_names:
+            with open(file_name, 'wb') as file:
+                file.write(rng.randbytes(size))
+
+        hashes = [reference_hash_file(file_name) for file_name in file_names]
+
+        if ([hash_file(file_name) for file_name in file_names] != hashes
+            or list(batch_hash_files(directory, workers=workers).values())
+               != [hashes[file_names.index(os.path.join(directory, name))]
+                   for name in os.listdir(directory)]):
+            raise AssertionError('The hashes are different.')
+
+        runs = {
+            '8 bytes at a time': lambda: [reference_hash_file(file_name)
+                                          for file_name in file_names],
+            'whole blocks': lambda: [hash_file(file_name)
+                                     for file_name in file_names],
+            f'whole blocks, {workers} threads':
+                lambda: batch_hash_files(directory, workers=workers),
+        }
+
+        for name, function in runs.items():
+            seconds = min(timeit.repeat(function, number=1, repeat=repeat))
+            timings[name] = seconds / videos
+
+    print(f'Video hashes ({videos} files)')
+    for name, seconds in timings.items():
+        print(f'\t{name:<30}{seconds * 1e6:10.1f} us/video')
+    print('\n')
+
+    return timings
+
+
+def bench_parse_cache(cues=10000, repeat=3):
+    """Compares parsing a WebVTT file with parse_VTT()
+    with getting it from a ParseCache, from memory
+    and from its directory (as in a later run).
+
+    Parameters
+    ----------
+    cues : int, optional
+        Number of cues in the file, by default 10000
+    repeat : int, optional
+        Number of runs. The best one is reported, by default 3
+
+    Returns
+    -------
+    dict
+        Best time in seconds for each way.
+    """
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = make_synthetic_VTT(
+            os.path.join(directory, 'synthetic.vtt'), cues=cues)
+        pickle_dir = os.path.join(directory, 'parsed')
+
+        parse_cache = ParseCache(directory=pickle_dir)
+        expected = [str(cue) for cue in parse_VTT(file_name)['cues']]
+
+        cached = parse_cache.parse(file_name)['cues']
+
+        if [str(cue) for cue in cached] != expected:
+            raise AssertionError('The cached cues are different.')
+
+        timings = {
+            'parse_VTT()': min(timeit.repeat(
+                lambda: parse_VTT(file_name), number=1, repeat=repeat)),
+            'from memory': min(timeit.repeat(
+                lambda: parse_cache.parse(file_name), number=1, repeat=repeat)),
+            'from the directory': min(timeit.repeat(
+                lambda: ParseCache(directory=pickle_dir).parse(file_name),
+                number=1, repeat=repeat)),
+        }
+
+    print(f'Parsed-file cache ({cues} cues)')
+    for name, seconds in timings.items():
+        print(f'\t{name:<30}{seconds * 1000:10.1f} ms')
+    print('\n')
+
+    return timings
+
+
+def reference_sort_VTT(vtt_subs):
+    """Sorts the cues by start time in place,
+    with the insertion sort that sort_VTT() used before.
+    """
+
+    for step in range(1, len(vtt_subs)):
+        key = vtt_subs[step]
+        j = step - 1
+
+        while (j >= 0
+               and key.start_time.total_seconds
+                   < vtt_subs[j].start_time.total_seconds):
+            
+            vtt_subs[j+1] = vtt_subs[j]
+            j = j - 1
+
+        vtt_subs[j + 1] = key
+
+
+def bench_merge_subs(cues=5000, tie_cues=1000, repeat=3):
+    """Compares putting together the cues of a dialogue file
+    and an OST file as merge_subs() did before (concatenating them
+    and sorting with an insertion sort), with sort_VTT()
+    on the concatenated cues (as it does now)
+    and with heapq.merge() of the two sorted files.
+
+    The order is checked to be the same, ties included,
+    also with two files whose cues all start at the same times.
+
+    Parameters
+    ----------
+    cues : int, optional
+        Number of cues in each file, by default 5000
+    tie_cues : int, optional
+        Number of cues in each of the files with the same times,
+        by default 1000
+    repeat : int, optional
+        Number of runs. The best one is reported.
+        The insertion sort only runs once, by default 3
+
+    Returns
+    -------
+    dict
+        Best time in seconds for each way.
+    """
+
+    with tempfile.TemporaryDirectory() as directory:
+        dialogue = parse_VTT(make_synthetic_VTT(
+            os.path.join(directory, 'dialogue.vtt'), cues=cues))['cues']
+        OSTs = parse_VTT(make_synthetic_VTT(
+            os.path.join(directory, 'OSTs.vtt'), cues=cues, seed=1))['cues']
+        ties_one = parse_VTT(make_synthetic_VTT(
+            os.path.join(directory, 'ties_one.vtt'), cues=tie_cues))['cues']
+        ties_two = parse_VTT(make_synthetic_VTT(
+            os.path.join(directory, 'ties_two.vtt'), cues=tie_cues))['cues']
+
+    def insertion():
+        merged = dialogue + OSTs
+        reference_sort_VTT(merged)
+        return merged
+
+    def key_sort():
+        merged = dialogue + OSTs
+        sort_VTT(merged)
+        return merged
+
+    def k_way_merge(one, two):
+        return list(heapq.merge(sorted(one, key=CUE_START_KEY),
+                                sorted(two, key=CUE_START_KEY),
+                                key=CUE_START_KEY))
+
+    for one, two in ((dialogue, OSTs), (ties_one, ties_two)):
+        expected = one + two
+        reference_sort_VTT(expected)
+
+        merged = one + two
+        sort_VTT(merged)
+
+        for result in (merged, k_way_merge(one, two)):
+            if [id(cue) for cue in result] != [id(cue) for cue in expected]:
+                raise AssertionError('The cues are in a different order.')
+
+    timings = {
+        'insertion sort': min(timeit.repeat(insertion, number=1, repeat=1)),
+        'sort_VTT()': min(timeit.repeat(key_sort, number=1, repeat=repeat)),
+        'heapq.merge()': min(timeit.repeat(
+            lambda: k_way_merge(dialogue, OSTs), number=1, repeat=repeat)),
+    }
+
+    print(f'Merging subtitles and OSTs ({cues} + {cues} cues)')
+    for name, seconds in timings.items():
+        print(f'\t{name:<30}{seconds * 1000:10.1f} ms')
+    print('\n')
+
+    return timings
+
+
+def bench_extract_OSTs(cues=10000, OST_share=0.5, repeat=3):
+    """Compares copying the OSTs of a file with copy.deepcopy(),
+    as extract_OSTs() did before, with WebVTT.clone(),
+    and times the whole extract_OSTs() on the same file.
+
+    The copies are checked to print the same as the original cues.
+
+    Parameters
+    ----------
+    cues : int, optional
+        Number of cues in the file, by default 10000
+    OST_share : float, optional
+        Share of the cues that are OSTs, by default 0.5
+    repeat : int, optional
+        Number of runs. The best one is reported, by default 3
+
+    Returns
+    -------
+    dict
+        Best time in seconds for each way.
+    """
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = make_synthetic_VTT(
+            os.path.join(directory, 'OST_heavy.vtt'), cues=cues,
+            OST_share=OST_share)
+        OSTs = [cue for cue in parse_VTT(file_name)['cues']
+                if cue.line == 20]
+
+        expected = [str(cue) for cue in OSTs]
+
+        for copies in ([copy.deepcopy(cue) for cue in OSTs],
+                       [cue.clone() for cue in OSTs]):
+            if [str(cue) for cue in copies] != expected:
+                raise AssertionError('The copies are different.')
+
+            if any(copied.end_time is cue.end_time
+                   for copied, cue in zip(copies, OSTs)):
+                raise AssertionError('The copies share their timecodes.')
+
+        timings = {
+            'copy.deepcopy()': min(timeit.repeat(
+                lambda: [copy.deepcopy(cue) for cue in OSTs],
+                number=1, repeat=repeat)),
+            'clone()': min(timeit.repeat(
+                lambda: [cue.clone() for cue in OSTs],
+                number=1, repeat=repeat)),
+            'extract_OSTs()': min(timeit.repeat(
+                lambda: extract_OSTs(file_name, directory, batch=True),
+                number=1, repeat=repeat)),
+        }
+
+    print(f'Copying OSTs ({len(OSTs)} of {cues} cues)')
+    for name, seconds in timings.items():
+        print(f'\t{name:<30}{seconds * 1000:10.1f} ms')
+    print('\n')
+
+    return timings
+
+
+def reference_OST_rules(untagged_text):
+    """The OST rules as extract_OSTs(), check_cues()
+    and check_OSTs() applied them before they were precompiled,
+    each with its own searches on its own joined text.
+
+    Returns
+    -------
+    tuple
+        Whether extract_OSTs() took the text for an OST,
+        whether check_cues() took it for a valid raised OST,
+        whether it warned about it when not raised,
+        and whether check_OSTs() took it for an OST.
+    """
+
+    check_text = '\n'.join(untagged_text)
+    extracted = bool(re.search('^\[.*\][\.,]*$', check_text)
+                     or re.search('^\[+[A-ZÀ-Ý ]{2,}', check_text)
+                     or re.search('[A-ZÀ-Ý ]{2,}\]+$', check_text)
+                     or re.search('^[A-ZÀ-Ý ]{2,}$', check_text)
+                     or re.search('^\[.+', check_text)
+                     or re.search('.+\]$', check_text))
+
+    check_text = ' '.join(untagged_text)
+    bracketed = re.search('^\[.+\]$', check_text)
+    valid = bool(bracketed and check_text.upper() == check_text)
+    not_raised = bool(bracketed and check_text.upper() != check_text)
+
+    tag_match = bool(re.search('^\[.*\]$', ''.join(untagged_text)))
+
+    return (extracted, valid, not_raised, tag_match)
+
+
+def OST_rules(untagged_text):
+    """The same as reference_OST_rules(), from OSTKind.classify()
+    for check_cues() and the patterns of extract_OSTs()
+    and check_OSTs().
+    """
+
+    kind = OSTKind.classify(untagged_text)
+    extracted = OST_CANDIDATE_PATTERN.search('\n'.join(untagged_text))
+    tag_match = OST_BRACKETS_PATTERN.search(''.join(untagged_text))
+
+    return (bool(extracted), kind is OSTKind.VALID,
+            kind is OSTKind.LOWERCASE, bool(tag_match))
+
+
+def random_OST_texts(count=20000, seed=0):
+    """Short untagged lines made of brackets, punctuation,
+    capitals, lowercase letters and spaces, for checking
+    the OST rules on malformed texts.
+    """
+
+    rng = random.Random(seed)
+    alphabet = '[].,AB aÉé'
+
+    return [
+        [''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 5)))
+         for _ in range(rng.randint(1, 3))]
+        for _ in range(count)
+    ]
+
+
+def bench_OST_classifier(cues=50000, OST_share=0.3, repeat=3):
+    """Compares the OST rules of extract_OSTs(), check_cues()
+    and check_OSTs() as they were before (six searches
+    and two more on differently joined texts, compiled
+    from string literals) with OST_rules(): one OSTKind.classify()
+    and two precompiled searches per cue, on a file of dialogue
+    and OSTs, some of them malformed.
+
+    The results are checked to be the same for every cue,
+    for OST_EDGE_TEXTS and for random_OST_texts().
+
+    Parameters
+    ----------
+    cues : int, optional
+        Number of cues in the file, by default 50000
+    OST_share : float, optional
+        Share of the cues that are OSTs, by default 0.3
+    repeat : int, optional
+        Number of runs. The best one is reported, by default 3
+
+    Returns
+    -------
+    dict
+        Best time in seconds for each way.
+    """
+
+    with tempfile.TemporaryDirectory() as directory:
+        texts = [cue.untagged_text for cue in parse_VTT(make_synthetic_VTT(
+            os.path.join(directory, 'mixed.vtt'), cues=cues,
+            OST_share=OST_share, OST_texts=SAMPLE_MIXED_OSTS))['cues']]
+
+    for text in texts + OST_EDGE_TEXTS + random_OST_texts():
+        if reference_OST_rules(text) != OST_rules(text):
+            raise AssertionError(f'Different OST results for {text!r}.')
+
+    timings = {
+        'separate searches': min(timeit.repeat(
+            lambda: [reference_OST_rules(text) for text in texts],
+            number=1, repeat=repeat)),
+        'precompiled rules': min(timeit.repeat(
+            lambda: [OST_rules(text) for text in texts],
+            number=1, repeat=repeat)),
+    }
+
+    print(f'Classifying OSTs ({cues} cues)')
+    for name, seconds in timings.items():
+        print(f'\t{name:<30}{seconds * 1000:10.1f} ms'
+              f'{cues / seconds:12.0f} cues/s')
+    print('\n')
+
+    return timings
+
+
+def reference_cue_text_tokenizer(text_string, position):
+    """cue_text_tokenizer() as it was before TEXT_RUN_PATTERN,
+    taking the text one character at a time.
+    """
+
+    # WebVTT data state -> 1
+    # HTML character reference in data state -> 2
+    # WebVTT tag state -> 3
+    # WebVTT start tag state -> 4
+    # WebVTT start tag class state -> 5
+    # WebVTT start tag annotation state -> 6
+    # HTML character reference in annotation state -> 7
+    # WebVTT end tag state -> 8
+    # WebVTT timestamp tag state -> 9
+    
+    tokenizer_state = 1
+    result = ''
+    classes = []
+    
+    # NOTE: The initialization of buffer
+    #       is never mentioned in the algorithm.
+    buffer = ''
+
+    while True:
+        _next = False
+        if position >= len(text_string):
+            c = None
+        else:
+            c = text_string[position]
+
+        # || WebVTT data state
+        if tokenizer_state == 1:
+            if c == '&':
+                # Set tokenizer_state
+                # to the "HTML character reference in data state."
+                tokenizer_state = 2
+                _next = True
+            elif c == '<':
+                if result == '':
+                    # Set tokenizer_state to the "WebVTT tag state."
+                    tokenizer_state = 3
+                    _next = True
+                else:
+                    return result, position
+            elif c is None:
+                return result, position
+            else:
+                result += c
+                _next = True
+
+        # || HTML character reference in data state
+        elif tokenizer_state == 2:
+            # NOTE: Remember the additional allowed character.
+            #       There shouldn't be one here.
+            chars, position = consume_HTML_char_ref(text_string, position)
+            if not chars:
+                result += '&'
+            else:
+                result += chars
+
+            # Set tokenizer_state to the "WebVTT data state."
+            tokenizer_state = 1
+            _next = True
+        
+        # || WebVTT tag state
+        elif tokenizer_state == 3:
+            # NOTE: Confirm the form feed works.
+            if c in ['\t', '\n', '\f', ' ']:
+                # !! NOTE: Not in the algorithm,
+                #          but used to keep invalid tags.
+                buffer = c
+
+                # Set tokenizer_state
+                # to the "WebVTT start tag annotation state."
+                tokenizer_state = 6
+                _next = True
+            elif c == '.':
+                # Set tokenizer state
+                # to the "WebVTT start tag class state."
+                tokenizer_state = 5
+                _next = True
+            elif c == '/':
+                # Set tokenizer_state to the "WebVTT end tag state."
+                tokenizer_state = 8
+                _next = True
+            elif re.search('\d', c):
+                result = c
+                
+                # Set tokenizer_state
+                # to the "WebVTT timestamp tag state."
+                tokenizer_state = 9
+                _next = True
+            elif c == '>':
+                position += 1
+
+                # return a start tag whose tag name is the empty string,
+                # with no classes and no annotation,
+                # and abort these steps.
+                return StartTag(''), position
+            elif c is None:
+                # return a start tag whose tag name is the empty string,
+                # with no classes and no annotation,
+                # and abort these steps.
+                return StartTag('', closed=False), position
+            else:
+                result = c
+
+                # Set tokenizer_state to the "WebVTT start tag state."
+                tokenizer_state = 4
+                _next = True
+
+        # || WebVTT start tag state
+        elif tokenizer_state == 4:
+            # NOTE: Confirm the form feed works.
+            if c in ['\t', '\f', ' ']:
+                # !! NOTE: Not in the algorithm,
+                #          but used to keep invalid tags.
+                buffer = c
+
+                # Set tokenizer_state
+                # to the "WebVTT start tag annotation state."
+                tokenizer_state = 6
+                _next = True
+            elif c == '\n':
+                buffer = c
+
+                # Set tokenizer_state
+                # to the "WebVTT start tag annotation state."
+                tokenizer_state = 6
+                _next = True
+            elif c == '.':
+                # Set tokenizer state
+                # to the "WebVTT start tag class state."
+                tokenizer_state = 5
+                _next = True
+            elif c == '>':
+                position += 1
+                return StartTag(result), position
+            elif c is None:
+                return StartTag(result, closed=False), position
+            else:
+                result += c
+                _next = True
+
+        # || WebVTT start tag class state
+        elif tokenizer_state == 5:
+            # NOTE: Confirm the form feed works.
+            if c in ['\t', '\f', ' ']:
+                classes.append(buffer)
+
+                # NOTE: The algorithm has buffer = '',
+                #       but this is done to keep invalid tags.
+                buffer = c
+                
+                # Set tokenizer state
+                # to the "WebVTT start tag annotation state." 
+                tokenizer_state = 6
+                _next = True
+            elif c == '\n':
+                classes.append(buffer)
+                buffer = c
+
+                # Set tokenizer_state
+                # to the "WebVTT start tag annotation state."
+                tokenizer_state = 6
+                _next = True
+            elif c == '.':
+                classes.append(buffer)
+                buffer = ''
+                _next = True
+            elif c == '>':
+                position += 1
+                classes.append(buffer)
+
+                # ...then return a start tag whose tag name is result,
+                # with the classes given in classes but no annotation,
+                # and abort these steps.
+                return StartTag(result, classes=classes), position
+            elif c is None:
+                classes.append(buffer)
+                
+                # ...then return a start tag whose tag name is result,
+                # with the classes given in classes but no annotation,
+                # and abort these steps.
+                return StartTag(result, classes=classes, closed=False), position
+            else:
+                buffer += c
+                _next = True
+        
+        # || WebVTT start tag annotation state
+        elif tokenizer_state == 6:
+            if c == '&':
+                # Set tokenizer_state
+                # to the "HTML character reference in annotation state."
+                tokenizer_state = 7
+                _next = True
+            elif c == '>':
+                position += 1
+
+                # NOTE: Strip and whitespace replacement
+                #       done in class instantiation.
+                
+                # ...then, return a start tag whose tag name is result,
+                # with the classses given in classes,
+                # and with buffer as the annotation,
+                # and abort these steps.
+                return (StartTag(result, classes=classes, annotation=buffer),
+                        position)
+            elif c is None:
+                # NOTE: Strip and whitespace replacement
+                #       done in class instantiation.
+
+                # ...then, return a start tag whose tag name is result,
+                # with the classses given in classes,
+                # and with buffer as the annotation,
+                # and abort these steps.
+                return (StartTag(result, classes=classes, annotation=buffer, closed=False),
+                        position)
+            else:
+                buffer += c
+                _next = True
+
+        # || HTML character reference in annotation state
+        elif tokenizer_state == 7:
+            # NOTE: Don't forget the additional allowed character.
+            #       ...with the additional character being >
+            chars, position = consume_HTML_char_ref(text_string, position)
+
+            if not chars:
+                buffer += '&'
+            else:
+                buffer += chars
+            
+            # Set tokenizer_state
+            # to the "WebVTT start tag annotation state."
+            tokenizer_state = 6
+            _next = True
+        
+        # || WebVTT end tag state
+        elif tokenizer_state == 8:
+            if c == '>':
+                position += 1
+                return EndTag(result), position
+            elif c is None:
+                return EndTag(result, closed=False), position
+            else:
+                result += c
+                _next = True
+
+        # || WebVTT timestamp tag state
+        elif tokenizer_state == 9:
+            # NOTE: Needs attention! Not really tested.
+            if c == '>':
+                position += 1
+
+                # Return a timestamp tag whose tag name is result
+                # and abort these steps.
+                return TimestampTag(result), position
+            elif c is None:
+                # Return a timestamp tag whose tag name is result
+                # and abort these steps.
+                return TimestampTag(result), position
+            else:
+                result += c
+                _next = True
+        
+        if _next:
+            position += 1
+
+
+def token_state(token):
+    """A token of the cue text tokenizers, as something to compare.
+    """
+
+    if type(token) == str:
+        return token
+
+    return type(token).__name__, sorted(vars(token).items())
+
+
+def tokenize(cue_text, tokenizer):
+    """All the tokens of a cue text.
+    """
+
+    tokens = []
+    position = 0
+
+    while position < len(cue_text):
+        token, position = tokenizer(cue_text, position)
+        tokens.append(token)
+
+    return tokens
+
+
+def bench_tokenizer(cues=10000, repeat=3, seed=0):
+    """Compares cue_text_tokenizer() with reference_cue_text_tokenizer(),
+    which takes the text one character at a time,
+    checking first that they give the same tokens.
+
+    Parameters
+    ----------
+    cues : int, optional
+        Number of cue texts, by default 10000
+    repeat : int, optional
+        Number of runs. The best one is reported, by default 3
+    seed : int, optional
+        By default 0
+
+    Returns
+    -------
+    dict
+        Best time in seconds for each tokenizer.
+    """
+
+    generator = random.Random(seed)
+    samples = SAMPLE_LINES + SAMPLE_ENTITY_LINES + SAMPLE_OSTS + [
+        '<c.yellow.bg_black>Careful!</c> <v Bob>Run!</v>',
+        '<00:00:01.000>Karaoke <00:00:01.500>text',
+        'Broken <tag and </i',
+    ]
+    cue_texts = ['\n'.join(generator.sample(samples, 2))
+                 for i in range(cues)]
+
+    for cue_text in cue_texts:
+        if ([token_state(token) for token
+             in tokenize(cue_text, reference_cue_text_tokenizer)]
+            != [token_state(token) for token
+                in tokenize(cue_text, decoders.cue_text_tokenizer)]):
+            raise AssertionError(f'Different tokens for {cue_text!r}')
+
+    timings = {
+        'one character at a time': min(timeit.repeat(
+            lambda: [tokenize(cue_text, reference_cue_text_tokenizer)
+                     for cue_text in cue_texts],
+            number=1, repeat=repeat)),
+        'runs of text': min(timeit.repeat(
+            lambda: [tokenize(cue_text, decoders.cue_text_tokenizer)
+                     for cue_text in cue_texts],
+            number=1, repeat=repeat)),
+    }
+
+    print(f'Cue text tokenizer ({cues} cues)')
+    for name, seconds in timings.items():
+        print(f'\t{name:<30}{seconds * 1000:10.1f} ms'
+              f'{cues / seconds:14.0f} cues/s')
+    print('\n')
+
+    return timings
+
+
+def run_benchmarks():
+
+    bench_timecode()
+    bench_memory()
+    bench_quality_check()
+    bench_gaps()
+    bench_entities()
+    bench_tokenizer()
+    bench_hash()
+    bench_parse_cache()
+    bench_merge_subs()
+    bench_extract_OSTs()
+    bench_OST_classifier()
+
+
+if __name__ == '__main__':
+    run_benchmarks()
@@ -0,0 +1,475 @@
+import os, sqlite3, pickle, hashlib, threading
+from array import array
+from collections import OrderedDict
+from contextlib import closing
+
+from reader import read_text_file, hash_file, read_shot_changes
+from utils import get_frame_rate
+from decoders import decode_VTT, parse_VTT
+
+
+# Default location of the cache, shared by all the runs of the app.
+CACHE_NAME = os.path.join(os.path.expanduser('~'),
+                          '.subtitling_copilot_cache.sqlite')
+
+# Changed whenever the parsed classes change,
+# so that pickles from older versions are not loaded.
+PARSE_CACHE_VERSION = 1
+
+# Changed whenever the checks or their messages change,
+# so that the results of older versions are not reused.
+CHECK_CACHE_VERSION = 2
+
+
+class SQLiteCache(object):
+    """Base of the caches kept in an SQLite file.
+
+    A new connection is opened for every lookup, so the same
+    instance can be used from several threads, and it can be pickled
+    to worker processes (only the file name is stored).
+    """
+
+    __slots__ = ('file_name',)
+
+    # CREATE TABLE statements of the tables of the cache.
+    TABLES = ()
+
+
+    def __init__(self, file_name=CACHE_NAME):
+        """
+        Parameters
+        ----------
+        file_name : str or os.PathLike, optional
+            Path to the SQLite file. It is created if it doesn't exist,
+            by default CACHE_NAME
+        """
+
+        self.file_name = file_name
+
+        with closing(self.connect()) as connection, connection:
+            for table in self.TABLES:
+                connection.execute(table)
+
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.file_name!r})'
+
+
+    def connect(self):
+        # NOTE: The timeout lets concurrent workers wait
+        #       for each other's writes instead of failing.
+        return sqlite3.connect(self.file_name, timeout=30)
+
+
+class VideoCache(SQLiteCache):
+    """Persistent cache of what the quality check needs from a video:
+    its hash, its frame rate (from FFPROBE)
+    and the times in its .scenechanges file.
+
+    Everything is keyed by the absolute path of the file
+    it came from, and is only used while the size
+    and the modification time of that file stay the same.
+    """
+
+    __slots__ = ()
+
+    TABLES = (
+        'CREATE TABLE IF NOT EXISTS videos ('
+        'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, '
+        'hash TEXT, frame_rate REAL)',
+        'CREATE TABLE IF NOT EXISTS shot_changes ('
+        'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, '
+        'times BLOB)',
+    )
+
+
+    def get_hash(self, video_name):
+        """hash_file() of the video, cached.
+
+        Parameters
+        ----------
+        video_name : str or os.PathLike
+
+        Returns
+        -------
+        str
+        """
+
+        return self.get_video_value('hash', video_name, hash_file)
+
+
+    def get_frame_rate(self, video_name):
+        """get_frame_rate() of the video, cached.
+
+        Parameters
+        ----------
+        video_name : str or os.PathLike
+
+        Returns
+        -------
+        float
+        """
+
+        return self.get_video_value('frame_rate', video_name, get_frame_rate)
+
+
+    def get_video_value(self, column, video_name, function):
+        """Value of a column of the videos table for a video,
+        computed with the function and stored if it is missing
+        or the video has changed.
+
+        Parameters
+        ----------
+        column : str
+            'hash' or 'frame_rate'.
+        video_name : str or os.PathLike
+        function : callable
+            Called with the video name to compute the value.
+        """
+
+        try:
+            path, size, mtime_ns = file_stamp(video_name)
+        except OSError:
+            # Nothing to key the value by,
+            # so it is left to the function to fail as it would.
+            return function(video_name)
+
+        with closing(self.connect()) as connection:
+            row = connection.execute(
+                'SELECT size, mtime_ns, hash, frame_rate '
+                'FROM videos WHERE path = ?',
+                (path,)
+            ).fetchone()
+
+        if row is not None and row[:2] == (size, mtime_ns):
+            values = {'hash': row[2], 'frame_rate': row[3]}
+
+            if values[column] is not None:
+                return values[column]
+        else:
+            values = {'hash': None, 'frame_rate': None}
+
+        value = function(video_name)
+
+        # NOTE: An unreadable file may be readable next time.
+        if value == 'IOError':
+            return value
+
+        values[column] = value
+
+        with closing(self.connect()) as connection, connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO videos '
+                'VALUES (?, ?, ?, ?, ?)',
+                (path, size, mtime_ns, values['hash'], values['frame_rate'])
+            )
+
+        return value
+
+
+    def get_shot_changes(self, sc_name):
+        """read_shot_changes() of a .scenechanges file, cached.
+
+        Parameters
+        ----------
+        sc_name : str or os.PathLike
+
+        Returns
+        -------
+        list
+            Times of the shot changes in seconds.
+        """
+
+        path, size, mtime_ns = file_stamp(sc_name)
+
+        with closing(self.connect()) as connection:
+            row = connection.execute(
+                'SELECT size, mtime_ns, times '
+                'FROM shot_changes WHERE path = ?',
+                (path,)
+            ).fetchone()
+
+        if row is not None and row[:2] == (size, mtime_ns):
+            times = array('d')
+            times.frombytes(row[2])
+
+            return times.tolist()
+
+        sc_list = read_shot_changes(sc_name)
+
+        with closing(self.connect()) as connection, connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO shot_changes '
+                'VALUES (?, ?, ?, ?)',
+                (path, size, mtime_ns, array('d', sc_list).tobytes())
+            )
+
+        return sc_list
+
+
+def file_stamp(file_name):
+    """Absolute path, size and modification time of a file,
+    which identify a version of it in the cache.
+
+    Parameters
+    ----------
+    file_name : str or os.PathLike
+
+    Returns
+    -------
+    tuple
+        (path, size, mtime_ns)
+    """
+
+    file_stat = os.stat(file_name)
+
+    return (os.path.abspath(file_name), file_stat.st_size,
+            file_stat.st_mtime_ns)
+
+
+class CheckCache(SQLiteCache):
+    """Persistent cache of the quality check results of every file,
+    for batch_quality_check(incremental=True).
+
+    For every subtitle file (by absolute path) it keeps
+    a fingerprint of its contents, a fingerprint of the settings
+    it was checked with, the issues of the whole file
+    and the issues of every subtitle, keyed by a fingerprint
+    of the subtitle (see checks.cue_fingerprints()).
+    """
+
+    __slots__ = ()
+
+    TABLES = (
+        'CREATE TABLE IF NOT EXISTS file_checks ('
+        'path TEXT PRIMARY KEY, file_hash TEXT, settings_hash TEXT, '
+        'issues BLOB, cues BLOB)',
+    )
+
+
+    def get(self, file_name):
+        """The results of the last check of a file.
+
+        Parameters
+        ----------
+        file_name : str or os.PathLike
+
+        Returns
+        -------
+        tuple or None
+            (file_hash, settings_hash, issues, cue_issues),
+            or None if the file hasn't been checked.
+        """
+
+        with closing(self.connect()) as connection:
+            row = connection.execute(
+                'SELECT file_hash, settings_hash, issues, cues '
+                'FROM file_checks WHERE path = ?',
+                (os.path.abspath(file_name),)
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        try:
+            issues = pickle.loads(row[2])
+            cue_issues = pickle.loads(row[3])
+        except Exception:
+            return None
+
+        return row[0], row[1], issues, cue_issues
+
+
+    def put(self, file_name, file_hash, settings_hash, issues, cue_issues):
+        """Stores the results of the check of a file.
+
+        Parameters
+        ----------
+        file_name : str or os.PathLike
+        file_hash : str
+        settings_hash : str
+        issues : tuple
+            (general, warnings) of the whole file.
+        cue_issues : dict
+            (general, warnings) of every subtitle,
+            keyed by its fingerprint.
+        """
+
+        with closing(self.connect()) as connection, connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO file_checks VALUES (?, ?, ?, ?, ?)',
+                (os.path.abspath(file_name), file_hash, settings_hash,
+                 pickle.dumps(issues, pickle.HIGHEST_PROTOCOL),
+                 pickle.dumps(cue_issues, pickle.HIGHEST_PROTOCOL))
+            )
+
+
+class ParseCache(object):
+    """Cache of parsed WebVTT files, keyed by the path,
+    a hash of the contents of the file, the frame rate
+    and the parser (parse_VTT() or the old decode_VTT()).
+
+    The most recently used files are kept in memory.
+    With a directory, every parsed file is also pickled there,
+    so that a later run of any tool over the same files
+    doesn't parse them again.
+
+    The parsed files are stored pickled, so every call
+    returns new objects that the caller can modify freely.
+    """
+
+    __slots__ = ('max_files', 'directory', '_entries', '_lock')
+
+
+    def __init__(self, max_files=64, directory=''):
+        """
+        Parameters
+        ----------
+        max_files : int, optional
+            Number of parsed files kept in memory, by default 64
+        directory : str or os.PathLike, optional
+            Path to the directory for the pickles.
+            Nothing is saved to disk without one, by default ''
+        """
+
+        self.max_files = max_files
+        self.directory = directory
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def __repr__(self):
+        return (f'ParseCache(max_files={self.max_files}, '
+                f'directory={self.directory!r})')
+
+
+    def parse(self, file_name, frame_rate=24, old=False):
+        """parse_VTT() or decode_VTT() of a file, cached.
+
+        Parameters
+        ----------
+        file_name : str or os.PathLike
+            Path to the WebVTT file.
+        frame_rate : float, optional
+            By default 24
+        old : bool, optional
+            Whether to parse it with decode_VTT(), by default False
+
+        Returns
+        -------
+        dict
+            What the parser returns: 'cues' with parse_VTT(),
+            'subtitles' with decode_VTT().
+        """
+
+        content_hash = hash_contents(file_name)
+
+        key = (os.path.abspath(file_name), content_hash, frame_rate, old)
+
+        with self._lock:
+            data = self._entries.get(key)
+
+            if data is not None:
+                self._entries.move_to_end(key)
+
+        if data is None and self.directory:
+            data = self.load(key)
+
+            if data is not None:
+                self.remember(key, data)
+
+        if data is not None:
+            try:
+                return pickle.loads(data)
+            except Exception:
+                # NOTE: A damaged pickle is parsed again and replaced.
+                pass
+
+        if old:
+            contents = decode_VTT(read_text_file(file_name),
+                                  frame_rate=frame_rate)
+        else:
+            contents = parse_VTT(file_name, frame_rate=frame_rate)
+
+        # NOTE: Files that couldn't be parsed are not cached.
+        if contents is None:
+            return contents
+
+        data = pickle.dumps(contents, pickle.HIGHEST_PROTOCOL)
+        self.remember(key, data)
+
+        if self.directory:
+            self.save(key, data)
+
+        return contents
+
+
+    def remember(self, key, data):
+        """Keeps a pickled file in memory,
+        forgetting the least recently used one if it's full.
+        """
+
+        with self._lock:
+            self._entries[key] = data
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_files:
+                self._entries.popitem(last=False)
+
+
+    def pickle_name(self, key):
+        """Path to the pickle of a key in the directory.
+        """
+
+        name = hashlib.blake2b(repr((PARSE_CACHE_VERSION, key)).encode(),
+                               digest_size=16).hexdigest()
+
+        return os.path.join(self.directory, name + '.pickle')
+
+
+    def load(self, key):
+        """The pickle of a key from the directory, or None.
+        """
+
+        try:
+            with open(self.pickle_name(key), 'rb') as pickle_file:
+                return pickle_file.read()
+        except OSError:
+            return None
+
+
+    def save(self, key, data):
+        """Writes the pickle of a key to the directory, atomically.
+        """
+
+        os.makedirs(self.directory, exist_ok=True)
+        pickle_name = self.pickle_name(key)
+        temp_name = f'{pickle_name}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+        with open(temp_name, 'wb') as pickle_file:
+            pickle_file.write(data)
+
+        os.replace(temp_name, pickle_name)
+
+
+def hash_contents(file_name):
+    """Fingerprint of the contents of a file.
+
+    Parameters
+    ----------
+    file_name : str or os.PathLike
+
+    Returns
+    -------
+    str
+        BLAKE2 hash in 32 hexadecimal digits.
+    """
+
+    with open(file_name, 'rb') as in_file:
+        return hashlib.blake2b(in_file.read(), digest_size=16).hexdigest()
+
+
+# Shared by the tools of all the modules.
+# Set PARSE_CACHE.directory to keep the parsed files between runs.
+PARSE_CACHE = ParseCache()
+
@@ -1,10 +1,24 @@
-import copy, re, os, csv
+import copy, os, csv, hashlib
+from array import array
 
 from decoders import decode_VTT, decode_SRT, parse_VTT
 from encoders import encode_VTT
-from reader import read_text_file, hash_file
-from classes import Timecode
+from reader import (read_text_file, read_shot_changes,
+                    read_binary_shot_changes, hash_file,
+                    SCENE_CHANGES_BINARY_EXT)
+from classes import CueTable, ShotChangeIndex, Issue, OSTKind
 from utils import get_frame_rate
+from jobs import iter_jobs
+from cache import (VideoCache, CheckCache, PARSE_CACHE, CHECK_CACHE_VERSION,
+                   hash_contents)
+from reports import (FileReportSink, ListReportSink, RECORD_FORMATS,
+                     open_record_sink)
+
+
+# Shot changes already read and converted to frames,
+# keyed by .scenechanges file and frame rate.
+# Files for the same video (same hash) share the same entry.
+SHOT_CHANGE_INDEXES = {}
 
 
 # def get_NF_glyph_list():
@@ -63,7 +77,61 @@ def batch_quality_check(files_dir, videos_dir='', sc_dir='', shot_changes=True,
                         max_lines=2, min_duration=0.833,
                         max_duration=7, ellipses=True, gaps=True,
                         report=False, report_name='', old=True,
-                        glyphs=True, check_TCFOL=True, check_OST=True, GUI=True):
+                        glyphs=True, check_TCFOL=True, check_OST=True, GUI=True,
+                        workers=1, threads=False, cache_name='',
+                        incremental=False, sink=None, records_name='',
+                        progress=None, cancel=None):
+    """Quality check of all the subtitle files in a directory,
+    each one with the video in the same position in the videos
+    directory.
+
+    With more than one worker, the files are checked in parallel
+    in worker processes, or in threads if threads is True.
+    The reports are still put together
+    in the order of the files, and a file that cannot be checked
+    gets an error message in its place instead of stopping the rest.
+
+    The directories can be absolute or relative paths,
+    str or pathlib.Path. The current working directory
+    is never changed, so it is safe to call from a thread.
+
+    With a cache_name, the hash and frame rate of every video
+    and the shot changes of every .scenechanges file are kept
+    in that SQLite file (see cache.VideoCache), so that checking
+    the same videos again doesn't run FFPROBE or read them.
+
+    With incremental as well, the results of every file are kept
+    in the same file (see cache.CheckCache). When the directory
+    is checked again with the same settings, the files that haven't
+    changed are not parsed again, and in those that have,
+    only the subtitles that changed, or whose gaps to the next ones
+    changed, are checked again (see check_file_incremental()).
+
+    The report is written as the files are checked, one file
+    at a time and in their order: to report_name if report is True,
+    and to sink if one is given (see reports.ReportSink),
+    for example to show it in the GUI while the rest of the files
+    are being checked.
+
+    With a records_name (.jsonl or .csv), every issue is also written
+    to that file as a record, with the file, the subtitle number,
+    the rule, the severity ('error' or 'warning'), the value measured
+    and the limit (see reports.RECORD_FIELDS). The report is made
+    from the same records.
+
+    progress is called as progress(done, total) every time a file
+    is checked, and no more files are checked once cancel
+    (a threading.Event) is set, for example from the GUI.
+    The report then only has the files checked until then.
+
+    The rest of the parameters are the same as in quality_check().
+
+    Returns
+    -------
+    list
+        Lines of the report, if GUI or report is True
+        and no sink is given. Otherwise None.
+    """
 
     # Check subtitle format.
     if s_format and s_format.lower() not in ['vtt', 'srt']:
@@ -73,9 +141,7 @@ def batch_quality_check(files_dir, videos_dir='', sc_dir='', shot_changes=True,
     # glyph_list = get_NF_glyph_list()
     glyph_list = []
 
-    current_dir = os.getcwd()
-    os.chdir(videos_dir)
-    all_videos = os.listdir()
+    all_videos = os.listdir(videos_dir)
     video_files = []
 
     # Filter all files that are not videos.
@@ -89,8 +155,7 @@ def batch_quality_check(files_dir, videos_dir='', sc_dir='', shot_changes=True,
             video_files.append(video)
 
     # video_files = sorted(video_files)
-    os.chdir(files_dir)
-    all_files = os.listdir()
+    all_files = os.listdir(files_dir)
     sub_files = []
 
     for f_file in all_files:
@@ -115,7 +180,7 @@ def batch_quality_check(files_dir, videos_dir='', sc_dir='', shot_changes=True,
             return
 
         else:
-            report_cont = [
+            header = [
                 '-'*160,
                 f'Quality report for {ext} files '
                 f'in the directory {files_dir}',
@@ -125,8 +190,8 @@ def batch_quality_check(files_dir, videos_dir='', sc_dir='', shot_changes=True,
                 'Files checked',
                 '\n'
             ]
-            report_cont.extend(sub_files)
-            report_cont.extend([
+            header.extend(sub_files)
+            header.extend([
                 '\n',
                 '-'*120,
                 'Settings used:',
@@ -143,67 +208,166 @@ def batch_quality_check(files_dir, videos_dir='', sc_dir='', shot_changes=True,
                 '\n'
             ])
 
-    for i, sub_file in enumerate(sub_files):
-        # print(sub_file)
-        # Only for debugging purposes
-        if i == 0:
-            hello = 2
-        
-        if report or GUI:
-            report_cont.extend([
-                '-'*120,
-                '\n',
-                sub_file,
-                '\n'
-            ])
-        elif not GUI:
-            print(sub_file)
-            print('\n')
+    if incremental and not cache_name:
+        print('An incremental check needs a cache_name.')
+        return
 
-        # video_name = videos_dir + '\\' + video_files[i]
-        video_name = os.path.join(videos_dir, video_files[i])
-        frame_rate = get_frame_rate(video_name)
+    if (records_name
+        and os.path.splitext(records_name)[-1].lower() not in RECORD_FORMATS):
+        print('The extension of the records file '
+              'is invalid or not supported.')
+        return
 
-        single_report = quality_check(
-            sub_file,
-            video_name=video_name,
-            sc_dir=sc_dir,
-            shot_changes=shot_changes,
-            CPS=CPS,
-            CPS_limit=CPS_limit,
-            CPS_spaces=CPS_spaces,
-            CPL=CPL,
-            CPL_limit=CPL_limit,
-            frame_rate=frame_rate,
-            max_lines=max_lines,
-            min_duration=min_duration,
-            max_duration=max_duration,
-            ellipses=ellipses,
-            gaps=gaps,
-            batch=True,
-            report=report,
-            old=old,
-            glyph_list=glyph_list,
-            check_TCFOL=check_TCFOL,
-            check_OST=check_OST,
-            GUI=GUI
-        )
+    if cache_name:
+        cache = VideoCache(cache_name)
+    else:
+        cache = None
 
-        if report or GUI:
-            report_cont.append(single_report)
-            report_cont.append('\n\n')
-        else:
-            print('\n', '-'*70)
+    if incremental:
+        check_cache = CheckCache(cache_name)
+    else:
+        check_cache = None
+
+    jobs = [(os.path.join(files_dir, sub_file),
+             os.path.join(videos_dir, video_files[i]))
+            for i, sub_file in enumerate(sub_files)]
+
+    results = iter_jobs(
+        check_batch_file,
+        jobs,
+        workers=workers,
+        threads=threads,
+        progress=progress,
+        cache=cache,
+        check_cache=check_cache,
+        sc_dir=sc_dir,
+        shot_changes=shot_changes,
+        CPS=CPS,
+        CPS_limit=CPS_limit,
+        CPS_spaces=CPS_spaces,
+        CPL=CPL,
+        CPL_limit=CPL_limit,
+        max_lines=max_lines,
+        min_duration=min_duration,
+        max_duration=max_duration,
+        ellipses=ellipses,
+        gaps=gaps,
+        report=report,
+        old=old,
+        glyph_list=glyph_list,
+        check_TCFOL=check_TCFOL,
+        check_OST=check_OST,
+        GUI=GUI
+    )
 
-    os.chdir(current_dir)
+    # The report is written to the sinks one file at a time,
+    # as soon as every file (and all the ones before it) is checked.
+    sinks = []
+    report_cont = None
 
     if report:
-        with open(report_name, 'w', encoding='utf-8-sig') as report_file:
-            for line in report_cont:
-                report_file.write(line)
-                report_file.write('\n')
+        sinks.append(FileReportSink(report_name))
+
+    if sink is not None and (report or GUI):
+        sinks.append(sink)
+    elif report or GUI:
+        report_cont = ListReportSink()
+        sinks.append(report_cont)
+
+    if records_name:
+        record_sink = open_record_sink(records_name)
+    else:
+        record_sink = None
+
+    try:
+        for report_sink in sinks:
+            report_sink.write_lines(header)
+
+        for i, (checked, error) in enumerate(results):
+            sub_file = sub_files[i]
+
+            if error is not None:
+                single_report = f'\n\n\tCould not check the file ({error!r}).'
+                file_records = [
+                    Issue(f'Could not check the file ({error!r}).',
+                          rule='file').record(jobs[i][0])
+                ]
+            else:
+                single_report, file_records = checked
+
+            if record_sink is not None:
+                record_sink.write_records(file_records)
+
+            if report or GUI:
+                section = [
+                    '-'*120,
+                    '\n',
+                    sub_file,
+                    '\n',
+                    single_report,
+                    '\n\n'
+                ]
+
+                for report_sink in sinks:
+                    report_sink.write_lines(section)
+
+            else:
+                print(sub_file)
+                print('\n')
+
+                if error is not None:
+                    print(single_report)
+
+                print('\n', '-'*70)
+
+            if cancel is not None and cancel.is_set():
+                break
+
+    finally:
+        results.close()
+
+        for report_sink in sinks:
+            report_sink.close()
+
+        if record_sink is not None:
+            record_sink.close()
 
-    return report_cont
+    if report_cont is not None:
+        return report_cont.lines
+
+
+def check_batch_file(file_name, video_name, cache=None, **kwargs):
+    """Quality check of one file of batch_quality_check(),
+    with the frame rate of its video.
+    At the module level so that it can run in a worker process.
+
+    Parameters
+    ----------
+    file_name : str
+    video_name : str
+    cache : VideoCache, optional
+        Where to look up the frame rate of the video, by default None
+    kwargs
+        The rest of the arguments of quality_check().
+
+    Returns
+    -------
+    tuple
+        (report, records), the report of the file
+        and its issue records.
+    """
+
+    if cache is not None:
+        frame_rate = cache.get_frame_rate(video_name)
+    else:
+        frame_rate = get_frame_rate(video_name)
+
+    records = []
+    single_report = quality_check(file_name, video_name=video_name,
+                                  frame_rate=frame_rate, batch=True,
+                                  cache=cache, records=records, **kwargs)
+
+    return single_report, records
   
 
 def quality_check(file_name, video_name='', sc_dir='', shot_changes=True,
@@ -212,22 +376,12 @@ def quality_check(file_name, video_name='', sc_dir='', shot_changes=True,
                   max_duration=7, ellipses=True, gaps=True, batch=False,
                   report=False, report_name='', old=True,
                   glyphs=False, glyph_list=[], check_TCFOL=True, check_OST=True,
-                  GUI=True):
+                  GUI=True, cache=None, check_cache=None, records=None):
 
     # print(f'Currently checking {file_name}')
     ext = os.path.splitext(file_name)[-1]
 
-    if ext == '.vtt':
-        if old:
-            subs = decode_VTT(read_text_file(file_name),
-                            frame_rate=frame_rate)['subtitles']
-        else:
-            subs = parse_VTT(file_name, frame_rate=frame_rate)['cues']
-
-    elif ext == '.srt':
-        subs = decode_SRT(read_text_file(file_name), frame_rate=frame_rate)
-
-    else:
+    if ext not in ['.vtt', '.srt']:
         print(
             f'File format {ext} is invalid or not currently supported.'
             f'Operation aborted.'
@@ -239,70 +393,384 @@ def quality_check(file_name, video_name='', sc_dir='', shot_changes=True,
             print('Cannot check shot changes if video name is not passed.')
             return
         else:
-            hash_name = hash_file(video_name)
-            sc_name = sc_dir + '\\' + hash_name + '.scenechanges'
+            if cache is not None:
+                hash_name = cache.get_hash(video_name)
+            else:
+                hash_name = hash_file(video_name)
+
+            sc_name = os.path.join(sc_dir, hash_name + '.scenechanges')
         
-        sc_list = read_text_file(sc_name)
+        sc_list = load_shot_change_index(sc_name, frame_rate=frame_rate,
+                                         cache=cache, hash_name=hash_name)
+
+    else:
+        sc_list = None
+
+    settings = {
+        'CPS': CPS,
+        'CPS_limit': CPS_limit,
+        'CPS_spaces': CPS_spaces,
+        'CPL': CPL,
+        'CPL_limit': CPL_limit,
+        'frame_rate': frame_rate,
+        'max_lines': max_lines,
+        'min_duration': min_duration,
+        'max_duration': max_duration,
+        'ellipses': ellipses,
+        'gaps': gaps,
+        'old': old,
+        'glyphs': glyphs,
+        'glyph_list': glyph_list,
+        'check_TCFOL': check_TCFOL,
+        'check_OST': check_OST
+    }
+
+    if check_cache is not None:
+        general, warnings = check_file_incremental(
+            file_name, check_cache, sc_list=sc_list, **settings)
+    else:
+        subs = read_subtitles(file_name, frame_rate=frame_rate, old=old)
+        general, warnings = check_subs(subs, sc_list=sc_list, **settings)
+
+    # The report is made from the same records
+    # that are written to the records file.
+    file_records = issue_records(general, warnings, os.fspath(file_name))
+    single_rep = format_records(file_records)
+
+    if records is not None:
+        records.extend(file_records)
 
-        for m in range(len(sc_list)):
-            sc_list[m] = float(sc_list[m].strip())
+    # The report is empty if there are no issues or warnings.
+    if single_rep:
+        
+        if not report and not GUI:
+            # print('Here')
+            print(single_rep)
+
+        elif GUI or (report and batch):
+            # print('There')
+            return single_rep
+
+        elif report and not batch:
+            pass
+
+    else:
+        return('\n\n\tNo issues found.')
+        # print('\n\n\tNo issues found.')
+
+
+def read_subtitles(file_name, frame_rate=24, old=True):
+    """The subtitles of a WebVTT or SubRip file.
+
+    Parameters
+    ----------
+    file_name : str
+    frame_rate : float, optional
+        By default 24
+    old : bool, optional
+        Whether to parse WebVTT files with decode_VTT()
+        instead of parse_VTT(), by default True
+
+    Returns
+    -------
+    list
+    """
+
+    ext = os.path.splitext(file_name)[-1]
+
+    if ext == '.vtt':
+        if old:
+            return PARSE_CACHE.parse(file_name, frame_rate=frame_rate,
+                                     old=True)['subtitles']
+        else:
+            return PARSE_CACHE.parse(file_name, frame_rate=frame_rate)['cues']
+
+    elif ext == '.srt':
+        return decode_SRT(read_text_file(file_name), frame_rate=frame_rate)
+
+
+def check_file_incremental(file_name, check_cache, sc_list=None, **settings):
+    """Issues of one file, reusing what can be reused
+    from the last time it was checked.
+
+    If neither the file nor the settings (shot changes included)
+    have changed, the last issues are returned without parsing it.
+    If only the file has changed, only the subtitles whose
+    fingerprint (see cue_fingerprints()) is new are checked again,
+    and the issues of the rest are taken from the last check.
+
+    Parameters
+    ----------
+    file_name : str
+    check_cache : CheckCache
+    sc_list : ShotChangeIndex, optional
+        By default None
+    settings
+        The settings of the checks, as passed to check_subs().
+
+    Returns
+    -------
+    tuple
+        (general, warnings), as from check_subs().
+    """
+
+    file_hash = hash_contents(file_name)
+
+    if sc_list is not None:
+        shot_frames = (array('q', sc_list.frames_s).tobytes()
+                       + array('q', sc_list.frames_r).tobytes())
+    else:
+        shot_frames = None
+
+    # NOTE: The frame rate is a float in the fingerprint,
+    #       so that 24 and 24.0 (as read from the cache) are the same.
+    key_settings = dict(settings, frame_rate=float(settings['frame_rate']))
+    settings_hash = hashlib.blake2b(
+        repr((CHECK_CACHE_VERSION, sorted(key_settings.items()),
+              shot_frames)).encode(),
+        digest_size=16
+    ).hexdigest()
+
+    previous = check_cache.get(file_name)
+
+    if previous is not None and previous[:2] == (file_hash, settings_hash):
+        return previous[2]
+
+    if previous is not None and previous[1] == settings_hash:
+        previous_issues = previous[3]
+    else:
+        previous_issues = {}
+
+    subs = read_subtitles(file_name, frame_rate=settings['frame_rate'],
+                          old=settings['old'])
+    table = CueTable(subs, frame_rate=settings['frame_rate'])
+    fingerprints = cue_fingerprints(subs, table, gaps=settings['gaps'])
+
+    rows = [i for i, fingerprint in enumerate(fingerprints)
+            if fingerprint not in previous_issues]
+    new_issues = check_cues(subs, table=table, sc_list=sc_list, rows=rows,
+                            **settings)
+
+    cue_issues = [new_issues[i] if i in new_issues
+                  else previous_issues[fingerprint]
+                  for i, fingerprint in enumerate(fingerprints)]
+
+    issues = merge_cue_issues(cue_issues)
+
+    check_cache.put(file_name, file_hash, settings_hash, issues,
+                    dict(zip(fingerprints, cue_issues)))
+
+    return issues
+
+
+def cue_fingerprints(subs, table, gaps=True):
+    """Fingerprint of everything the checks of each subtitle depend on,
+    other than the settings: its own number, text, position
+    and times, and the invalid gaps to the subtitles after it,
+    which are all that its gap issues depend on from the others.
+
+    Two subtitles with the same fingerprint, checked
+    with the same settings, have the same issues.
+
+    Parameters
+    ----------
+    subs : list
+    table : CueTable
+        Of the same subtitles.
+    gaps : bool, optional
+        Whether the gaps are checked, by default True
+
+    Returns
+    -------
+    list
+        One fingerprint per subtitle.
+    """
+
+    fingerprints = []
+
+    for i, sub in enumerate(subs):
+        if gaps:
+            cue_gaps = [gap for j, gap in table.get_gaps(i)]
+        else:
+            cue_gaps = None
+
+        state = (sub.number, sub.text, sub.untagged_text, sub.line,
+                 sub.start_time.total_seconds, sub.end_time.total_seconds,
+                 sub.CPS, sub.CPS_ns, sub.dialogue, sub.total_length,
+                 cue_gaps)
+
+        fingerprints.append(
+            hashlib.blake2b(repr(state).encode(), digest_size=16).hexdigest())
+
+    return fingerprints
+
+
+def check_subs(subs, table=None, sc_list=None, **kwargs):
+    """Runs the quality checks on the subtitles of one file.
+
+    Parameters
+    ----------
+    subs : list
+        The subtitles (cues) of the file.
+    table : CueTable, optional
+        Used by the gap checks. Built from the subtitles
+        if not passed, by default None
+    sc_list : ShotChangeIndex or list, optional
+        Shot changes (in seconds if it's a list). The shot changes
+        are only checked if they are passed, by default None
+    kwargs
+        The settings of the checks, the same as in quality_check().
+
+    Returns
+    -------
+    tuple
+        (general, warnings), dictionaries with the issue messages
+        keyed by '{subtitle number}_{issue number}'.
+    """
+
+    return merge_cue_issues(
+        check_cues(subs, table=table, sc_list=sc_list, **kwargs).values())
+
+
+def merge_cue_issues(cue_issues):
+    """Puts together the issues of every subtitle, in order,
+    into the dictionaries of the whole file.
+
+    Updating them with the issues of one subtitle after the other
+    gives the same keys, order and values as adding the issues
+    one by one, including when two subtitles share a key.
+
+    Parameters
+    ----------
+    cue_issues : iterable
+        (general, warnings) of every subtitle, as from check_cues().
+
+    Returns
+    -------
+    tuple
+        (general, warnings)
+    """
 
     general = {}
     warnings = {}
 
-    for i, sub in enumerate(subs):
+    for cue_general, cue_warnings in cue_issues:
+        general.update(cue_general)
+        warnings.update(cue_warnings)
+
+    return general, warnings
+
+
+def check_cues(subs, table=None, sc_list=None, CPS=True, CPS_limit=25,
+               CPS_spaces=False, CPL=True, CPL_limit=42, frame_rate=24,
+               max_lines=2, min_duration=0.833, max_duration=7,
+               ellipses=True, gaps=True, old=True, glyphs=False,
+               glyph_list=[], check_TCFOL=True, check_OST=True, rows=None):
+    """Runs the quality checks on some or all of the subtitles
+    of one file, keeping the issues of each subtitle apart.
+
+    The duration of every subtitle is only calculated once,
+    and the CueTable is only built for the gap checks.
+
+    Parameters
+    ----------
+    subs : list
+        The subtitles (cues) of the file.
+    table : CueTable, optional
+        Built from the subtitles if not passed, by default None
+    sc_list : ShotChangeIndex or list, optional
+        Shot changes (in seconds if it's a list). The shot changes
+        are only checked if they are passed, by default None
+    rows : iterable, optional
+        Indexes of the subtitles to check, in order.
+        All of them if not passed, by default None
+
+    The rest of the parameters are the same as in quality_check().
+
+    Returns
+    -------
+    dict
+        (general, warnings) for every subtitle checked, keyed by index,
+        with the issues found in that subtitle.
+    """
+
+    # Only the gap checks use the table.
+    if table is None and gaps:
+        table = CueTable(subs, frame_rate=frame_rate)
+
+    if sc_list is not None:
+        sc_list = get_shot_change_index(sc_list, frame_rate=frame_rate)
+
+    if rows is None:
+        rows = range(len(subs))
+
+    cue_issues = {}
+
+    for i in rows:
+        sub = subs[i]
+        general = {}
+        warnings = {}
         error_counter = 1
+        duration = sub.get_duration()
 
         # Check CPS.
-        if (CPS
-            and ((not CPS_spaces and sub.CPS_ns > CPS_limit)
-                 or (CPS_spaces and sub.CPS > CPS_limit))):
-
+        if CPS:
             if not CPS_spaces:
                 sub_CPS = sub.CPS_ns
             else:
                 sub_CPS = sub.CPS
 
-            general[f'{sub.number}_{error_counter}'] = (
-                f'Reading speed limit exceeded ({sub_CPS} CPS)')
+            if sub_CPS > CPS_limit:
+                general[f'{sub.number}_{error_counter}'] = Issue(
+                    f'Reading speed limit exceeded ({sub_CPS} CPS)',
+                    sub.number, 'CPS', sub_CPS, CPS_limit)
 
-            error_counter += 1
+                error_counter += 1
 
         # Check CPL.
-        for j, length in enumerate(sub.line_lengths):
-            if (CPL and length > CPL_limit):
-                general[f'{sub.number}_{error_counter}'] = (
-                    f'Line length limit exceeded '
-                    f'(line {j+1}: {sub.line_lengths[j]} characters)'
-                )
+        if CPL:
+            for j, length in enumerate(sub.line_lengths):
+                if length > CPL_limit:
+                    general[f'{sub.number}_{error_counter}'] = Issue(
+                        f'Line length limit exceeded '
+                        f'(line {j+1}: {sub.line_lengths[j]} characters)',
+                        sub.number, 'CPL', length, CPL_limit
+                    )
 
-                error_counter += 1
+                    error_counter += 1
 
         # Check number of lines.
         # NOTE: With the new parser, this can be done
         #       with the length of the untagged text.
-        if ((old and len(sub.text) > max_lines)
-            or (not old and len(sub.untagged_text) > max_lines)):
-            general[f'{sub.number}_{error_counter}'] = (
-                f'Maximum number of lines exceeded ({len(sub.untagged_text)} lines)'
+        if old:
+            too_many_lines = len(sub.text) > max_lines
+        else:
+            too_many_lines = len(sub.untagged_text) > max_lines
+
+        if too_many_lines:
+            general[f'{sub.number}_{error_counter}'] = Issue(
+                f'Maximum number of lines exceeded ({len(sub.untagged_text)} lines)',
+                sub.number, 'max_lines', len(sub.untagged_text), max_lines
             )
 
             error_counter += 1
 
         # Check minimum duration.
-        if sub.get_duration() < min_duration:
-            general[f'{sub.number}_{error_counter}'] = (
+        if duration < min_duration:
+            general[f'{sub.number}_{error_counter}'] = Issue(
                 f'Subtitle lasts less than the minimum duration '
-                f'({sub.get_duration()} seconds)'
+                f'({duration} seconds)',
+                sub.number, 'min_duration', duration, min_duration
             )
 
             error_counter += 1
 
         # Check maximum duration.
-        if sub.get_duration() > max_duration:
-            general[f'{sub.number}_{error_counter}'] = (
+        if duration > max_duration:
+            general[f'{sub.number}_{error_counter}'] = Issue(
                 f'Subtitle exceeds the maximum duration '
-                f'({sub.get_duration()} seconds)'
+                f'({duration} seconds)',
+                sub.number, 'max_duration', duration, max_duration
             )
 
             error_counter += 1
@@ -310,18 +778,19 @@ def quality_check(file_name, video_name='', sc_dir='', shot_changes=True,
         # Check if text fits in one line.
         if (check_TCFOL and len(sub.untagged_text) > 1
             and sub.total_length < CPL_limit and not sub.dialogue):
-            #
-            general[f'{sub.number}_{error_counter}'] = (
-                f'Text can fit in one line'
+            general[f'{sub.number}_{error_counter}'] = Issue(
+                f'Text can fit in one line',
+                sub.number, 'one_line', sub.total_length, CPL_limit
             )
 
             error_counter += 1
 
         # Check ellipses.
         if ellipses and '...' in sub.text:
-            general[f'{sub.number}_{error_counter}'] = (
+            general[f'{sub.number}_{error_counter}'] = Issue(
                 f'Subtitle uses three dots (...) '
-                f'instead of ellipsis character (…)'
+                f'instead of ellipsis character (…)',
+                sub.number, 'ellipses'
             )
             
             error_counter += 1
@@ -330,41 +799,26 @@ def quality_check(file_name, video_name='', sc_dir='', shot_changes=True,
             for line in sub.untagged_text:
                 for char in line:
                     if char not in glyph_list:
-                        general[f'{sub.number}_{error_counter}'] = (
-                            f'Invalid character (char).'
+                        general[f'{sub.number}_{error_counter}'] = Issue(
+                            f'Invalid character (char).',
+                            sub.number, 'glyphs', char
                         )
 
                         error_counter += 1
 
-        # # NOTE: There is another loop above.
-        # #       Having two loops don't really seem very efficient.
-        # #       Now that the WebVTT class has the text attribute
-        # #       as a single string, this can be done without a loop.
-        # for line in sub.text:
-        #     if ellipses and '...' in line:
-        #         general[f'{sub.number}_{error_counter}'] = (
-        #             f'Subtitle uses three dots (...) '
-        #             f'instead of ellipsis character (…)'
-        #         )
-                
-        #         error_counter += 1
-        
         # Check gaps.
+        # NOTE: Updating the dictionaries in place keeps the order
+        #       and the values that merging them into new ones gave,
+        #       without copying all the issues for every subtitle.
         if gaps:
-            # Only for debugging purposes
-            # if i == 73:
-            #     hello = 2
-            gap_errors = check_gaps_one(i, subs, error_counter=error_counter)
+            gap_errors = check_gaps_one(i, subs, error_counter=error_counter,
+                                        table=table)
 
             if gap_errors:
-                general = {**general, **gap_errors}
+                general.update(gap_errors)
 
         # Check shot changes.
-        if shot_changes:
-            # Only for debugging purposes
-            # if i == 26:
-            #     hello = 2
-
+        if sc_list is not None:
             shot_errors, shot_warnings = check_shot_changes(
                 sub.start_time,
                 sub.end_time,
@@ -376,27 +830,27 @@ def quality_check(file_name, video_name='', sc_dir='', shot_changes=True,
             )
 
             if shot_errors:
-                general = {**general, **shot_errors}
+                general.update(shot_errors)
             if shot_warnings:
-                warnings = {**warnings, **shot_warnings}
+                warnings.update(shot_warnings)
 
         if check_OST:
-            check_text = ' '.join(sub.untagged_text)
+            OST_kind = OSTKind.classify(sub.untagged_text)
             if sub.line == 20:
-                if (not re.search('^\[.+\]$', check_text)
-                    or check_text.upper() != check_text):
+                if OST_kind is not OSTKind.VALID:
                     # Error in OST
-                    general[f'{sub.number}_{error_counter}'] = (
-                        f'Error in OST'
+                    general[f'{sub.number}_{error_counter}'] = Issue(
+                        f'Error in OST',
+                        sub.number, 'OST'
                     )
                     error_counter += 1
 
             else:
-                if (re.search('^\[.+\]$', check_text)
-                    and check_text.upper() != check_text):
+                if OST_kind is OSTKind.LOWERCASE:
                     # Possible OST not raised.
-                    warnings[f'{sub.number}_{error_counter}'] = (
-                        f'Possible OST not raised to the top of the screen.'
+                    warnings[f'{sub.number}_{error_counter}'] = Issue(
+                        f'Possible OST not raised to the top of the screen.',
+                        sub.number, 'OST_position', sub.line
                     )
                     error_counter += 1
 
@@ -428,65 +882,109 @@ def quality_check(file_name, video_name='', sc_dir='', shot_changes=True,
                 #     )
                 #     error_counter += 1
 
+        cue_issues[i] = (general, warnings)
 
+    return cue_issues
 
-    single_rep = ''
-    
-    # If there are errors...
-    if general:
-        single_rep += '- Issues\n\n\t#\t\t\tIssue description\n\n'
 
-        for key in list(general.keys()):
-            current_line = '\t'
-            actual_key = re.search('\d+', key).group()
-            current_line += actual_key
+def format_issues(general, warnings):
+    """Text of the report for one file
+    with the issues and warnings found by check_subs().
 
-            if len(actual_key) > 3:
-                current_line += '\t\t'
-            else:
-                current_line += '\t\t\t'
+    Parameters
+    ----------
+    general : dict
+    warnings : dict
+
+    Returns
+    -------
+    str
+    """
+
+    return format_records(issue_records(general, warnings))
+
+
+def issue_records(general, warnings, file_name=''):
+    """The issues and warnings found by check_subs(), as records
+    (see classes.Issue.record()), in the order of the report:
+    first the issues and then the warnings.
+
+    Parameters
+    ----------
+    general : dict
+    warnings : dict
+    file_name : str, optional
+        File the issues were found in, by default ''
+
+    Returns
+    -------
+    list
+    """
 
-            current_line += general[key]
-            single_rep += current_line + '\n'
+    records = [issue.record(file_name, 'error')
+               for issue in general.values()]
+    records.extend(issue.record(file_name, 'warning')
+                   for issue in warnings.values())
+
+    return records
+
+
+def format_records(records):
+    """Text of the report for one file from its issue records.
+
+    Parameters
+    ----------
+    records : list
+        As from issue_records().
+
+    Returns
+    -------
+    str
+    """
+
+    errors = [record for record in records if record['severity'] == 'error']
+    warnings = [record for record in records
+                if record['severity'] == 'warning']
+
+    report_lines = []
+    
+    # If there are errors...
+    if errors:
+        report_lines.append('- Issues\n\n\t#\t\t\tIssue description\n\n')
+        report_lines.extend(format_issue_lines(errors))
 
     # If there are warnings...
     if warnings:
-        single_rep += '\n\n- Warnings\n\n\t#\t\t\tWarning\n\n'
+        report_lines.append('\n\n- Warnings\n\n\t#\t\t\tWarning\n\n')
+        report_lines.extend(format_issue_lines(warnings))
 
-        for key in list(warnings.keys()):
-            current_line = '\t'
-            actual_key = re.search('\d+', key).group()
-            current_line += actual_key
+    return ''.join(report_lines)
 
-            if len(actual_key) > 3:
-                current_line += '\t\t'
-            else:
-                current_line += '\t\t\t'
 
-            current_line += warnings[key]
-            single_rep += current_line + '\n'
+def format_issue_lines(records):
+    """One report line (subtitle number and message) per issue record.
+    """
 
-    if general or warnings:
-        
-        if not report and not GUI:
-            # print('Here')
-            print(single_rep)
+    issue_lines = []
 
-        elif GUI or (report and batch):
-            # print('There')
-            return single_rep
+    for record in records:
+        number = str(record['number'])
+
+        if len(number) > 3:
+            separator = '\t\t'
+        else:
+            separator = '\t\t\t'
+
+        issue_lines.append(f'\t{number}{separator}{record["message"]}\n')
+
+    return issue_lines
 
-        elif report and not batch:
-            pass
 
-    else:
-        return('\n\n\tNo issues found.')
-        # print('\n\n\tNo issues found.')
 
 
 def check_gaps_one(index, subtitles, invalid_range=(3,11), error_counter=1,
                    frame_rate=24, sorted=False, snapped=False,
-                   fix=False, ext_q=False, off_forward=False):
+                   fix=False, ext_q=False, off_forward=False, table=None):
     """[summary]
 
     NOTE: Make sure to review the calls to this function
@@ -510,6 +1008,11 @@ def check_gaps_one(index, subtitles, invalid_range=(3,11), error_counter=1,
         [description], by default False
     snapped : bool, optional
         [description], by default False
+    table : CueTable, optional
+        Columns of the same subtitles. When passed, only the
+        subtitles that start right after this one ends are compared
+        instead of all of them. Not used when fixing,
+        because the fixes change the times, by default None
 
     Returns
     -------
@@ -520,6 +1023,20 @@ def check_gaps_one(index, subtitles, invalid_range=(3,11), error_counter=1,
     
     gap_errors = {}
 
+    if table is not None and not fix:
+        for j, gap in table.get_gaps(index, invalid_range, snapped):
+            if gap == 1:
+                error_message = f'Invalid gap ({gap} frame)'
+            else:
+                error_message = f'Invalid gap ({gap} frames)'
+
+            gap_errors[f'{subtitles[index].number}_{error_counter}'] = Issue(
+                error_message, subtitles[index].number, 'gap', gap)
+
+            error_counter += 1
+
+        return gap_errors
+
     for j in range(len(subtitles)):
         
         if j != index:
@@ -566,8 +1083,9 @@ def check_gaps_one(index, subtitles, invalid_range=(3,11), error_counter=1,
                         error_message = f'Invalid gap ({gap} frames)'
 
                     gap_errors[
-                        f'{subtitles[index].number}_{error_counter}'] = (
-                            error_message)
+                        f'{subtitles[index].number}_{error_counter}'] = Issue(
+                            error_message, subtitles[index].number,
+                            'gap', gap)
 
                     error_counter += 1
 
@@ -580,10 +1098,136 @@ def check_gaps_one(index, subtitles, invalid_range=(3,11), error_counter=1,
         return gap_errors
 
 
+def load_shot_change_index(sc_name, frame_rate=24, cache=None,
+                           hash_name=None):
+    """Reads a .scenechanges file into a ShotChangeIndex,
+    or reuses the one already read if the file hasn't changed.
+
+    If the file has an up-to-date binary companion
+    for the same video, at the same frame rate,
+    the index is read from it instead.
+
+    Parameters
+    ----------
+    sc_name : str
+        Name of the .scenechanges file.
+    frame_rate : float, optional
+        By default 24
+    cache : VideoCache, optional
+        Persistent cache to take the times from
+        when they were read in a previous run, by default None
+    hash_name : str, optional
+        hash_file() of the video. The binary companion
+        is only used when it was written for this hash,
+        by default None
+
+    Returns
+    -------
+    ShotChangeIndex
+    """
+
+    index = load_binary_shot_change_index(sc_name, frame_rate=frame_rate,
+                                          hash_name=hash_name)
+
+    if index is not None:
+        return index
+
+    file_stat = os.stat(sc_name)
+    key = (os.path.abspath(sc_name), frame_rate)
+    stamp = (file_stat.st_size, file_stat.st_mtime_ns)
+
+    if key in SHOT_CHANGE_INDEXES and SHOT_CHANGE_INDEXES[key][0] == stamp:
+        return SHOT_CHANGE_INDEXES[key][1]
+
+    if cache is not None:
+        sc_list = cache.get_shot_changes(sc_name)
+    else:
+        sc_list = read_shot_changes(sc_name)
+
+    index = ShotChangeIndex(sc_list, frame_rate=frame_rate)
+    SHOT_CHANGE_INDEXES[key] = (stamp, index)
+
+    return index
+
+
+def load_binary_shot_change_index(sc_name, frame_rate=24, hash_name=None):
+    """Reads the binary companion of a .scenechanges file
+    (name.scenechanges.bin) into a ShotChangeIndex.
+
+    Parameters
+    ----------
+    sc_name : str
+        Name of the .scenechanges file.
+    frame_rate : float, optional
+        By default 24
+    hash_name : str, optional
+        hash_file() of the video, by default None
+
+    Returns
+    -------
+    ShotChangeIndex or None
+        None if the hash of the video is not passed,
+        if there is no binary file, if it is older
+        than the .scenechanges file, if it is invalid,
+        or if it is for another video or another frame rate.
+    """
+
+    # NOTE: Without the hash, a binary file left
+    #       from another video couldn't be told apart.
+    if not hash_name:
+        return None
+
+    bin_name = os.fspath(sc_name) + SCENE_CHANGES_BINARY_EXT
+
+    if not os.path.exists(bin_name):
+        return None
+
+    if (os.path.exists(sc_name)
+        and os.stat(sc_name).st_mtime_ns > os.stat(bin_name).st_mtime_ns):
+        return None
+
+    try:
+        bin_frame_rate, bin_hash_name, frames_s, frames_r = (
+            read_binary_shot_changes(bin_name))
+    except ValueError:
+        return None
+
+    if bin_frame_rate != frame_rate or bin_hash_name != hash_name:
+        return None
+
+    return ShotChangeIndex.from_frames(frames_s, frames_r,
+                                      frame_rate=frame_rate)
+
+
+def get_shot_change_index(shot_change_list, frame_rate=24):
+    """The ShotChangeIndex for a list of shot changes in seconds.
+    An index with the same frame rate is returned as it is.
+
+    Parameters
+    ----------
+    shot_change_list : ShotChangeIndex or list
+    frame_rate : float, optional
+        By default 24
+
+    Returns
+    -------
+    ShotChangeIndex
+    """
+
+    if (isinstance(shot_change_list, ShotChangeIndex)
+        and shot_change_list.frame_rate == frame_rate):
+        return shot_change_list
+
+    return ShotChangeIndex(list(shot_change_list), frame_rate=frame_rate)
+
+
 def check_shot_changes(start_time, end_time, sub_num,
                        subtitle, shot_change_list,
                        frame_rate=24, error_counter=1):
 
+    shot_change_list = get_shot_change_index(
+        shot_change_list, frame_rate=frame_rate)
+
     # NOTE: Change this depending on how 25 fps is treated.
     half_second = frame_rate // 2
 
@@ -681,7 +1325,30 @@ def nearest_shot_change(shot_change_list, time, frame_rate=24,
         [description]
     """
     
+    shot_change_list = get_shot_change_index(
+        shot_change_list, frame_rate=frame_rate)
+    shot_frames = shot_change_list.frames_s
+
+    # Most times are not near any shot change.
+    # See that first with a binary search over the frames
+    # for the window that the search below is looking for.
+    if gaps:
+        window_start = time - half_second - 2
+    else:
+        window_start = time - half_second
+
+    if end_time:
+        window_end = time + half_second + 1
+    else:
+        window_end = time + half_second
+
+    if not shot_change_list.any_between(window_start, window_end):
+        return None
+
     # Variables for the binary search.
+    # NOTE: This search is kept as it is, instead of bisecting,
+    #       because the shot change it finds first sets the order
+    #       in which check_near_shot_changes() reports them.
     low = 0
     high = len(shot_change_list) - 1
     mid = 0
@@ -694,9 +1361,7 @@ def nearest_shot_change(shot_change_list, time, frame_rate=24,
         mid = (high + low) // 2
 
         # NOTE: Careful here.  See that the snapped frame is being used.
-        mid_frame = Timecode(
-            shot_change_list[mid],
-            frame_rate=frame_rate).total_rendered_frames_s
+        mid_frame = shot_frames[mid]
 
         # See if the time is at least half a second
         # past the currently checked shot change
@@ -745,19 +1410,26 @@ def check_near_shot_changes(sub_num, first_found, time, shot_change_list,
         [description], by default False
     """
 
+    shot_change_list = get_shot_change_index(
+        shot_change_list, frame_rate=frame_rate)
+    shot_frames = shot_change_list.frames_r
+
     near_list = []
     shot_messages = {}
     half_second = frame_rate // 2
 
+    if end_time:
+        shot_rule = 'shot_change_end'
+    else:
+        shot_rule = 'shot_change_start'
+
     search_back = True
     search_ind = first_found
     on_shot_start_right = False
     on_shot_end_right = False
 
     while True:
-        shot_frame = Timecode(
-            shot_change_list[search_ind],
-            frame_rate=frame_rate).total_rendered_frames_r
+        shot_frame = shot_frames[search_ind]
 
         frame_diff = time - shot_frame
 
@@ -781,7 +1453,8 @@ def check_near_shot_changes(sub_num, first_found, time, shot_change_list,
                     f'The subtitle starts {plu_sing} a shot change'
                 )
 
-            shot_messages[f'{sub_num}_{error_counter}'] = error_message
+            shot_messages[f'{sub_num}_{error_counter}'] = Issue(
+                error_message, sub_num, shot_rule, frame_diff)
             error_counter += 1
 
         # Start or end time incorrectly before the shot change.
@@ -807,7 +1480,8 @@ def check_near_shot_changes(sub_num, first_found, time, shot_change_list,
                     f'The subtitle starts {plu_sing} a shot change'
                 )
 
-            shot_messages[f'{sub_num}_{error_counter}'] = error_message
+            shot_messages[f'{sub_num}_{error_counter}'] = Issue(
+                error_message, sub_num, shot_rule, frame_diff)
             error_counter += 1
 
         # ONLY TO FIX GAPS.
@@ -897,9 +1571,7 @@ def check_sort(file_name):
 
 def batch_check_sort(directory):
 
-    original_dir = os.getcwd()
-    os.chdir(directory)
-    file_list = os.listdir()
+    file_list = os.listdir(directory)
 
     for fi in file_list:
         name, ext = os.path.splitext(fi)
@@ -907,7 +1579,5 @@ def batch_check_sort(directory):
         if ext == '.vtt':
             print('-', fi)
             print('\n')
-            check_sort(fi)
-            print('\n\n')
-
-    os.chdir(original_dir)
\ No newline at end of file
+            check_sort(os.path.join(directory, fi))
+            print('\n\n')
\ No newline at end of file
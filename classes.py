@@ -1,9 +1,65 @@
 import re
 import html
+from array import array
+from enum import Enum
+from bisect import bisect_left, bisect_right
 
 from exceptions import TimecodeError
 
 
+# Media timecodes as they appear in SRT and WebVTT timestamp lines
+# (HH:MM:SS,mmm, H+:MM:SS.mmm, and MM:SS.mmm), matched in one pass.
+# Group 1 is the hours (None for MM:SS.mmm), group 2 the minutes,
+# group 3 the seconds with their fraction, and group 4 the separator.
+MEDIA_TIME_PATTERN = re.compile(r'^(?:(\d+):)?(\d\d):(\d\d([.,])\d\d\d)$')
+
+# The parts of the text of a subtitle that tell what kind of OST it is
+# (see OSTKind.classify()): an opening bracket at the start,
+# a closing bracket at the end, and punctuation after it.
+# 'capitals' is the text in between when it is one line of capitals.
+# Matched with fullmatch(), so it always matches.
+OST_PATTERN = re.compile(
+    r'(?P<open>\[)?'
+    r'(?:(?P<capitals>[A-ZÀ-Ý ]{2,})|.*?)'
+    r'(?P<close>\])?'
+    r'(?P<after>[.,]*)',
+    re.DOTALL
+)
+
+# Names of the slots of every class copied by _copy_slots(),
+# with the ones of its parent classes.
+_SLOT_NAMES = {}
+
+
+def _copy_slots(obj):
+    """A shallow copy of an object with __slots__ (and maybe
+    a __dict__), without the overhead of copy.copy().
+    """
+
+    cls = type(obj)
+    new = object.__new__(cls)
+    slot_names = _SLOT_NAMES.get(cls)
+
+    if slot_names is None:
+        slot_names = _SLOT_NAMES[cls] = tuple(
+            name for base in cls.__mro__
+            for name in base.__dict__.get('__slots__', ()))
+
+    for name in slot_names:
+        try:
+            setattr(new, name, getattr(obj, name))
+        except AttributeError:
+            # Never set in the original.
+            pass
+
+    # SRT and TTML subtitles keep their own attributes
+    # in a __dict__.
+    if hasattr(obj, '__dict__'):
+        new.__dict__.update(obj.__dict__)
+
+    return new
+
+
 class Timecode(object):
     """
     SRT: 00:00:02,250
@@ -12,6 +68,16 @@ class Timecode(object):
     SMPTE: 00:00:32:21
     """
 
+    # Without a __dict__ for every instance, a file with thousands
+    # of cues takes much less memory (two timecodes per cue).
+    __slots__ = (
+        'time', 'frame_rate', 'time_in_frames', 'drop_frame',
+        'frame_division', 'creation_format', 'hours', 'minutes', 'seconds',
+        'fraction', 'frames', 'total_seconds', 'millis',
+        '_time_for_frames', '_frames_drop_frame', '_frames_s', '_frames_r',
+        '_total_frames'
+    )
+
 
     def __init__(self, time, frame_rate=29.97,
                  time_in_frames=False, drop_frame=True):
@@ -159,32 +225,222 @@ class Timecode(object):
         elif self.creation_format == 'SMPTE':
             time_for_frames = time
 
-        (
-            self.total_counted_frames_s,
-            self.total_rendered_frames_s,
-        ) = self.get_frames(
-            time_for_frames,
-            frame_rate=frame_rate,
-            drop_frame=drop_frame,
-        )
+        self.set_frames(time_for_frames, frame_rate, drop_frame)
 
-        (
-            self.total_counted_frames_r,
-            self.total_rendered_frames_r,
-        ) = self.get_frames(
-            time_for_frames,
-            frame_rate=frame_rate,
-            drop_frame=drop_frame,
-            snapped=False
-        )
 
+    @classmethod
+    def from_vtt(cls, time, frame_rate=29.97, drop_frame=True):
+        """Fast-path constructor for the media timecodes
+        found in WebVTT and SRT timestamp lines.
+
+        Parses the string with the precompiled MEDIA_TIME_PATTERN
+        instead of trying every supported format, and produces
+        the same attributes as Timecode(time, frame_rate=frame_rate).
+        Any other format is passed on to the regular constructor.
+
+        Parameters
+        ----------
+        time : str
+            Timecode like '00:00:22.292', '00:22.292' or '00:00:02,250'.
+        frame_rate : float, optional
+            By default 29.97
+        drop_frame : bool, optional
+            By default True
+
+        Returns
+        -------
+        Timecode
+        """
+
+        match = MEDIA_TIME_PATTERN.match(time)
+
+        # SRT timecodes always have two digits for the hours,
+        # and only WebVTT allows leaving the hours out.
+        if (not match
+            or (match.group(4) == ','
+                and (match.group(1) is None or len(match.group(1)) < 2))):
+            # Frobnicate
+            return cls(time, frame_rate=frame_rate, drop_frame=drop_frame)
+
+        timecode = cls.__new__(cls)
+        timecode.time = time
+        timecode.frame_rate = frame_rate
+        timecode.time_in_frames = False
+        timecode.drop_frame = True
+
+        if drop_frame:
+            timecode.frame_division = ';'
+        else:
+            timecode.frame_division = ':'
+
+        if match.group(1) is None:
+            timecode.creation_format = 'VTT_2'
+            timecode.hours = 0
+        elif match.group(4) == ',':
+            timecode.creation_format = 'SRT'
+            timecode.hours = int(match.group(1))
+        else:
+            timecode.creation_format = 'VTT_1'
+            timecode.hours = int(match.group(1))
+
+        # The seconds are converted exactly as in the constructor
+        # so that the fraction keeps the same floating-point value.
+        seconds = float(match.group(3).replace(',', '.'))
+        timecode.fraction = seconds % 1
+        timecode.minutes = int(match.group(2))
+        timecode.seconds = int(seconds)
+        timecode.frames = round(timecode.fraction * frame_rate)
+
+        if timecode.minutes > 59 or timecode.seconds > 59:
+            raise TimecodeError(f'Invalid timecode: {time}')
+
+        timecode.total_seconds = (
+            timecode.hours * 3600 + timecode.minutes * 60
+            + timecode.seconds + timecode.fraction)
+
+        timecode.set_frames(timecode.total_seconds, frame_rate, drop_frame)
+
+        return timecode
+
+
+    @classmethod
+    def from_srt(cls, time, frame_rate=29.97, drop_frame=True):
+        """Same as from_vtt(), for timecodes like '00:00:02,250'.
+        """
+
+        return cls.from_vtt(time, frame_rate=frame_rate, drop_frame=drop_frame)
+
+
+    @classmethod
+    def from_millis(cls, millis, frame_rate=29.97, drop_frame=True):
+        """Fast-path constructor for an integer number of milliseconds.
+
+        Produces the same attributes as
+        Timecode(millis / 1000, frame_rate=frame_rate),
+        but gets the hours, minutes and seconds
+        with integer arithmetic.
+
+        Parameters
+        ----------
+        millis : int
+        frame_rate : float, optional
+            By default 29.97
+        drop_frame : bool, optional
+            By default True
+
+        Returns
+        -------
+        Timecode
+        """
+
+        time = millis / 1000
+
+        if millis < 0:
+            return cls(time, frame_rate=frame_rate, drop_frame=drop_frame)
+
+        timecode = cls.__new__(cls)
+        timecode.time = time
+        timecode.frame_rate = frame_rate
+        timecode.time_in_frames = False
+        timecode.drop_frame = True
+
+        if drop_frame:
+            timecode.frame_division = ';'
+        else:
+            timecode.frame_division = ':'
+
+        timecode.hours = millis // 3600000
+        timecode.minutes = (millis % 3600000) // 60000
+        timecode.seconds = (millis % 60000) // 1000
+        timecode.fraction = float(time % 1)
+        timecode.frames = round(timecode.fraction * frame_rate)
+        timecode.total_seconds = float(time)
+        timecode.creation_format = 'seconds'
+
+        timecode.set_frames(timecode.total_seconds, frame_rate, drop_frame)
+
+        return timecode
+
+
+    def set_frames(self, time_for_frames, frame_rate, drop_frame):
+        """Stores what the frame attributes are calculated from
+        (counted and rendered, snapped and not snapped)
+        and the time in integer milliseconds.
+
+        The frames themselves are only calculated the first time
+        one of them is read, because most of the timecodes
+        read from a file only need the time in seconds.
+
+        Parameters
+        ----------
+        time_for_frames : float or str
+            The time in seconds, or the SMPTE string.
+        frame_rate : float
+        drop_frame : bool
+        """
+
+        self.millis = round(self.total_seconds * 1000)
+
+        self._time_for_frames = time_for_frames
+        self._frames_drop_frame = drop_frame
+        self._frames_s = None
+        self._frames_r = None
+        self._total_frames = None
+
+
+    @property
+    def total_counted_frames_s(self):
+        if self._frames_s is None:
+            self._frames_s = self.get_frames(
+                self._time_for_frames,
+                frame_rate=self.frame_rate,
+                drop_frame=self._frames_drop_frame,
+            )
+
+        return self._frames_s[0]
+
+
+    @property
+    def total_rendered_frames_s(self):
+        if self._frames_s is None:
+            self.total_counted_frames_s
+
+        return self._frames_s[1]
+
+
+    @property
+    def total_counted_frames_r(self):
+        if self._frames_r is None:
+            self._frames_r = self.get_frames(
+                self._time_for_frames,
+                frame_rate=self.frame_rate,
+                drop_frame=self._frames_drop_frame,
+                snapped=False
+            )
+
+        return self._frames_r[0]
+
+
+    @property
+    def total_rendered_frames_r(self):
+        if self._frames_r is None:
+            self.total_counted_frames_r
+
+        return self._frames_r[1]
+
+
+    @property
+    def total_frames(self):
         # !! NOTE: This value might be counted or rendered,
         #          depending on the timecode passed to the instance.
         #          It would need to be calculated in another function
         #          to get the correct frames—counted or rendered.
         #          See how it's done in get_frames in capspy.
         # !! NOTE: It could be incorrect to just round this value.
-        self.total_frames = round(self.total_seconds * frame_rate)
+        if self._total_frames is None:
+            self._total_frames = round(self.total_seconds * self.frame_rate)
+
+        return self._total_frames
 
 
     def __str__(self):
@@ -467,6 +723,16 @@ class Subtitle(object):
     as well as any other supported formatting.
     """
 
+    __slots__ = (
+        'number', 'text', 'tokenized_text', 'untagged_text', 'start_time',
+        'end_time', 'italics', 'underline', 'line_lengths', 'total_length',
+        'CPS', 'CPS_ns', 'dialogue'
+    )
+
+    # Lists copied by clone() instead of shared with the original
+    # (the timecodes are copied as well).
+    CLONED_LISTS = ('italics', 'underline', 'bold', 'line_lengths')
+
 
     def __init__(self, number, text, tokenized_text, untagged_text,
                  start_time, end_time, italics=[], underline=[]):
@@ -616,6 +882,41 @@ class Subtitle(object):
         return round(CPS, 2)
 
 
+    def clone(self):
+        """A shallow copy of the subtitle, much cheaper than
+        copy.deepcopy() for files with many cues.
+
+        The text, the tokens, the untagged lines and the region
+        are shared with the original, since none of them are modified
+        in place (a cue gets new ones instead).
+        The timecodes are copied, since Timecode.offset() changes them
+        in place (e.g. check_gaps_one() with fix=True), and so are
+        the lists of the subtitle that can be changed in place
+        (italics, underline, bold and line_lengths).
+
+        Returns
+        -------
+        Subtitle
+            Of the same class as the original.
+        """
+
+        new = _copy_slots(self)
+
+        for name in ('start_time', 'end_time'):
+            timecode = getattr(self, name, None)
+
+            if timecode is not None:
+                setattr(new, name, _copy_slots(timecode))
+
+        for name in Subtitle.CLONED_LISTS:
+            value = getattr(self, name, None)
+
+            if type(value) == list:
+                setattr(new, name, list(value))
+
+        return new
+
+
 class SRT(Subtitle):
     """[summary]
 
@@ -814,6 +1115,11 @@ class WebVTT(Subtitle):
     """
     """
 
+    __slots__ = (
+        'identifier', 'region', 'vertical', 'line', 'line_align',
+        'snap_to_lines', 'position', 'position_align', 'size', 'align', 'bold'
+    )
+
 
     def __init__(self, number, text, tokenized_text, untagged_text,
                  start_time, end_time, identifier='', region=None,
@@ -1195,6 +1501,458 @@ class TimestampTag(object):
         self.value = value
 
 
+class CueTable(object):
+    """Timing of all the cues of a file in columns,
+    indexed in parallel with the cue objects, so that the gap checks
+    can go over whole arrays instead of looking up the attributes
+    of every cue and its timecodes.
+
+    Times are in milliseconds and frames are rendered frames,
+    snapped (_s) and not snapped (_r), as in Timecode.
+    """
+
+    __slots__ = (
+        'cues', 'frame_rate', 'start_millis', 'end_millis', '_frames',
+        '_start_orders'
+    )
+
+
+    def __init__(self, cues, frame_rate=24):
+        """
+        Parameters
+        ----------
+        cues : list
+            Subtitle objects (WebVTT cues) from one file.
+        frame_rate : float, optional
+            By default 24
+        """
+
+        self.cues = cues
+        self.frame_rate = frame_rate
+
+        self.start_millis = array('q', [cue.start_time.millis for cue in cues])
+        self.end_millis = array('q', [cue.end_time.millis for cue in cues])
+
+        # The frame columns are only built when a check needs them,
+        # like the frames of the timecodes themselves.
+        self._frames = None
+        self._start_orders = None
+
+
+    def get_frame_columns(self):
+        """Rendered frames of the start and end times,
+        not snapped and snapped, built on first use.
+
+        Returns
+        -------
+        tuple
+            (start_frames_r, end_frames_r, start_frames_s, end_frames_s)
+        """
+
+        if self._frames is None:
+            starts = [cue.start_time for cue in self.cues]
+            ends = [cue.end_time for cue in self.cues]
+
+            self._frames = (
+                array('q', [time.total_rendered_frames_r for time in starts]),
+                array('q', [time.total_rendered_frames_r for time in ends]),
+                array('q', [time.total_rendered_frames_s for time in starts]),
+                array('q', [time.total_rendered_frames_s for time in ends]),
+            )
+
+        return self._frames
+
+
+    @property
+    def start_frames_r(self):
+        return self.get_frame_columns()[0]
+
+
+    @property
+    def end_frames_r(self):
+        return self.get_frame_columns()[1]
+
+
+    @property
+    def start_frames_s(self):
+        return self.get_frame_columns()[2]
+
+
+    @property
+    def end_frames_s(self):
+        return self.get_frame_columns()[3]
+
+
+    def __len__(self):
+        return len(self.cues)
+
+
+    def __repr__(self):
+        return (f'CueTable(<{len(self.cues)} cues>, '
+                f'frame_rate={self.frame_rate})')
+
+
+    def get_start_order(self, snapped=False):
+        """Indices of the cues sorted by start frame,
+        and the start frames in that order.
+        Sorted once and reused by every gap search.
+
+        Parameters
+        ----------
+        snapped : bool, optional
+            Use the snapped frames, by default False
+
+        Returns
+        -------
+        tuple
+            (order, sorted_starts)
+        """
+
+        if self._start_orders is None:
+            self._start_orders = {}
+
+        if snapped not in self._start_orders:
+            if snapped:
+                starts = self.start_frames_s
+            else:
+                starts = self.start_frames_r
+
+            order = sorted(range(len(starts)), key=starts.__getitem__)
+            sorted_starts = array('q', [starts[j] for j in order])
+
+            self._start_orders[snapped] = (order, sorted_starts)
+
+        return self._start_orders[snapped]
+
+
+    def get_gaps(self, index, invalid_range=(3,11), snapped=False):
+        """Invalid gaps between the end of one cue and the start
+        of any other cue, as in checks.check_gaps_one():
+        gaps within the invalid range, or of zero or one frames.
+
+        Instead of comparing the cue with every other cue,
+        only the cues whose start frame falls inside the window
+        after its end frame are looked at (binary search
+        over the sorted start frames).
+
+        Parameters
+        ----------
+        index : int
+        invalid_range : tuple, optional
+            In frames, by default (3,11)
+        snapped : bool, optional
+            Use the snapped frames, by default False
+
+        Returns
+        -------
+        list
+            (other_index, gap) for every invalid gap,
+            sorted by other_index.
+        """
+
+        if snapped:
+            starts = self.start_frames_s
+            end = self.end_frames_s[index]
+        else:
+            starts = self.start_frames_r
+            end = self.end_frames_r[index]
+
+        order, sorted_starts = self.get_start_order(snapped=snapped)
+
+        first = bisect_left(sorted_starts, end + min(0, invalid_range[0]))
+        last = bisect_right(sorted_starts, end + max(1, invalid_range[1]))
+
+        invalid_gaps = []
+
+        for j in sorted(order[first:last]):
+            gap = starts[j] - end
+
+            if (j != index
+                and ((gap >= invalid_range[0] and gap <= invalid_range[1])
+                     or (gap >= 0 and gap < 2))):
+                invalid_gaps.append((j, gap))
+
+        return invalid_gaps
+
+
+    def check_gaps(self, invalid_range=(3,11), snapped=False):
+        """Invalid gaps after every cue (see get_gaps()).
+
+        Parameters
+        ----------
+        invalid_range : tuple, optional
+            In frames, by default (3,11)
+        snapped : bool, optional
+            Use the snapped frames, by default False
+
+        Returns
+        -------
+        list
+            (index, other_index, gap) for every invalid gap,
+            sorted by index and then by other_index.
+        """
+
+        return [(index, j, gap) for index in range(len(self.cues))
+                for j, gap in self.get_gaps(index, invalid_range, snapped)]
+
+
+class ShotChangeIndex(object):
+    """Shot changes of a video (times in seconds, sorted)
+    converted once to rendered frames, snapped (frames_s)
+    and not snapped (frames_r), so that the checks can search them
+    for every cue, and for every file of the same video,
+    without building a Timecode for each shot change they look at.
+
+    Indexing it gives the times in seconds, like the list
+    it was built from.
+
+    The frames can be any sequence of integers, like the arrays
+    read from a binary .scenechanges file (see from_frames()).
+    """
+
+    __slots__ = ('_times', 'frame_rate', 'frames_s', 'frames_r')
+
+
+    def __init__(self, times, frame_rate=24):
+        """
+        Parameters
+        ----------
+        times : list
+            Times of the shot changes in seconds.
+        frame_rate : float, optional
+            By default 24
+        """
+
+        self._times = times
+        self.frame_rate = frame_rate
+
+        timecodes = [Timecode(time, frame_rate=frame_rate) for time in times]
+
+        self.frames_s = array(
+            'q', [timecode.total_rendered_frames_s for timecode in timecodes])
+        self.frames_r = array(
+            'q', [timecode.total_rendered_frames_r for timecode in timecodes])
+
+
+    @classmethod
+    def from_frames(cls, frames_s, frames_r, frame_rate=24):
+        """Index over frames that were already converted,
+        without any Timecode.
+
+        Parameters
+        ----------
+        frames_s : sequence
+            Rendered frames of the shot changes, snapped.
+        frames_r : sequence
+            Rendered frames of the shot changes, not snapped.
+        frame_rate : float, optional
+            By default 24
+
+        Returns
+        -------
+        ShotChangeIndex
+        """
+
+        index = cls.__new__(cls)
+        index._times = None
+        index.frame_rate = frame_rate
+        index.frames_s = frames_s
+        index.frames_r = frames_r
+
+        return index
+
+
+    @property
+    def times(self):
+        # NOTE: Without the original times (from_frames()),
+        #       they are approximated from the frames not snapped.
+        if self._times is None:
+            self._times = [frame / self.frame_rate for frame in self.frames_r]
+
+        return self._times
+
+
+    def __len__(self):
+        return len(self.frames_s)
+
+
+    def __getitem__(self, index):
+        return self.times[index]
+
+
+    def __repr__(self):
+        return (f'ShotChangeIndex(<{len(self)} shot changes>, '
+                f'frame_rate={self.frame_rate})')
+
+
+    def any_between(self, low, high, snapped=True):
+        """Whether there is a shot change after the frame low
+        and before the frame high (both excluded).
+
+        Parameters
+        ----------
+        low : int
+        high : int
+        snapped : bool, optional
+            Use the snapped frames, by default True
+
+        Returns
+        -------
+        bool
+        """
+
+        if snapped:
+            frames = self.frames_s
+        else:
+            frames = self.frames_r
+
+        return bisect_right(frames, low) < bisect_left(frames, high)
+
+
+class Issue(str):
+    """Message of an issue found by the quality check,
+    with what it was found in: the number of the subtitle,
+    the rule it breaks, the value measured and the limit.
+
+    It is the message itself (a str), so the dictionaries
+    of issues can still be compared and printed like before,
+    and the issue records (see record()) are built from it
+    without parsing the message or the key of the dictionary.
+    """
+
+    # NOTE: str subclasses cannot have non-empty __slots__.
+
+
+    def __new__(cls, message, number=None, rule='', value=None, limit=None):
+        """
+        Parameters
+        ----------
+        message : str
+        number : int or str, optional
+            Number of the subtitle, by default None
+        rule : str, optional
+            Name of the rule, like 'CPS' or 'gap', by default ''
+        value : optional
+            What was measured, like the CPS of the subtitle,
+            by default None
+        limit : optional
+            The limit the value is checked against, by default None
+        """
+
+        issue = super().__new__(cls, message)
+        issue.number = number
+        issue.rule = rule
+        issue.value = value
+        issue.limit = limit
+
+        return issue
+
+
+    def __repr__(self):
+        return (f'Issue({str(self)!r}, number={self.number!r}, '
+                f'rule={self.rule!r}, value={self.value!r}, '
+                f'limit={self.limit!r})')
+
+
+    def record(self, file_name='', severity='error'):
+        """The issue as a record for the reports.
+
+        Parameters
+        ----------
+        file_name : str, optional
+            File the issue was found in, by default ''
+        severity : str, optional
+            'error' or 'warning', by default 'error'
+
+        Returns
+        -------
+        dict
+            With the keys of reports.RECORD_FIELDS.
+        """
+
+        return {
+            'file': file_name,
+            'number': self.number,
+            'rule': self.rule,
+            'severity': severity,
+            'value': self.value,
+            'limit': self.limit,
+            'message': str(self)
+        }
+
+
+class OSTKind(Enum):
+    """What the text of a subtitle looks like as an OST
+    (on-screen text), judging by its brackets and its case.
+
+    Whether the OST is raised to the top of the screen
+    is not part of it: that comes from the line setting of the cue
+    (line:20%), which the callers check.
+    """
+
+    # Not an OST, like regular dialogue.
+    NOT_OST = 'not_OST'
+    # '[TEXT]'.
+    VALID = 'valid'
+    # '[Text]': in brackets, but with lowercase letters.
+    LOWERCASE = 'lowercase'
+    # '[TEXT].': punctuation after the closing bracket.
+    PUNCTUATION = 'punctuation'
+    # '[TEXT': missing the closing bracket.
+    UNCLOSED = 'unclosed'
+    # 'TEXT]': missing the opening bracket.
+    UNOPENED = 'unopened'
+    # 'TEXT': one line of capitals without brackets.
+    UNBRACKETED = 'unbracketed'
+    # '[]'.
+    EMPTY = 'empty'
+
+
+    @classmethod
+    def classify(cls, untagged_text):
+        """Classifies the text of a subtitle with a single match
+        of OST_PATTERN.
+
+        Parameters
+        ----------
+        untagged_text : list
+            Lines of the subtitle, without tags.
+
+        Returns
+        -------
+        OSTKind
+        """
+
+        text = '\n'.join(untagged_text)
+
+        # A single character, even a bracket, is not taken for an OST.
+        if len(text) < 2:
+            return cls.NOT_OST
+
+        match = OST_PATTERN.fullmatch(text)
+
+        if match['open']:
+            if not match['close']:
+                return cls.UNCLOSED
+            elif match['after']:
+                return cls.PUNCTUATION
+            elif len(text) < 3:
+                return cls.EMPTY
+            elif text.upper() != text:
+                return cls.LOWERCASE
+            else:
+                return cls.VALID
+
+        elif match['close'] and not match['after']:
+            return cls.UNOPENED
+
+        elif match['capitals'] and not match['after']:
+            return cls.UNBRACKETED
+
+        else:
+            return cls.NOT_OST
+
+
 def insert_tags(text, italics, bold, underline):
     """Inserts the text tags into the untagged text
         from the index lists.
@@ -1,4 +1,6 @@
 import re
+import io
+import os
 import html
 import string
 
@@ -7,12 +9,36 @@ from xml.dom import minidom
 from reader import read_text_file
 from classes import (Timecode, Subtitle, WebVTT, WebVTTRegion,
                      insert_tags, SRT, TTML, TTMLRegion, TTMLStyle,
-                     StartTag, EndTag, TimestampTag)
+                     StartTag, EndTag, TimestampTag, CueTable)
 
 from exceptions import FormatError
 
 
-def decode_SRT(file_list, frame_rate=24):
+# Start and end times of a WebVTT timestamp line.
+# Compiled once because it runs for every cue in collect_VTT_timings().
+VTT_TIMINGS_PATTERN = re.compile(
+    '^\s*(\d+:\d\d:\d\d.\d\d\d|\d\d:\d\d.\d\d\d)'
+    '\s*-->\s*(\d+:\d\d:\d\d.\d\d\d|\d\d:\d\d.\d\d\d)')
+
+# Line terminators inside a line read from a WebVTT file.
+NEWLINE_PATTERN = re.compile('\r\n?|\n')
+
+# Runs of cue text without character references or tags,
+# taken in one step by cue_text_tokenizer().
+TEXT_RUN_PATTERN = re.compile('[^&<]+')
+DIGIT_PATTERN = re.compile('\\d')
+
+# Every prefix of the names of the HTML5 character references
+# (like 'n', 'nb', 'nbs', 'nbsp' and 'nbsp;').
+# Built once, so that consume_HTML_char_ref() can follow the text
+# only while it can still be part of a reference,
+# and keep the longest one found.
+HTML_ENTITY_PREFIXES = frozenset(
+    entity[:i] for entity in html.entities.html5
+    for i in range(1, len(entity) + 1))
+
+
+def decode_SRT(file_list, frame_rate=24, table=False):
     """
     https://matroska.org/technical/subtitles.html
 
@@ -96,11 +122,12 @@ def decode_SRT(file_list, frame_rate=24):
         elif (new_expected or time_expected) and timestamp_match:
             # This only works here because the timestamp_match
             # is obtained from matching with ^.
-            start_time = Timecode(file_list[i][:12], frame_rate=frame_rate)
+            start_time = Timecode.from_srt(
+                file_list[i][:12], frame_rate=frame_rate)
             
             # This only works here because the timestamp_match
             # is obtained from matching with ^ and $.
-            end_time = Timecode(
+            end_time = Timecode.from_srt(
                 file_list[i][17:].replace('\n', ''), frame_rate=frame_rate)
 
             # This means that a timestamp line was found
@@ -146,7 +173,7 @@ def decode_SRT(file_list, frame_rate=24):
             #       to create the Timecode instance and not have
             #       to create another match object again?
             if alt_time_match_1:
-                start_time = Timecode(
+                start_time = Timecode.from_srt(
                     re.search(
                         '\d\d:\d\d:\d\d,\d\d\d',
                         file_list[i]
@@ -158,7 +185,7 @@ def decode_SRT(file_list, frame_rate=24):
                 # NOTE: How can the alt_time_match_1 be used here
                 #       to create the Timecode instance and not have
                 #       to create another match object again?
-                end_time = Timecode(
+                end_time = Timecode.from_srt(
                     re.search(
                         '\d\d:\d\d:\d\d,\d\d\d.*?(\d\d:\d\d:\d\d,\d\d\d)',
                         file_list[i]
@@ -188,7 +215,7 @@ def decode_SRT(file_list, frame_rate=24):
 
                 if alt_time_match_2:
                     # NOTE: This code is repeated.  Try to avoid it.
-                    start_time = Timecode(
+                    start_time = Timecode.from_srt(
                         re.search(
                             '\d\d:\d\d:\d\d,\d\d\d',
                             file_list[i]
@@ -200,7 +227,7 @@ def decode_SRT(file_list, frame_rate=24):
                     # NOTE: How can the alt_time_match_1 be used here
                     #       to create the Timecode instance and not have
                     #       to create another match object again?
-                    end_time = Timecode(
+                    end_time = Timecode.from_srt(
                         re.search(
                             '\d\d:\d\d:\d\d,\d\d\d.*?(\d\d:\d\d:\d\d,\d\d\d)',
                             file_list[i]
@@ -269,6 +296,10 @@ def decode_SRT(file_list, frame_rate=24):
     if non_cont_seq:
         print('Non-continuous sequence\n\n')    
 
+    # Columnar view of the subtitles for the checks.
+    if table:
+        return subtitles, CueTable(subtitles, frame_rate=frame_rate)
+
     return subtitles
 
 
@@ -446,18 +477,18 @@ def decode_VTT(file_list, frame_rate=24):
             elif timestamp1_match or timestamp2_match:
 
                 if timestamp1_match:
-                    start_time = Timecode(
+                    start_time = Timecode.from_vtt(
                         file_list[i][:12], frame_rate=frame_rate)
-                    end_time = Timecode(
+                    end_time = Timecode.from_vtt(
                         file_list[i][17:29], frame_rate=frame_rate)
                     # The length of the timestamp pair is stored
                     # to then use it to check for settings.
                     time_length = len(timestamp1_match.group())
 
                 elif timestamp2_match:
-                    start_time = Timecode(
+                    start_time = Timecode.from_vtt(
                         file_list[i][:9], frame_rate=frame_rate)
-                    end_time = Timecode(
+                    end_time = Timecode.from_vtt(
                         file_list[i][14:25], frame_rate=frame_rate)
                     # The length of the timestamp pair is stored
                     # to then use it to check for settings.
@@ -875,77 +906,167 @@ def decode_text_tags(text):
     return [new_text, italics, bold, underline]
 
 
-def parse_VTT(file_name, frame_rate=24):
-
-    file_list = read_text_file(file_name)
+def parse_VTT(file_name, frame_rate=24, table=False):
 
     # NOTE: Make sure this is necessary by seeing the recommendation.
     file_text_header = ''
 
-    # Step 1.
-    file_list = ''.join(file_list)
-    file_list = file_list.replace('\u0000', '\ufffd')
-    file_list = re.sub('\u000d\u000a?', '\u000a', file_list)
-    file_list = file_list.split('\n')
+    # Step 13
+    regions = {}
+    stylesheets = []
+    cues = []
+    contents = {}
 
-    # Step 2
-    position = 0
+    try:
+        for block in iter_VTT(file_name, frame_rate=frame_rate):
+            if type(block) == WebVTT:
+                cues.append(block)
+
+            elif type(block) == WebVTTRegion:
+                regions[block.identifier] = block
+
+    # Steps 4, 5, and 6 (the signature).
+    except FormatError as error:
+        print(error)
+        return
+    
+    contents['stylesheets'] = stylesheets
+    contents['regions'] = regions
+    contents['cues'] = cues
+
+    # Columnar view of the cues for the checks.
+    if table:
+        contents['table'] = CueTable(cues, frame_rate=frame_rate)
+
+    return contents
+
+
+def iter_VTT(path_or_file, frame_rate=24):
+    """Parses a WebVTT file one block at a time,
+    yielding every cue (WebVTT) and region (WebVTTRegion)
+    as soon as it is complete, so the whole file
+    is never held in memory.
+
+    Parameters
+    ----------
+    path_or_file : str, os.PathLike or file object
+        The name of the file, or a file object open in text mode
+        or in binary mode (decoded as UTF-8).
+    frame_rate : float, optional
+        By default 24
+
+    Yields
+    ------
+    WebVTT or WebVTTRegion
+
+    Raises
+    ------
+    FormatError
+        If the file does not start with the WebVTT signature.
+    """
+
+    if isinstance(path_or_file, (str, os.PathLike)):
+        with open(path_or_file, 'r', encoding='utf-8-sig') as in_file:
+            yield from iter_VTT(in_file, frame_rate=frame_rate)
+        return
+
+    if isinstance(path_or_file, (io.RawIOBase, io.BufferedIOBase)):
+        in_file = io.TextIOWrapper(path_or_file, encoding='utf-8-sig')
+    else:
+        in_file = path_or_file
+
+    # Step 1 (line by line).
+    lines = iter_VTT_lines(in_file)
 
     # Step 3
     seen_cue = False
 
     # Steps 4, 5, and 6.
-    signature_match = re.search('^WEBVTT[ \t\n]*', file_list[0])
+    signature_line = next(lines, '').lstrip('\ufeff')
+    signature_match = re.search('^WEBVTT[ \t\n]*', signature_line)
     if not signature_match:
-        print('The file does not start with the correct WebVTT signature.')
-        return
+        raise FormatError(
+            'The file does not start with the correct WebVTT signature.')
 
     # Step 7
-    # NOTE: The algorithm doesn't really say what to do
-    #       with these code points or what to name the variable.
-    # collected_chars = ''
-    # while file_list[position] != '\n':
-    #     collected_chars += file_list[position]
-    #     position += 1
-
-    # Step 12
-    # NOTE: Again, doesn't say what to do with these code points.
-    # while file_list[position] == '\n':
-    #     position += 1
+    # NOTE: The line after the signature is skipped,
+    #       as when the whole file was read at once.
+    next(lines, None)
 
     # Step 13
     regions = {}
-    stylesheets = []
-    cues = []
-    contents = {}
     cue_count = 1
 
-    index = 2
+    # Number of the first line of the current block.
+    line_offset = 2
+    at_end = False
+
     # Step 14
-    while index < len(file_list):
+    # Blocks are always separated by blank lines,
+    # so the lines are collected up to the next blank line
+    # and parsed as the whole file used to be.
+    while not at_end:
+        block_lines = []
 
-        block, block_type, index, seen_cue = collect_block(
-            file_list, index, seen_cue, cue_count, regions, frame_rate)
+        for line in lines:
+            block_lines.append(line)
 
-        if block_type == 'cue':
-            cues.append(block)
-            cue_count += 1
+            if not line:
+                break
+        else:
+            at_end = True
 
-        elif block_type == 'region':
-            regions[block.identifier] = block
+        index = 0
+        while index < len(block_lines):
 
-        elif block_type == 'stylesheet':
-            stylesheets.append(block)
+            block, block_type, index, seen_cue = collect_block(
+                block_lines, index, seen_cue, cue_count, regions,
+                frame_rate, line_offset=line_offset)
 
-    
-    contents['stylesheets'] = stylesheets
-    contents['regions'] = regions
-    contents['cues'] = cues
+            if block_type == 'cue':
+                cue_count += 1
+                yield block
 
-    return contents
+            elif block_type == 'region':
+                regions[block.identifier] = block
+                yield block
 
-        
-def collect_block(file_list, index, seen_cue, cue_count, regions, frame_rate):
+        line_offset += len(block_lines)
+
+
+def iter_VTT_lines(in_file):
+    """Lines of a text file without their line terminators,
+    with CR, LF and CRLF all taken as line terminators
+    and NULL characters replaced by U+FFFD.
+    As with str.split('\\n'), there is an empty last line
+    if the file ends with a line terminator (or is empty).
+    """
+
+    ends_in_newline = True
+
+    for line in in_file:
+        line = line.replace('\u0000', '\ufffd')
+
+        if line.endswith('\r\n'):
+            line = line[:-2]
+            ends_in_newline = True
+        elif line.endswith(('\r', '\n')):
+            line = line[:-1]
+            ends_in_newline = True
+        else:
+            ends_in_newline = False
+
+        if '\r' in line or '\n' in line:
+            yield from NEWLINE_PATTERN.split(line)
+        else:
+            yield line
+
+    if ends_in_newline:
+        yield ''
+
+
+def collect_block(file_list, index, seen_cue, cue_count, regions, frame_rate,
+                  line_offset=0):
     # NOTE: The algorithm says to bring this variable
     #       from the calling scope.
     # seen_cue = False
@@ -978,7 +1099,7 @@ def collect_block(file_list, index, seen_cue, cue_count, regions, frame_rate):
                     settings = file_list[index][timings[2]:]
                     VTT_settings = decode_VTT_settings(
                         settings,
-                        index-1,
+                        line_offset + index - 1,
                         regions
                     )
                     buffer = ''
@@ -1045,7 +1166,7 @@ def collect_block(file_list, index, seen_cue, cue_count, regions, frame_rate):
         return stylesheet, 'style', index, seen_cue
 
     elif region is not None:
-        region, identifier = decode_VTT_region(buffer, index)
+        region, identifier = decode_VTT_region(buffer, line_offset + index)
         return region, 'region', index, seen_cue
 
     else:
@@ -1055,17 +1176,15 @@ def collect_block(file_list, index, seen_cue, cue_count, regions, frame_rate):
 def collect_VTT_timings(string, frame_rate=24):
 
 
-    timestamp_match = re.search(
-        '^\s*(\d+:\d\d:\d\d.\d\d\d|\d\d:\d\d.\d\d\d)'
-        '\s*-->\s*(\d+:\d\d:\d\d.\d\d\d|\d\d:\d\d.\d\d\d)', string)
+    timestamp_match = VTT_TIMINGS_PATTERN.search(string)
 
     if timestamp_match:
         try:
-            start_time = Timecode(
+            start_time = Timecode.from_vtt(
                 timestamp_match.group(1),
                 frame_rate=frame_rate
             )
-            end_time = Timecode(
+            end_time = Timecode.from_vtt(
                 timestamp_match.group(2),
                 frame_rate=frame_rate
             )
@@ -1471,7 +1590,7 @@ def VTT_text_parser(cue_text):
     position = 0
     result = []
     print_result = []
-    text_result = ''
+    text_result = []
     # NOTE: This doesn't necessarily match the algorithm.
     current = None
     language_stack = []
@@ -1486,12 +1605,12 @@ def VTT_text_parser(cue_text):
             #               that is printed to the file.
             # text_result: untagged_text.
             return (result, ''.join(print_result),
-                    text_result.split('\n'), errors)
+                    ''.join(text_result).split('\n'), errors)
         token, position = cue_text_tokenizer(cue_text, position)
         if type(token) == str:
             result.append(token)
             print_result.append(html.escape(token, quote=False))
-            text_result += token
+            text_result.append(token)
         elif type(token) == StartTag:
 
             # ----------------------------------------------------------
@@ -1506,14 +1625,14 @@ def VTT_text_parser(cue_text):
                 errors.append(f"Invalid start tag ({token.token_string}). "
                               f'These characters will be interpreted as text '
                               f'but will be ignored by web players.')
-                text_result += token.token_string
+                text_result.append(token.token_string)
 
             elif not token.closed:
                 errors.append(f"Invalid start tag ({token.token_string}). "
                               f'The tag has no closing bracket.'
                               f' Will be interpreted as text '
                               f'but ignored by web players.')
-                text_result += token.token_string
+                text_result.append(token.token_string)
 
             elif token.name in open_order:
                 errors.append(f'Invalid start tag ({token.token_string}). '
@@ -1571,21 +1690,29 @@ def VTT_text_parser(cue_text):
                 errors.append(f"Invalid end tag ({token.token_string}). "
                               f'These characters will be interpreted as text '
                               f'but will be ignored by web players.')
-                text_result += token.token_string 
+                text_result.append(token.token_string) 
             elif not token.closed:
                 errors.append(f"Invalid end tag ({token.token_string}). "
                               f'The tag has no closing bracket.'
                               f' Will be interpreted as text '
                               f'but ignored by web players.')
-                text_result += token.token_string
+                text_result.append(token.token_string)
 
             print_result.append(token.token_string)
             result.append(token)
 
 
-    return result, ''.join(print_result), text_result.split('\n'), errors
+    return (result, ''.join(print_result),
+            ''.join(text_result).split('\n'), errors)
 
 def cue_text_tokenizer(text_string, position):
+    """Next token of the cue text from the position.
+
+    The runs of text in the data state are taken in one step
+    up to the next character reference or tag
+    and collected in a list instead of one character at a time.
+    """
+
 
     # WebVTT data state -> 1
     # HTML character reference in data state -> 2
@@ -1599,6 +1726,7 @@ def cue_text_tokenizer(text_string, position):
     
     tokenizer_state = 1
     result = ''
+    text_parts = []
     classes = []
     
     # NOTE: The initialization of buffer
@@ -1607,6 +1735,15 @@ def cue_text_tokenizer(text_string, position):
 
     while True:
         _next = False
+
+        # Take the text up to the next '&' or '<' in one step.
+        if tokenizer_state == 1:
+            text_run = TEXT_RUN_PATTERN.match(text_string, position)
+
+            if text_run:
+                text_parts.append(text_run.group())
+                position = text_run.end()
+
         if position >= len(text_string):
             c = None
         else:
@@ -1620,17 +1757,14 @@ def cue_text_tokenizer(text_string, position):
                 tokenizer_state = 2
                 _next = True
             elif c == '<':
-                if result == '':
+                if not text_parts:
                     # Set tokenizer_state to the "WebVTT tag state."
                     tokenizer_state = 3
                     _next = True
                 else:
-                    return result, position
-            elif c is None:
-                return result, position
+                    return ''.join(text_parts), position
             else:
-                result += c
-                _next = True
+                return ''.join(text_parts), position
 
         # || HTML character reference in data state
         elif tokenizer_state == 2:
@@ -1638,9 +1772,9 @@ def cue_text_tokenizer(text_string, position):
             #       There shouldn't be one here.
             chars, position = consume_HTML_char_ref(text_string, position)
             if not chars:
-                result += '&'
+                text_parts.append('&')
             else:
-                result += chars
+                text_parts.append(chars)
 
             # Set tokenizer_state to the "WebVTT data state."
             tokenizer_state = 1
@@ -1667,7 +1801,7 @@ def cue_text_tokenizer(text_string, position):
                 # Set tokenizer_state to the "WebVTT end tag state."
                 tokenizer_state = 8
                 _next = True
-            elif re.search('\d', c):
+            elif DIGIT_PATTERN.match(c):
                 result = c
                 
                 # Set tokenizer_state
@@ -1874,7 +2008,7 @@ def consume_HTML_char_ref_1(text_string, position, aac=''):
 
 def consume_HTML_char_ref(text_string, position, aac=''):
     char_ref = ''
-    entities = list(html.entities.html5.keys())
+    entities = html.entities.html5
     matched_entities = []
     dec = False
     hexa = False
@@ -1892,6 +2026,11 @@ def consume_HTML_char_ref(text_string, position, aac=''):
     while i <= len(text_string):
         if not hexa and not dec:
             current = text_string[position:i]
+
+            # No longer reference can start like this.
+            if current not in HTML_ENTITY_PREFIXES:
+                break
+
             if current in entities:
                 matched_entities.append(current)
 
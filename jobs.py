@@ -0,0 +1,249 @@
+import queue, threading
+from concurrent.futures import (ProcessPoolExecutor, ThreadPoolExecutor,
+                                FIRST_COMPLETED, wait)
+
+
+def run_jobs(function, jobs, workers=1, threads=False, progress=None,
+             **kwargs):
+    """Calls the function once for every job,
+    in parallel when there is more than one worker,
+    and returns the results in the same order as the jobs.
+
+    A job that fails doesn't stop the rest.
+    Its error is returned instead of its result.
+
+    Parameters
+    ----------
+    function : callable
+        Called as function(*job, **kwargs).
+        It must be defined at the module level
+        to run in worker processes.
+        To run in threads it must not depend
+        on the current working directory.
+    jobs : list
+        Tuples with the positional arguments of every call.
+    workers : int, optional
+        Number of workers. With 1 or less,
+        the jobs run one after the other in the calling process,
+        by default 1
+    threads : bool, optional
+        Whether the workers are threads of the calling process
+        instead of worker processes, by default False
+    progress : callable, optional
+        Called in the calling thread as progress(done, total)
+        every time a job finishes, by default None
+
+    Returns
+    -------
+    list
+        (result, error) for every job, in the order of the jobs.
+        error is None if the job succeeded,
+        or the exception it raised (result is then None).
+    """
+
+    return list(iter_jobs(function, jobs, workers=workers, threads=threads,
+                          progress=progress, **kwargs))
+
+
+def iter_jobs(function, jobs, workers=1, threads=False, progress=None,
+              **kwargs):
+    """Like run_jobs(), but yields the (result, error) of every job
+    as soon as it and all the jobs before it have finished,
+    so that the results can be used while the rest are running.
+
+    If the caller stops iterating, the jobs that haven't started
+    are cancelled.
+
+    The parameters are the same as in run_jobs().
+    """
+
+    total = len(jobs)
+
+    if workers is None or workers <= 1:
+        for done, job in enumerate(jobs, 1):
+            try:
+                outcome = (function(*job, **kwargs), None)
+            except Exception as error:
+                outcome = (None, error)
+
+            if progress is not None:
+                progress(done, total)
+
+            yield outcome
+
+        return
+
+    if threads:
+        pool = ThreadPoolExecutor
+    else:
+        pool = ProcessPoolExecutor
+
+    with pool(max_workers=workers) as executor:
+        futures = [executor.submit(function, *job, **kwargs) for job in jobs]
+        pending = set(futures)
+        done = 0
+
+        try:
+            # Yielded in the order of the jobs,
+            # not in the order in which they finish.
+            for future in futures:
+                while future in pending:
+                    finished, pending = wait(pending,
+                                             return_when=FIRST_COMPLETED)
+                    done += len(finished)
+
+                    if progress is not None:
+                        progress(done, total)
+
+                try:
+                    outcome = (future.result(), None)
+                except Exception as error:
+                    outcome = (None, error)
+
+                yield outcome
+
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+class JobRunner(object):
+    """Runs one long job at a time in a background thread,
+    so that the GUI keeps responding while it runs.
+
+    The job reports its progress and its output through a queue,
+    which is polled from the GUI thread with root.after(),
+    so the callbacks (and everything they do with the widgets)
+    always run in the GUI thread.
+    """
+
+    __slots__ = ('root', 'interval', 'cancel_event', '_queue', '_thread',
+                 '_callbacks')
+
+
+    def __init__(self, root, interval=50):
+        """
+        Parameters
+        ----------
+        root : tkinter.Tk
+            Or anything with an after() method like it.
+        interval : int, optional
+            Milliseconds between polls of the queue, by default 50
+        """
+
+        self.root = root
+        self.interval = interval
+        self.cancel_event = threading.Event()
+        self._queue = queue.Queue()
+        self._thread = None
+        self._callbacks = {}
+
+
+    def __repr__(self):
+        return f'JobRunner(running={self.running})'
+
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+
+    def start(self, function, on_progress=None, on_output=None,
+              on_done=None, on_error=None):
+        """Starts a job, unless another one is running.
+
+        Parameters
+        ----------
+        function : callable
+            Called in the background thread as function(runner).
+            It can report with runner.progress() and runner.output(),
+            and should stop as soon as it can
+            once runner.cancel_event is set.
+        on_progress : callable, optional
+            Called as on_progress(done, total), by default None
+        on_output : callable, optional
+            Called as on_output(item) for every item
+            passed to runner.output(), by default None
+        on_done : callable, optional
+            Called as on_done(result, cancelled)
+            with what the function returned, by default None
+        on_error : callable, optional
+            Called as on_error(error) with the exception
+            that the function raised, by default None
+
+        Returns
+        -------
+        bool
+            Whether the job was started.
+        """
+
+        if self.running:
+            return False
+
+        self.cancel_event.clear()
+        self._callbacks = {
+            'progress': on_progress,
+            'output': on_output,
+            'done': on_done,
+            'error': on_error
+        }
+        self._thread = threading.Thread(target=self._run, args=(function,),
+                                        daemon=True)
+        self._thread.start()
+        self.root.after(self.interval, self._poll)
+
+        return True
+
+
+    def cancel(self):
+        """Asks the running job to stop."""
+
+        self.cancel_event.set()
+
+
+    def progress(self, done, total):
+        """Reports the progress of the job. Safe from any thread."""
+
+        self._queue.put(('progress', (done, total)))
+
+
+    def output(self, item):
+        """Passes some output of the job to on_output.
+        Safe from any thread.
+        """
+
+        self._queue.put(('output', (item,)))
+
+
+    def _run(self, function):
+        try:
+            result = function(self)
+        except Exception as error:
+            self._queue.put(('error', (error,)))
+        else:
+            self._queue.put(('done', (result, self.cancel_event.is_set())))
+
+
+    def _poll(self):
+        finished = False
+
+        while True:
+            try:
+                kind, args = self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+            if kind in ('done', 'error'):
+                finished = True
+                self._thread = None
+
+            callback = self._callbacks[kind]
+
+            if callback is not None:
+                callback(*args)
+
+            if finished:
+                break
+
+        if not finished:
+            self.root.after(self.interval, self._poll)
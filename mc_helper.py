@@ -1,4 +1,4 @@
-import re, os, xlsxwriter, srt_handler, copy, docx
+import re, os, xlsxwriter, srt_handler, docx
 
 from decoders import decode_VTT, parse_VTT, VTT_text_parser
 from reader import read_text_file
@@ -7,6 +7,19 @@ from exceptions import FormatError
 from encoders import encode_VTT
 from srt_handler import renumber
 from vtt_handler import save_VTT_subs
+from cache import PARSE_CACHE
+from jobs import iter_jobs
+
+
+# NOTE: The OST rules of extract_OSTs() and check_OSTs(), compiled once.
+#       Each one matches exactly the cues its function always matched,
+#       which are not the ones OSTKind.classify() gives for check_cues().
+# Anything that looks like an OST, even a malformed one. The same as
+# the six searches extract_OSTs() used to run one after the other.
+OST_CANDIDATE_PATTERN = re.compile(r'^\[.+|.+\]$|^[A-ZÀ-Ý ]{2,}$')
+# The whole text of the cue in brackets, on its lines joined
+# without separators.
+OST_BRACKETS_PATTERN = re.compile(r'^\[.*\]$')
 
 
 def get_fast_texts(en_file_name='', tar_file_name='', class_path='',
@@ -50,11 +63,11 @@ def get_fast_texts(en_file_name='', tar_file_name='', class_path='',
 
     # Decode both the target language file and the source file.
     if old:
-        en_subs = decode_VTT(read_text_file(en_file_name))['subtitles']
-        tar_subs = decode_VTT(read_text_file(tar_file_name))['subtitles']
+        en_subs = PARSE_CACHE.parse(en_file_name, old=True)['subtitles']
+        tar_subs = PARSE_CACHE.parse(tar_file_name, old=True)['subtitles']
     else:
-        en_subs = parse_VTT(en_file_name)['cues']
-        tar_subs = parse_VTT(tar_file_name)['cues']
+        en_subs = PARSE_CACHE.parse(en_file_name)['cues']
+        tar_subs = PARSE_CACHE.parse(tar_file_name)['cues']
 
     # Dissect the span_start and span_end to get the minutes
     # and seconds values.
@@ -194,7 +207,8 @@ def get_fast_texts(en_file_name='', tar_file_name='', class_path='',
 
 def batch_gen_CPS_sheet(en_path, tar_path, out_name, OST=False, seg=False,
                         CPS=True, CPS_limit=25, CPL=True, CPL_limit=42,
-                        lines=True, max_lines=2, old=True, GUI=True):
+                        lines=True, max_lines=2, old=True, GUI=True,
+                        progress=None, cancel=None):
     """Generates a .xlsx spreadsheet with the text corresponding
     to reading speed issues and some context,
     in the target language and in the source language.
@@ -213,12 +227,15 @@ def batch_gen_CPS_sheet(en_path, tar_path, out_name, OST=False, seg=False,
         The name or path of the .xlsx file to be created.
     CPS_limit : int, optional
         The reading speed limit, by default 25
+    progress : callable, optional
+        Called as progress(done, total) every time a pair of files
+        is added to the spreadsheet, by default None
+    cancel : threading.Event, optional
+        When it is set, no more files are added,
+        and the spreadsheet is saved with the ones added until then,
+        by default None
     """
 
-    
-    # It's necessary to store the original directory
-    # so that the function can go back to it before returning.
-    original_dir = os.getcwd()
 
     # NOTE: See how you can improve this.
     workbook = xlsxwriter.Workbook(out_name)
@@ -240,18 +257,13 @@ def batch_gen_CPS_sheet(en_path, tar_path, out_name, OST=False, seg=False,
 
 
     if not GUI:
-        os.chdir(tar_path)
-        
         # All files including everything that's not a subtitle file.
-        all_tar_files = os.listdir()
+        all_tar_files = os.listdir(tar_path)
         tar_sub_files = []
 
-        os.chdir(en_path)
         # All files including everything that's not a subtitle file.
-        all_en_files = os.listdir()
+        all_en_files = os.listdir(en_path)
         en_sub_files = []
-
-        os.chdir(original_dir)
     
     else:
         all_tar_files = tar_path
@@ -293,9 +305,12 @@ def batch_gen_CPS_sheet(en_path, tar_path, out_name, OST=False, seg=False,
     for j in range(len(tar_sub_files)):
         # name_short = re.search('[^_]+_[^_]+', tar_sub_files[i])
 
+        if cancel is not None and cancel.is_set():
+            break
+
         if not GUI:
-            en_file_name = en_path + r'\\' + en_sub_files[j]
-            tar_file_name = tar_path + r'\\' + tar_sub_files[j]
+            en_file_name = os.path.join(en_path, en_sub_files[j])
+            tar_file_name = os.path.join(tar_path, tar_sub_files[j])
         else:
             en_file_name = en_sub_files[j]
             tar_file_name = tar_sub_files[j]
@@ -323,6 +338,9 @@ def batch_gen_CPS_sheet(en_path, tar_path, out_name, OST=False, seg=False,
             GUI=GUI
         )
 
+        if progress is not None:
+            progress(j + 1, len(tar_sub_files))
+
     workbook.close()
 
     return
@@ -376,12 +394,12 @@ def gen_CPS_sheet(en_file_name, tar_file_name, workbook=None, worksheet=None,
     if not GUI:
         # The video name extracted from the absolute path
         # to the English file.
-        video_name = en_file_name.split('\\')[-1]
+        video_name = os.path.basename(en_file_name)
         # Short name with the code for the class and the video number,
         # like JH_102.
         name_short = re.search('[^_]+_[^_]+', video_name).group()
     else:
-        video_name = en_file_name.split('/')[-1]
+        video_name = os.path.basename(en_file_name)
         name_short = re.search('[^_]+_[^_]+', video_name).group()
 
     print(name_short)
@@ -401,11 +419,11 @@ def gen_CPS_sheet(en_file_name, tar_file_name, workbook=None, worksheet=None,
 
     # Decode both files.
     if old:
-        en_subs = decode_VTT(read_text_file(en_file_name))['subtitles']
-        tar_subs = decode_VTT(read_text_file(tar_file_name))['subtitles']
+        en_subs = PARSE_CACHE.parse(en_file_name, old=True)['subtitles']
+        tar_subs = PARSE_CACHE.parse(tar_file_name, old=True)['subtitles']
     else:
-        en_subs = parse_VTT(en_file_name)['cues']
-        tar_subs = parse_VTT(tar_file_name)['cues']
+        en_subs = PARSE_CACHE.parse(en_file_name)['cues']
+        tar_subs = PARSE_CACHE.parse(tar_file_name)['cues']
 
     # The list of subtitle numbers that exceed the reading speed limit.
     # This is used because, when getting the context
@@ -1082,9 +1100,9 @@ def extract_subs(file_name, span_start, span_end,
 
     if in_ext == '.vtt':
         if old:
-            in_subs = decode_VTT(read_text_file(file_name))['subtitles']
+            in_subs = PARSE_CACHE.parse(file_name, old=True)['subtitles']
         else:
-            in_subs = parse_VTT(file_name)['cues']
+            in_subs = PARSE_CACHE.parse(file_name)['cues']
         in_vtt = True
         in_srt = False
     
@@ -1258,10 +1276,7 @@ def pre_fix(file_name, lang, old=True):
 def check_OSTs(directory, old=True):
     
     
-    original_dir = os.getcwd()
-    os.chdir(directory)
-
-    file_list = os.listdir()
+    file_list = os.listdir(directory)
     for sub_file in file_list:
         OST_errors = []
         sub_errors = []
@@ -1269,13 +1284,16 @@ def check_OSTs(directory, old=True):
         name, ext = os.path.splitext(sub_file)
 
         if ext == '.vtt':
+            sub_path = os.path.join(directory, sub_file)
+
             if old:
-                vtt_subs = decode_VTT(read_text_file(sub_file))['subtitles']
+                vtt_subs = PARSE_CACHE.parse(sub_path, old=True)['subtitles']
             else:
-                vtt_subs = parse_VTT(sub_file)['cues']
+                vtt_subs = PARSE_CACHE.parse(sub_path)['cues']
 
             for i, sub in enumerate(vtt_subs):
-                tag_match = re.search('^\[.*\]$', ''.join(sub.untagged_text))
+                tag_match = OST_BRACKETS_PATTERN.search(
+                    ''.join(sub.untagged_text))
 
                 if sub.line == 20 and not tag_match:
                     OST_errors.append(i)
@@ -1290,43 +1308,36 @@ def check_OSTs(directory, old=True):
                 for error in OST_errors:
                     print(vtt_subs[error])
 
-    os.chdir(original_dir)
-
 
 def check_GEMs(directory):
 
-    oiriginal_dir = os.getcwd()
-    os.chdir(directory)
-
-    all_files = os.listdir()
+    all_files = os.listdir(directory)
 
     for di in all_files:
-        if os.path.isdir(di):
-            new_dir = directory + '\\' + di
-            os.chdir(new_dir)
+        new_dir = os.path.join(directory, di)
 
-            in_files = os.listdir()
+        if os.path.isdir(new_dir):
+            in_files = os.listdir(new_dir)
 
 
 def NAS_consist(directory, old=True):
 
-    original_dir = os.getcwd()
-    os.chdir(directory)
-    lang = directory.split('\\')[-1]
+    lang = os.path.basename(directory)
     lang_cont = [lang, '\n\n\n']
 
-    file_list = os.listdir()
+    file_list = os.listdir(directory)
     for sub_file in file_list:
 
         name, ext = os.path.splitext(sub_file)
 
         if ext == '.vtt':
+            sub_path = os.path.join(directory, sub_file)
             lang_cont.append(sub_file)
             lang_cont.append('\n\n')
             if old:
-                vtt_subs = decode_VTT(read_text_file(sub_file))['subtitles']
+                vtt_subs = PARSE_CACHE.parse(sub_path, old=True)['subtitles']
             else:
-                vtt_subs = parse_VTT(sub_file)['cues']
+                vtt_subs = PARSE_CACHE.parse(sub_path)['cues']
             
             for i, sub in enumerate(vtt_subs):
                 if ('<i>' in ' '.join(sub.text) or '"' in ' '.join(sub.text)
@@ -1342,8 +1353,6 @@ def NAS_consist(directory, old=True):
     lang_cont.append(ending)
     lang_cont.append('\n')
 
-    os.chdir(original_dir)
-
     return lang_cont
 
 
@@ -1359,23 +1368,22 @@ def NAS_consist_batch(file_name, directories, look_up=[]):
 
 def italics_consist(directory, look_up, old=True):
 
-    original_dir = os.getcwd()
-    os.chdir(directory)
-    lang = directory.split('\\')[-1]
+    lang = os.path.basename(directory)
     lang_cont = [lang, '\n\n\n']
 
-    file_list = os.listdir()
+    file_list = os.listdir(directory)
     for sub_file in file_list:
 
         name, ext = os.path.splitext(sub_file)
 
         if ext == '.vtt':
+            sub_path = os.path.join(directory, sub_file)
             lang_cont.append(sub_file)
             lang_cont.append('\n\n')
             if old:
-                vtt_subs = decode_VTT(read_text_file(sub_file))['subtitles']
+                vtt_subs = PARSE_CACHE.parse(sub_path, old=True)['subtitles']
             else:
-                vtt_subs = parse_VTT(sub_file)['cues']
+                vtt_subs = PARSE_CACHE.parse(sub_path)['cues']
             
             open_tag = False
             time_span = ''
@@ -1401,8 +1409,6 @@ def italics_consist(directory, look_up, old=True):
     lang_cont.append(ending)
     lang_cont.append('\n')
 
-    os.chdir(original_dir)
-
     return lang_cont
 
 
@@ -1416,9 +1422,6 @@ def extract_OSTs(file_name, save_OST_dir, batch=False, delete_OSTs=False,
         [description]
     """
 
-    original_dir = os.getcwd()
-
-
     # if not batch:
     #     actual_file_name, ext = os.path.splitext(file_name.split('\\')[-1])
     #     new_file_name = f'{actual_file_name}__OSTs{ext}'
@@ -1427,7 +1430,7 @@ def extract_OSTs(file_name, save_OST_dir, batch=False, delete_OSTs=False,
 
     warnings = ''
     errors = ''
-    actual_file_name, ext = os.path.splitext(file_name.split('\\')[-1])
+    actual_file_name, ext = os.path.splitext(os.path.basename(file_name))
     new_file_name = f'{actual_file_name}__OSTs{ext}'
 
     if old:
@@ -1441,18 +1444,13 @@ def extract_OSTs(file_name, save_OST_dir, batch=False, delete_OSTs=False,
     possible_OST_indexes = []
 
     for i, sub in enumerate(subs):
-        check_text = '\n'.join(sub.untagged_text)
         if sub.line == 20:
             possible_OSTs
             possible_OST_indexes.append(i)
-            if (re.search('^\[.*\][\.,]*$', check_text)
-                or re.search('^\[+[A-ZÀ-Ý ]{2,}', check_text)
-                or re.search('[A-ZÀ-Ý ]{2,}\]+$', check_text)
-                or re.search('^[A-ZÀ-Ý ]{2,}$', check_text)
-                or re.search('^\[.+', check_text)
-                or re.search('.+\]$', check_text)):
+            # Anything that looks like an OST, even a malformed one.
+            if OST_CANDIDATE_PATTERN.search('\n'.join(sub.untagged_text)):
                 # Considered actual OST
-                OSTs.append(copy.deepcopy(sub))
+                OSTs.append(sub.clone())
                 OST_indexes.append(i)                
 
     if delete_OSTs:
@@ -1464,7 +1462,6 @@ def extract_OSTs(file_name, save_OST_dir, batch=False, delete_OSTs=False,
         save_VTT_subs(file_name, subs_cont)
 
     if save_OSTs:
-        os.chdir(save_OST_dir)
         short_name_match = re.search('^[\dA-Za-z]+_[\dA-Za-z]+_', actual_file_name)
         if short_name_match:
             short_letters = re.search('[A-Za-z]+', short_name_match.group())
@@ -1478,26 +1475,35 @@ def extract_OSTs(file_name, save_OST_dir, batch=False, delete_OSTs=False,
 
         OST_cont = {'stylesheets': [], 'regions': {}, 'cues': OSTs}
         # save_VTT_subs('Test' + new_file_name, OST_cont)
-        save_VTT_subs(OST_file_name, OST_cont)
-        os.chdir(original_dir)
+        save_VTT_subs(os.path.join(save_OST_dir, OST_file_name), OST_cont)
 
     return (warnings, errors)
 
 
 def batch_extract_OSTs(lang_path, save_OST_dir,
-                       delete_OSTs=False, save_OSTs=True):
+                       delete_OSTs=False, save_OSTs=True,
+                       progress=None, cancel=None, workers=1):
     """[summary]
 
     Parameters
     ----------
     lang_path : [type]
         [description]
+    progress : callable, optional
+        Called as progress(done, total) every time a file
+        is done, by default None
+    cancel : threading.Event, optional
+        When it is set, no more files are started, by default None
+    workers : int, optional
+        Number of worker processes. With more than one,
+        the files are processed in parallel, and the results
+        are still put together in the order of the files
+        (see jobs.iter_jobs()), by default 1
     """
 
     global_errors = {}
     global_warnings = {}
 
-    original_dir = os.getcwd()
     # os.chdir(lang_path)
     # parent_dir = os.path.dirname(lang_path)
 
@@ -1506,31 +1512,43 @@ def batch_extract_OSTs(lang_path, save_OST_dir,
     # new_dir = parent_dir + r'\\' + lang+'__Auto_OSTs' 
     # os.mkdir(new_dir)
 
-    os.chdir(lang_path)
-    all_sub_files = os.listdir()
-    sub_files = []
-
-    # NOTE: No check is being made here for files that are not .vtt.
-
-    for i, sub_file in enumerate(all_sub_files):
-        name, ext = os.path.splitext(sub_file)
-
-        if ext == '.vtt':
-            full_file_name = lang_path + '\\' + sub_file
-            warnings, errors = extract_OSTs(
-                full_file_name,
-                save_OST_dir=save_OST_dir,
-                batch=True,
-                delete_OSTs=delete_OSTs,
-                save_OSTs=save_OSTs
-            )
+    all_sub_files = os.listdir(lang_path)
+    sub_files = [sub_file for sub_file in all_sub_files
+                 if os.path.splitext(sub_file)[-1] == '.vtt']
+
+    jobs = [(os.path.join(lang_path, sub_file), save_OST_dir)
+            for sub_file in sub_files]
+
+    results = iter_jobs(
+        extract_OSTs,
+        jobs,
+        workers=workers,
+        progress=progress,
+        batch=True,
+        delete_OSTs=delete_OSTs,
+        save_OSTs=save_OSTs
+    )
+
+    try:
+        for i, (result, error) in enumerate(results):
+            full_file_name = jobs[i][0]
+
+            if error is not None:
+                warnings = ''
+                errors = f'Could not extract the OSTs ({error!r}).'
+            else:
+                warnings, errors = result
 
             if warnings:
                 global_warnings[full_file_name] = warnings
             if errors:
                 global_errors[full_file_name] = errors
 
-    os.chdir(original_dir)
+            if cancel is not None and cancel.is_set():
+                break
+
+    finally:
+        results.close()
     
     if global_errors or global_warnings:
         return (global_warnings, global_errors)
@@ -1543,14 +1561,13 @@ def batch_extract_OSTs(lang_path, save_OST_dir,
 
 def TM_fixes(directory, lookup):
 
-    original_dir = os.getcwd()
-    os.chdir(directory)
-    file_list = os.listdir()
+    file_list = os.listdir(directory)
 
     output = ', '.join(lookup) + '\n\n'
 
     for sub_file in file_list:
-        file_string = '\n'.join(read_text_file(sub_file))
+        file_string = '\n'.join(
+            read_text_file(os.path.join(directory, sub_file)))
         appended = False
 
         for word in lookup:
@@ -1561,24 +1578,18 @@ def TM_fixes(directory, lookup):
 
                 output += word + '\n'
 
-    os.chdir(original_dir)
-
     print(output)
 
 
 def count_CPS(directory, CPS_limit=25):
 
-    original_dir = os.getcwd()
-
-    os.chdir(directory)
-
-    file_list = os.listdir()
+    file_list = os.listdir(directory)
 
     for sub_file in file_list:
         print(sub_file)
         print('\n')
         counter = 0
-        subs = parse_VTT(sub_file)['cues']
+        subs = PARSE_CACHE.parse(os.path.join(directory, sub_file))['cues']
         for sub in subs:
             if sub.CPS_ns > CPS_limit:
                 counter += 1
@@ -1589,19 +1600,21 @@ def count_CPS(directory, CPS_limit=25):
     
 
 
-def get_OSTs(directory, save_OSTs_dir, files=True):
+def get_OSTs(directory, save_OSTs_dir, files=True, progress=None,
+             cancel=None):
 
-    original_path = os.getcwd()
     if not files:
-        os.chdir(directory)
-
-        file_list = os.listdir()
+        file_list = [os.path.join(directory, fi)
+                     for fi in os.listdir(directory)]
     else:
         file_list = directory
 
     OST_files = []
 
-    for fi in file_list:
+    for i, fi in enumerate(file_list):
+        if cancel is not None and cancel.is_set():
+            break
+
         name, ext = os.path.splitext(fi)
         if ext == '.docx':
             counter = 1
@@ -1671,11 +1684,12 @@ def get_OSTs(directory, save_OSTs_dir, files=True):
 
                 va = 2
             
-            OST_name = name.split('/')[-1]
-            OST_file_name = save_OSTs_dir + '\\' + OST_name + '.vtt'
+            OST_name = os.path.basename(name)
+            OST_file_name = os.path.join(save_OSTs_dir, OST_name + '.vtt')
             save_VTT_subs(OST_file_name, {'regions': [], 'styles': [], 'cues': OSTs})
 
-    os.chdir(original_path)
+        if progress is not None:
+            progress(i + 1, len(file_list))
 
 
 def get_OSTs_single(file_name, save_OST_dir, GUI=True):
@@ -1684,10 +1698,7 @@ def get_OSTs_single(file_name, save_OST_dir, GUI=True):
     illegal_chars = ['#', '%', '&', '{', '}', '\\', '<', '>', '*', "?", '/',
                      ' ', '$', '!', "'", '"', ':', '@', '+', '`', '|', '=']
 
-    if GUI:
-        act_file_name = file_name.split('/')[-1]
-    else:
-        act_file_name = file_name.split('\\')[-1]
+    act_file_name = os.path.basename(file_name)
 
     name_prefix = re.search('^\s*[a-zA-Z0-9]+_', act_file_name).group()
     name_prefix = name_prefix.strip()
@@ -1756,7 +1767,7 @@ def get_OSTs_single(file_name, save_OST_dir, GUI=True):
                     OST_name = OST_name.replace(char, '_')
 
             # OST_name = save_OST_dir + '\\' + OST_name
-            OST_name = save_OST_dir + '/' + OST_name
+            OST_name = os.path.join(save_OST_dir, OST_name)
             print(OST_name)
 
             new_file = False
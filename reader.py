@@ -1,4 +1,20 @@
-import struct, os
+import os, sys, struct
+from array import array
+
+from jobs import run_jobs
+
+
+HASH_BLOCK_SIZE = 65536
+
+# Binary companion of a .scenechanges file (name.scenechanges.bin):
+# this header (magic, version, frame rate, number of shot changes,
+# hash of the video), then the rendered frames of the shot changes
+# snapped and then not snapped, as little-endian int32.
+SCENE_CHANGES_BINARY_EXT = '.bin'
+SCENE_CHANGES_MAGIC = b'SCNB'
+SCENE_CHANGES_VERSION = 1
+SCENE_CHANGES_HEADER = struct.Struct('<4sIdI16s')
+
 
 def read_text_file(file_name):
     """
@@ -23,51 +39,158 @@ def read_text_file(file_name):
 
     return file_list
 
+
+def read_shot_changes(sc_name):
+    """Reads the times of a .scenechanges file.
+
+    Parameters
+    ----------
+    sc_name : str or os.PathLike
+        Path to the .scenechanges file.
+
+    Returns
+    -------
+    list
+        Times of the shot changes in seconds, as floats.
+    """
+
+    sc_list = read_text_file(sc_name)
+
+    for m in range(len(sc_list)):
+        sc_list[m] = float(sc_list[m].strip())
+
+    return sc_list
+
+
+def read_binary_shot_changes(bin_name):
+    """Reads a binary .scenechanges file.
+
+    The frames are read straight into arrays with array.fromfile()
+    (byteswapped on big-endian machines), and the file is closed
+    before returning, so it can be replaced right after.
+
+    Parameters
+    ----------
+    bin_name : str or os.PathLike
+        Path to the .scenechanges.bin file.
+
+    Returns
+    -------
+    tuple
+        (frame_rate, hash_name, frames_s, frames_r)
+
+    Raises
+    ------
+    ValueError
+        If the file is not a binary .scenechanges file
+        of a supported version, or is truncated.
+    """
+
+    with open(bin_name, 'rb') as bin_file:
+        header = bin_file.read(SCENE_CHANGES_HEADER.size)
+
+        if len(header) < SCENE_CHANGES_HEADER.size:
+            raise ValueError(f'{bin_name} is not a binary .scenechanges file.')
+
+        magic, version, frame_rate, count, hash_name = (
+            SCENE_CHANGES_HEADER.unpack(header))
+
+        if magic != SCENE_CHANGES_MAGIC or version != SCENE_CHANGES_VERSION:
+            raise ValueError(f'{bin_name} is not a binary .scenechanges file '
+                             f'of version {SCENE_CHANGES_VERSION}.')
+
+        frames_s = array('i')
+        frames_r = array('i')
+
+        try:
+            frames_s.fromfile(bin_file, count)
+            frames_r.fromfile(bin_file, count)
+        except EOFError:
+            raise ValueError(f'{bin_name} is truncated.') from None
+
+    if sys.byteorder == 'big':
+        frames_s.byteswap()
+        frames_r.byteswap()
+
+    return (frame_rate, hash_name.rstrip(b'\0').decode('ascii'),
+            frames_s, frames_r)
+
+
 def hash_file(name):
-    original_path = os.getcwd()
+    """Hash of a video file, used to name its scene changes file.
 
-    dissected = name.split('\\')
+    Parameters
+    ----------
+    name : str or os.PathLike
+        Path to the video file, absolute or relative
+        to the current working directory.
 
-    if ''.join(dissected) != name:
-        path = '\\'.join(dissected[:-1])
-        video_name = dissected[-1]
-        os.chdir(path)
-    
-    else:
-        video_name = name
+    Returns
+    -------
+    str
+        The hash as 16 hexadecimal digits,
+        "SizeError" if the file is too small
+        or "IOError" if it cannot be read.
+    """
 
     try:
-                
-        longlongformat = '<q'  # little-endian long long
-        bytesize = struct.calcsize(longlongformat)
-            
-        f = open(video_name, "rb")
+        filesize = os.path.getsize(name)
             
-        filesize = os.path.getsize(video_name)
-        hash = filesize
-            
-        if filesize < 65536 * 2:
-            os.chdir(original_path)
+        if filesize < HASH_BLOCK_SIZE * 2:
             return "SizeError" 
-        
-        for x in range(int(65536/bytesize)):
-            buffer = f.read(bytesize)
-            (l_value,)= struct.unpack(longlongformat, buffer)
-            hash += l_value
-            hash = hash & 0xFFFFFFFFFFFFFFFF #to remain as 64bit number
-                    
-        f.seek(max(0,filesize-65536),0)
-        for x in range(int(65536/bytesize)):
-            buffer = f.read(bytesize)
-            (l_value,)= struct.unpack(longlongformat, buffer)
-            hash += l_value
-            hash = hash & 0xFFFFFFFFFFFFFFFF
+
+        # NOTE: Both blocks are read in one call each and summed
+        #       as unsigned 64-bit words. The sum modulo 2**64
+        #       is the same as adding the signed little-endian
+        #       words one by one and masking after every addition.
+        words = array('Q')
+
+        with open(name, "rb") as f:
+            words.frombytes(f.read(HASH_BLOCK_SIZE))
+            f.seek(filesize - HASH_BLOCK_SIZE, 0)
+            words.frombytes(f.read(HASH_BLOCK_SIZE))
+
+        if sys.byteorder == 'big':
+            words.byteswap()
+
+        hash = (filesize + sum(words)) & 0xFFFFFFFFFFFFFFFF
             
-        f.close()
         returnedhash =  "%016x" % hash
-        os.chdir(original_path)
         return returnedhash 
 
     except(IOError):
-        os.chdir(original_path)
         return "IOError"
+
+
+def batch_hash_files(directory, ext='.mp4', workers=4):
+    """Hashes of all the videos in a directory,
+    computed in a pool of threads.
+
+    Parameters
+    ----------
+    directory : str or os.PathLike
+        Path to the directory with the videos.
+    ext : str, optional
+        Extension of the files to hash, by default '.mp4'
+    workers : int, optional
+        Number of threads, by default 4
+
+    Returns
+    -------
+    dict
+        The hash of every video, as returned by hash_file(),
+        keyed by file name in the order of os.listdir().
+    """
+
+    file_names = [file_name for file_name in os.listdir(directory)
+                  if os.path.splitext(file_name)[-1] == ext]
+
+    results = run_jobs(
+        hash_file,
+        [(os.path.join(directory, file_name),) for file_name in file_names],
+        workers=workers,
+        threads=True
+    )
+
+    return {file_name: hash_name
+            for file_name, (hash_name, error) in zip(file_names, results)}
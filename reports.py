@@ -0,0 +1,255 @@
+import os, csv, json
+
+
+# Fields of the issue records, in the order of the CSV columns
+# (see classes.Issue.record()).
+RECORD_FIELDS = ('file', 'number', 'rule', 'severity', 'value', 'limit',
+                 'message')
+
+# Extensions of the records files, and the format of each one.
+RECORD_FORMATS = {'.jsonl': 'jsonl', '.csv': 'csv'}
+
+
+class ReportSink(object):
+    """Destination of the lines of a report.
+
+    The report is written in sections (for example, one per file
+    checked) as soon as every section is ready, instead of all at once
+    at the end, so the first results can be seen while the rest
+    are still being checked.
+
+    Every line is written followed by a new line.
+    Sinks can be used as context managers, which close them at the end.
+    """
+
+    __slots__ = ()
+
+
+    def write_lines(self, lines):
+        """Writes one section of the report.
+
+        Parameters
+        ----------
+        lines : list
+            Lines of the section, without the new line at the end.
+        """
+
+        raise NotImplementedError
+
+
+    def close(self):
+        """Finishes the report. Nothing is written after this."""
+
+        pass
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class FileReportSink(ReportSink):
+    """Writes the report to a text file, through a buffer,
+    so that a section with many short lines is written
+    in a few large writes instead of one per line.
+
+    The file is written in UTF-8 with a BOM, like the reports
+    were written before.
+    """
+
+    __slots__ = ('file_name', '_file')
+
+
+    def __init__(self, file_name, buffer_size=1 << 16):
+        """
+        Parameters
+        ----------
+        file_name : str
+            Name of the report file. Overwritten if it exists.
+        buffer_size : int, optional
+            Size in bytes of the write buffer, by default 64 KiB
+        """
+
+        self.file_name = file_name
+        self._file = open(file_name, 'w', encoding='utf-8-sig',
+                          buffering=buffer_size)
+
+
+    def __repr__(self):
+        return f'FileReportSink({self.file_name!r})'
+
+
+    def write_lines(self, lines):
+        self._file.write(''.join([f'{line}\n' for line in lines]))
+
+
+    def flush(self):
+        """Writes what is in the buffer to the file,
+        so the sections written so far can be read from it.
+        """
+
+        self._file.flush()
+
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+class ListReportSink(ReportSink):
+    """Keeps the lines of the report in a list."""
+
+    __slots__ = ('lines',)
+
+
+    def __init__(self):
+        self.lines = []
+
+
+    def write_lines(self, lines):
+        self.lines.extend(lines)
+
+
+class CallbackReportSink(ReportSink):
+    """Passes every section of the report to a function,
+    for example to show it in the GUI as soon as it is ready.
+    """
+
+    __slots__ = ('function',)
+
+
+    def __init__(self, function):
+        """
+        Parameters
+        ----------
+        function : callable
+            Called as function(lines) with the lines of every section,
+            in the thread that writes the report.
+        """
+
+        self.function = function
+
+
+    def write_lines(self, lines):
+        self.function(lines)
+
+
+class RecordSink(object):
+    """Destination of the issue records of a quality check,
+    one record per issue, with the fields in RECORD_FIELDS.
+
+    Like the report sinks, the records are written one file at a time,
+    through a buffer. Sinks can be used as context managers.
+    """
+
+    __slots__ = ('file_name', '_file')
+
+
+    def __init__(self, file_name, buffer_size=1 << 16):
+        """
+        Parameters
+        ----------
+        file_name : str
+            Name of the records file. Overwritten if it exists.
+        buffer_size : int, optional
+            Size in bytes of the write buffer, by default 64 KiB
+        """
+
+        self.file_name = file_name
+        self._file = open(file_name, 'w', encoding='utf-8', newline='',
+                          buffering=buffer_size)
+
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.file_name!r})'
+
+
+    def write_records(self, records):
+        """Writes the records of one file.
+
+        Parameters
+        ----------
+        records : list
+            Dictionaries with the keys in RECORD_FIELDS.
+        """
+
+        raise NotImplementedError
+
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class JSONLinesRecordSink(RecordSink):
+    """Writes every record as a JSON object in its own line
+    (JSON Lines).
+    """
+
+    __slots__ = ()
+
+
+    def write_records(self, records):
+        self._file.write(''.join(
+            [json.dumps(record, ensure_ascii=False) + '\n'
+             for record in records]))
+
+
+class CSVRecordSink(RecordSink):
+    """Writes the records as the rows of a CSV file,
+    with a header row with the RECORD_FIELDS.
+    Empty values (None) are written as empty cells.
+    """
+
+    __slots__ = ('_writer',)
+
+
+    def __init__(self, file_name, buffer_size=1 << 16):
+        super().__init__(file_name, buffer_size=buffer_size)
+
+        self._writer = csv.DictWriter(self._file, fieldnames=RECORD_FIELDS)
+        self._writer.writeheader()
+
+
+    def write_records(self, records):
+        self._writer.writerows(records)
+
+
+def open_record_sink(file_name):
+    """The record sink for a records file, by its extension
+    (see RECORD_FORMATS).
+
+    Parameters
+    ----------
+    file_name : str
+
+    Returns
+    -------
+    RecordSink
+
+    Raises
+    ------
+    ValueError
+        If the extension is not supported.
+    """
+
+    record_format = RECORD_FORMATS.get(
+        os.path.splitext(file_name)[-1].lower())
+
+    if record_format == 'jsonl':
+        return JSONLinesRecordSink(file_name)
+    elif record_format == 'csv':
+        return CSVRecordSink(file_name)
+    else:
+        raise ValueError(f'Unsupported records file: {file_name}')
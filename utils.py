@@ -1,7 +1,21 @@
-import os, shutil, re, ffmpeg# cv2
+import os, sys, shutil, re, subprocess, threading, ffmpeg# cv2
+from array import array
 
-from reader import read_text_file, hash_file
-from classes import Timecode, WebVTT
+from reader import (read_text_file, hash_file, batch_hash_files,
+                    read_shot_changes, SCENE_CHANGES_BINARY_EXT,
+                    SCENE_CHANGES_MAGIC, SCENE_CHANGES_VERSION,
+                    SCENE_CHANGES_HEADER)
+from classes import Timecode, WebVTT, ShotChangeIndex
+from jobs import run_jobs
+
+
+# Scene score above which FFMPEG reports a shot change.
+SCENE_THRESHOLD = 0.05
+
+# Lines of the showinfo filter that describe a frame,
+# and the time of the frame in them.
+SHOWINFO_FRAME_PATTERN = re.compile('n:\\s*\\d+ ')
+SHOWINFO_TIME_PATTERN = re.compile('pts_time:(\\d+\\.*\\d*)')
 
 
 def fps_check(file_name):
@@ -42,202 +56,355 @@ def get_frame_rate(video):
     return fps
 
 def batch_get_frame_rates(directory):
-    original_dir = os.getcwd()
-    os.chdir(directory)
-
-    videos = os.listdir()
+    videos = os.listdir(directory)
 
     for video in videos:
         name, ext = os.path.splitext(video)
         if ext == '.mp4':
-            print(video, '  -->   ', get_frame_rate(video))
+            print(video, '  -->   ',
+                  get_frame_rate(os.path.join(directory, video)))
             # print(get_frame_rate(video))
 
 
-
-    os.chdir(original_dir)
-
-
 def get_scene_names(directory):
 
-    original_dir = os.getcwd()
-    os.chdir(directory)
-
-    video_list = os.listdir()
+    video_list = os.listdir(directory)
     scene_name_list = []
 
     for video in video_list:
         name, ext = os.path.splitext(video)
-        scene_name_list.append(hash_file(video))
+        video_path = os.path.join(directory, video)
+        scene_name_list.append(hash_file(video_path))
 
         if ext == '.mp4':
             print(video)
-            print(hash_file(video))
+            print(hash_file(video_path))
             print('\n')
 
     return scene_name_list
 
 
 def copy_scene_changes(videos_dir, source_dir, target_dir):
-    original_dir = os.getcwd()
-
     scene_name_list = get_scene_names(videos_dir)
     
     for name in scene_name_list:
-        original = source_dir + '\\' + name + '.scenechanges'
-        target = target_dir + '\\' + name + '.scenechanges'
+        original = os.path.join(source_dir, name + '.scenechanges')
+        target = os.path.join(target_dir, name + '.scenechanges')
         
         shutil.copyfile(original, target)
 
 
 
-def batch_generate_scene_changes(path):
-    """
+def batch_generate_scene_changes(path, workers=1, progress=None):
+    """Generates the scene changes of all the .mp4 videos
+    in a directory, with up to workers FFMPEG processes at a time.
+
+    Videos whose hash already has a .scenechanges file
+    in the 'scene_changes' directory are skipped,
+    so an interrupted batch picks up where it stopped.
+
+    Parameters
+    ----------
+    path : str or os.PathLike
+        Path to the directory with the videos.
+    workers : int, optional
+        Number of videos processed at the same time, by default 1
+    progress : callable, optional
+        Called as progress(done, total) every time
+        a video is finished, by default None
+
+    Returns
+    -------
+    dict
+        The error of every video that couldn't be processed,
+        keyed by file name. Empty if all of them were.
     """
 
-    original_path = os.getcwd()
-    os.chdir(path)
-    files = os.listdir()
+    sc_dir = os.path.join(path, 'scene_changes')
 
-    if not os.path.exists('scene_changes'):
-        os.mkdir('scene_changes')
+    if not os.path.exists(sc_dir):
+        os.mkdir(sc_dir)
 
-    for file_name in files:
-        name, extension = os.path.splitext(file_name)
+    jobs = []
 
-        if extension == '.mp4':
-            generate_scene_changes(file_name, path)
+    for file_name, hash_name in batch_hash_files(path).items():
+        if os.path.exists(os.path.join(sc_dir, hash_name + '.scenechanges')):
+            print(f'Scene changes of "{file_name}" already exist.')
+        else:
+            jobs.append((file_name, path, hash_name))
 
-    os.chdir(original_path)
+    # NOTE: The work is done by the FFMPEG processes,
+    #       so threads are enough to keep several of them running.
+    results = run_jobs(generate_scene_changes, jobs, workers=workers,
+                       threads=True, progress=progress)
 
-    return
+    errors = {}
 
+    for job, (result, error) in zip(jobs, results):
+        if error is not None:
+            print(f'Could not generate the scene changes of "{job[0]}" '
+                  f'({error!r}).')
+            errors[job[0]] = error
 
-def generate_scene_changes(file_name, directory):
-    """
-    Generates scene changes with FFMPEG, running it in the command line.
-    This is for one video only, and the .txt file is saved
-    with the same name as the video but with any illegal character
-    replaced by an underscore.
-    The .scenechanges file is saved with the same name as the video—
-    illegal characters included.
-    
-    NOT DONE YET. FINISH IT. THERE MIGHT BE UNFINISHED FIXES IN THIS CODE
-    """
+    return errors
 
-    original_path = os.getcwd()
-    os.chdir(directory)
 
-    illegal_found = False
+def generate_scene_changes(file_name, directory, hash_name=''):
+    """Generates the scene changes of one video with FFMPEG.
 
-    # Create the 'scene_changes' directory if it doesn't exist.
-    if not os.path.exists('scene_changes'):
-        os.mkdir('scene_changes')
+    The times are read from the output of FFMPEG while it runs,
+    and saved in the 'scene_changes' directory twice,
+    as name.scenechanges (the name of the video)
+    and as hash.scenechanges (the name used by the quality check).
+    Each file is written under a temporary name and then renamed,
+    so that an interrupted run never leaves a partial file.
 
-    os.chdir(directory + '\\scene_changes')
+    Parameters
+    ----------
+    file_name : str
+        Name of the video, inside the directory.
+    directory : str or os.PathLike
+        Path to the directory of the video.
+    hash_name : str, optional
+        hash_file() of the video, if it was already computed,
+        by default ''
 
-    # NOTE: These replacements can be done with a regular expression
-    illegal_chars = ['#', '%', '&', '{', '}', '\\', '<', '>', '*', "?", '/',
-                     ' ', '$', '!', "'", '"', ':', '@', '+', '`', '|', '=']
+    Returns
+    -------
+    list
+        Times of the shot changes in seconds, as they appear
+        in the .scenechanges files.
+    """
 
-    # File name without the extension and extension.
     name, extension = os.path.splitext(file_name)
-    print(directory + '\\' + file_name)
-    hash_name = hash_file(directory + '\\' + file_name)
 
-    if name + '.scenechanges' in os.listdir():
-        print('File "' + name + '.scenechanges" already exists in the "scene_changes" directory.')
-        os.chdir(original_path)
+    # Make sure the file passed is actually a video.
+    if extension != '.mp4':
+        # NOTE: An exception should be raised here.
+        print('The file is not a video')
         return
-    
-    os.chdir(original_path) 
 
-    # Copy the file name to replace the illegal characters in it.
-    # This is done to keep the original file name for later use.
-    name_for_terminal = name
+    video_path = os.path.join(directory, file_name)
+    sc_dir = os.path.join(directory, 'scene_changes')
+    print(video_path)
 
-    # Make sure the file passed is actually a video.
-    if extension == '.mp4':
-
-        # Iterate over all the illegal characters and replace
-        # any that appears in the file name with an underscore.
-        # NOTE: See how this can be done with a regular expression.
-        for char in illegal_chars:
-            if char in name:
-                name_for_terminal = name_for_terminal.replace(char, '_')
-                illegal_found = True
-
-        # The flag 'illegal_found' indicates that at least
-        # one replacement of an illegal character was made
-        # in the file name.  Also check if the file with the modified
-        # name doesn't exist already, and then create a copy
-        # of the video with the new, 'legal' name.
-        if illegal_found and not os.path.exists(name_for_terminal + extension):
-            shutil.copyfile(file_name, name_for_terminal + extension)
-
-        # Make sure the .txt file with the scene changes
-        # doesn't exist already and then run the FFMPEG command
-        # to create it.
-        # NOTE: Find a way to wrap the long line.
-        if not os.path.exists(name_for_terminal + '.txt'):
-            os.system(
-                'ffmpeg -i '+ name_for_terminal + extension
-                + ' -filter:v "select=\'gt(scene, 0.05)\', showinfo" -f null - 2> '
-                + name_for_terminal + '.txt'
-            )
-
-        # If the file name was changed to work
-        # with FFMPEG in the command line...
-        if illegal_found:
-            # If the .txt file with the original file name
-            # does not exist, rename it with it.  
-            if not os.path.exists(name + 'txt'):
-                os.rename(name_for_terminal + '.txt', name + '.txt')
-
-            # Delete copy of the video that was created.
-            os.remove(name_for_terminal + extension)
-
-        # Work on the .txt file that was just created to extract
-        # the scene changes for the .scenechanges file.
-        cuts_list = read_text_file(name + '.txt')
-        cut_times = []
-
-        # Iterate over the lines of the .txt file to extract the times.
-        for j in range(len(cuts_list)):
-            if re.search('n:\s*\d+ ', cuts_list[j]) is not None:
-                time = re.search('pts_time:\d+\.*\d*', cuts_list[j]).group()
-                cut_times.append(re.search('\d+\.*\d*', time).group())
-
-        # Create the .scenechanges file with the times extracted.
-        # NOTE: Find a way to wrap the long line.
-        with open(name + '.scenechanges', 'w', encoding="utf-8-sig") as cuts_file:
+    if not hash_name:
+        hash_name = hash_file(video_path)
+
+    # Create the 'scene_changes' directory if it doesn't exist.
+    if not os.path.exists(sc_dir):
+        os.mkdir(sc_dir)
+
+    cut_times = detect_scene_changes(video_path)
+
+    write_scene_changes(os.path.join(sc_dir, name + '.scenechanges'),
+                        cut_times)
+    write_scene_changes(os.path.join(sc_dir, hash_name + '.scenechanges'),
+                        cut_times)
+
+    return cut_times
+
+
+def detect_scene_changes(video_name, threshold=SCENE_THRESHOLD):
+    """Runs FFMPEG on a video and reads the times of the shot changes
+    from its showinfo output as it streams.
+
+    Parameters
+    ----------
+    video_name : str or os.PathLike
+        Path to the video.
+    threshold : float, optional
+        Scene score of a shot change, by default SCENE_THRESHOLD
+
+    Returns
+    -------
+    list
+        Times of the shot changes in seconds, as strings.
+
+    Raises
+    ------
+    subprocess.CalledProcessError
+        If FFMPEG fails.
+    """
+
+    # NOTE: The arguments are passed as a list, without a shell,
+    #       so the name of the video doesn't need any escaping.
+    #       -nostdin keeps concurrent runs away from the terminal
+    #       and -an skips decoding the audio.
+    command = [
+        'ffmpeg', '-nostdin', '-i', os.fspath(video_name), '-an',
+        '-filter:v', f"select='gt(scene, {threshold})', showinfo",
+        '-f', 'null', '-'
+    ]
+
+    cut_times = []
+
+    with subprocess.Popen(command, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.PIPE, encoding='utf-8',
+                          errors='replace') as process:
+        for line in process.stderr:
+            if SHOWINFO_FRAME_PATTERN.search(line) is not None:
+                cut_times.append(SHOWINFO_TIME_PATTERN.search(line).group(1))
+
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command)
+
+    return cut_times
+
+
+def write_scene_changes(sc_name, cut_times):
+    """Writes a .scenechanges file atomically:
+    to a temporary file in the same directory first,
+    which then replaces the file.
+
+    Parameters
+    ----------
+    sc_name : str or os.PathLike
+        Path to the .scenechanges file.
+    cut_times : list
+        Times of the shot changes, as strings.
+    """
+
+    # NOTE: The process and the thread are in the temporary name
+    #       because the videos of a batch run in parallel,
+    #       and a resumed run can write the same file.
+    temp_name = (f'{os.fspath(sc_name)}.{os.getpid()}.'
+                 f'{threading.get_ident()}.tmp')
+
+    try:
+        with open(temp_name, 'w', encoding="utf-8-sig") as cuts_file:
             for line in cut_times:
                 cuts_file.write(line)
                 cuts_file.write('\n')
 
-        # Move the files (.txt and .scenechanges)
-        # to the 'scene_changes' directory.
-        shutil.move(
-            directory + '\\' + name + '.txt',
-            directory + '\\scene_changes\\' + name + '.txt'
-        )
+        os.replace(temp_name, sc_name)
+
+    finally:
+        # Only left if the file could not be written or replaced.
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+
+
+def write_binary_scene_changes(bin_name, frame_rate, hash_name,
+                              frames_s, frames_r):
+    """Writes a binary .scenechanges file atomically
+    (see read_binary_shot_changes()).
+
+    Parameters
+    ----------
+    bin_name : str or os.PathLike
+        Path to the .scenechanges.bin file.
+    frame_rate : float
+    hash_name : str
+        hash_file() of the video.
+    frames_s : sequence
+        Rendered frames of the shot changes, snapped.
+    frames_r : sequence
+        Rendered frames of the shot changes, not snapped.
+    """
 
-        shutil.move(
-            directory + '\\' + name + '.scenechanges',
-            directory + '\\scene_changes\\' + name + '.scenechanges'
-        )
+    frames = array('i', [*frames_s, *frames_r])
 
-        shutil.copy(directory + '\\scene_changes\\' + name + '.scenechanges',
-                    directory + '\\scene_changes\\' + hash_name + '.scenechanges')
+    if sys.byteorder == 'big':
+        frames.byteswap()
 
-    else:
-        # NOTE: An exception should be raised here.
-        print('The file is not a video')
-        os.chdir(original_path)
-        return
+    temp_name = (f'{os.fspath(bin_name)}.{os.getpid()}.'
+                 f'{threading.get_ident()}.tmp')
+
+    try:
+        with open(temp_name, 'wb') as bin_file:
+            bin_file.write(SCENE_CHANGES_HEADER.pack(
+                SCENE_CHANGES_MAGIC, SCENE_CHANGES_VERSION, frame_rate,
+                len(frames_s), hash_name.encode('ascii')))
+            frames.tofile(bin_file)
+
+        os.replace(temp_name, bin_name)
+
+    finally:
+        # Only left if the file could not be written or replaced.
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+
+
+def convert_scene_changes(sc_name, frame_rate, hash_name):
+    """Writes the binary companion (name.scenechanges.bin)
+    of a .scenechanges file.
+
+    Parameters
+    ----------
+    sc_name : str or os.PathLike
+        Path to the .scenechanges file.
+    frame_rate : float
+        Frame rate of the video.
+    hash_name : str
+        hash_file() of the video.
+
+    Returns
+    -------
+    str
+        Path to the binary file.
+    """
+
+    index = ShotChangeIndex(read_shot_changes(sc_name), frame_rate=frame_rate)
+    bin_name = os.fspath(sc_name) + SCENE_CHANGES_BINARY_EXT
+
+    write_binary_scene_changes(bin_name, frame_rate, hash_name,
+                              index.frames_s, index.frames_r)
+
+    return bin_name
+
+
+def batch_convert_scene_changes(videos_dir, sc_dir, workers=1):
+    """Writes the binary companion of the .scenechanges file
+    of every .mp4 video in a directory, at the frame rate of the video.
+    Videos without a .scenechanges file in sc_dir are skipped.
+
+    Parameters
+    ----------
+    videos_dir : str or os.PathLike
+        Path to the directory with the videos.
+    sc_dir : str or os.PathLike
+        Path to the directory with the .scenechanges files,
+        named by hash.
+    workers : int, optional
+        Number of videos converted at the same time
+        (FFPROBE runs for each one), by default 1
+
+    Returns
+    -------
+    dict
+        The error of every video that couldn't be converted,
+        keyed by file name. Empty if all of them were.
+    """
+
+    jobs = []
+    file_names = []
+
+    for file_name, hash_name in batch_hash_files(videos_dir).items():
+        sc_name = os.path.join(sc_dir, hash_name + '.scenechanges')
+
+        if os.path.exists(sc_name):
+            file_names.append(file_name)
+            jobs.append((sc_name, os.path.join(videos_dir, file_name),
+                         hash_name))
 
-    os.chdir(original_path)
+    results = run_jobs(convert_video_scene_changes, jobs, workers=workers,
+                       threads=True)
 
-    return
+    errors = {}
 
+    for file_name, (result, error) in zip(file_names, results):
+        if error is not None:
+            print(f'Could not convert the scene changes of "{file_name}" '
+                  f'({error!r}).')
+            errors[file_name] = error
+
+    return errors
+
+
+def convert_video_scene_changes(sc_name, video_name, hash_name):
+    """convert_scene_changes() at the frame rate of the video.
+    """
 
+    return convert_scene_changes(sc_name, get_frame_rate(video_name),
+                                 hash_name)
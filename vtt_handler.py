@@ -1,7 +1,9 @@
 
 import re
 import os
+import threading
 import xlsxwriter
+from operator import attrgetter
 
 import srt_handler
 
@@ -11,15 +13,43 @@ from classes import Timecode
 from exceptions import FormatError
 from encoders import encode_VTT
 from srt_handler import renumber
+from jobs import iter_jobs
+
+
+# Sort key of the cues: their start time in seconds.
+CUE_START_KEY = attrgetter('start_time.total_seconds')
 
 
 def save_VTT_subs(file_name, contents):
+    """Writes a WebVTT file atomically: to a temporary file
+    in the same directory first, which then replaces the file,
+    so that the file is never left half-written.
+
+    Parameters
+    ----------
+    file_name : str
+    contents : dict
+        As passed to encode_VTT().
+    """
 
     VTT_lines = encode_VTT(contents)
 
-    with open(file_name, 'w', encoding='utf-8-sig') as new_file:
-        for line in VTT_lines:
-            new_file.write(line)
+    # NOTE: The process and the thread are in the temporary name
+    #       because files of a batch that run in parallel
+    #       can be saved with the same name.
+    temp_name = f'{file_name}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+    try:
+        with open(temp_name, 'w', encoding='utf-8-sig') as new_file:
+            for line in VTT_lines:
+                new_file.write(line)
+
+        os.replace(temp_name, file_name)
+
+    except BaseException:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+        raise
 
     return
 
@@ -30,32 +60,36 @@ def merge_subs(file_name_one, file_name_two, save_dir):
     vtt_one = parse_VTT(file_name_one)['cues']
     vtt_two = parse_VTT(file_name_two)['cues']
 
+    # NOTE: Both files are usually sorted already. The sort finds
+    #       the two sorted runs and merges them in a single pass,
+    #       faster than heapq.merge() (see benchmarks.bench_merge_subs()).
     resulting_vtt = vtt_one + vtt_two
 
     sort_VTT(resulting_vtt)
 
-    save_file_name = file_name_one.split('/')[-1]
-    save_file_name = save_dir + '/' + save_file_name
+    save_file_name = os.path.basename(file_name_one)
+    save_file_name = os.path.join(save_dir, save_file_name)
     VTT_cont = {'stylesheets': [], 'regions': {}, 'cues': resulting_vtt}
 
     save_VTT_subs(save_file_name, VTT_cont)
 
 
 
-def batch_merge_subs(file_dir_one, file_dir_two, save_dir):
+def batch_merge_subs(file_dir_one, file_dir_two, save_dir, progress=None,
+                     cancel=None, workers=1):
     # ONLY FOR FILES AND OSTS
-    original_dir = os.getcwd()
-    
-    os.chdir(file_dir_one)
-    file_list_one = os.listdir()
+    # progress is called as progress(done, total) after every file,
+    # and no more files are merged once cancel (a threading.Event) is set.
+    # With more than one worker, the files are merged in parallel
+    # in worker processes (see jobs.iter_jobs()).
+    # Returns the errors of the files that could not be merged,
+    # keyed by file name.
+    file_list_one = os.listdir(file_dir_one)
     sub_list_one = []
 
-    os.chdir(file_dir_two)
-    file_list_two = os.listdir()
+    file_list_two = os.listdir(file_dir_two)
     sub_list_two = []
 
-    os.chdir(original_dir)
-
     for item in file_list_one:
         name, ext = os.path.splitext(item)
         if ext == '.vtt':
@@ -66,10 +100,26 @@ def batch_merge_subs(file_dir_one, file_dir_two, save_dir):
         if ext == '.vtt':
             sub_list_two.append(item)
 
-    for i, file_name in enumerate(sub_list_one):
-        full_file_one = file_dir_one + '/' + sub_list_one[i]
-        full_file_two = file_dir_two + '/' + sub_list_two[i]
-        merge_subs(full_file_one, full_file_two, save_dir)
+    jobs = [(os.path.join(file_dir_one, sub_list_one[i]),
+             os.path.join(file_dir_two, sub_list_two[i]),
+             save_dir)
+            for i in range(len(sub_list_one))]
+
+    results = iter_jobs(merge_subs, jobs, workers=workers, progress=progress)
+    errors = {}
+
+    try:
+        for i, (result, error) in enumerate(results):
+            if error is not None:
+                errors[jobs[i][0]] = f'Could not merge the file ({error!r}).'
+
+            if cancel is not None and cancel.is_set():
+                break
+
+    finally:
+        results.close()
+
+    return errors
     
 
 
@@ -84,21 +134,6 @@ def sort_VTT(file_name):
     elif type(file_name) == list:
         vtt_subs = file_name
 
-    # Insertion Sort
-    # NOTE: Check this and make sure you understand it
-    #       and that it's the most efficient algorithm.
-    for step in range(1, len(vtt_subs)):
-        key = vtt_subs[step]
-        j = step - 1
-
-        while (j >= 0
-               and key.start_time.total_seconds
-                   < vtt_subs[j].start_time.total_seconds):
-            
-            vtt_subs[j+1] = vtt_subs[j]
-            j = j - 1
-
-        vtt_subs[j + 1] = key
-
-
-    
\ No newline at end of file
+    # NOTE: The sort is stable, so cues that start at the same time
+    #       keep their order, as with the insertion sort used before.
+    vtt_subs.sort(key=CUE_START_KEY)